@@ -8,6 +8,20 @@ import os
 import random
 import time
 import glob
+import gzip
+import hashlib
+import functools
+import uuid
+import threading
+import string
+import linecache
+import builtins
+import ctypes
+import ctypes.util
+import subprocess
+import tempfile
+import shutil
+from collections import deque, namedtuple
 from pathlib import Path
 from typing import Dict
 from io import StringIO
@@ -43,6 +57,18 @@ for package, import_name in required_packages.items():
 
 import openai
 
+# NumPy ships with Blender; helpers fall back to plain Python lists without it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Optional; token counts are approximated without it
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
 # Load API key
 def load_api_key():
     global api_key
@@ -108,6 +134,609 @@ class RateLimiter:
 
 rate_limiter = RateLimiter()
 
+# Hot-path tracing. Each request stage (scene capture, prompt build, network, parse,
+# validate, execute, redraw) is timed as a span; token and retry counts are kept as
+# counters. When disabled, span() hands back a shared no-op context manager.
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.add_event(self.name, self.start, time.perf_counter() - self.start, self.args)
+        return False
+
+class Tracer:
+    # Background work (prefetching) records spans too, so updates and reads go through a lock
+    def __init__(self, max_events=5000):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self.events = deque(maxlen=max_events)
+        self.stages = {}  # name -> [count, total seconds, max seconds]
+        self.counters = {}
+        self.threads = {1: "main"}  # Chrome trace tid -> thread name
+        self.lock = threading.Lock()
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_event(self, name, start, duration, args=None):
+        thread = threading.current_thread()
+        tid = 1 if thread is threading.main_thread() else thread.ident
+        with self.lock:
+            self.threads.setdefault(tid, thread.name)
+            self.events.append((name, start - self.origin, duration, args or {}, tid))
+            stats = self.stages.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+
+    def reset(self):
+        with self.lock:
+            self.origin = time.perf_counter()
+            self.events.clear()
+            self.stages.clear()
+            self.counters.clear()
+
+    def counter_values(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def summary(self):
+        # (stage, calls, average ms, max ms, total ms) sorted by total time spent
+        with self.lock:
+            stages = [(name, *stats) for name, stats in self.stages.items()]
+        rows = [(name, n, total / n * 1000.0, peak * 1000.0, total * 1000.0) for name, n, total, peak in stages]
+        return sorted(rows, key=lambda row: row[4], reverse=True)
+
+    def to_json(self):
+        with self.lock:
+            events = list(self.events)
+        return {
+            "stages": {name: {"calls": n, "avg_ms": avg, "max_ms": peak, "total_ms": total} for name, n, avg, peak, total in self.summary()},
+            "counters": self.counter_values(),
+            "events": [{"name": name, "start": start, "duration": duration, "args": args, "thread": self.threads.get(tid, "")} for name, start, duration, args, tid in events],
+        }
+
+    def to_chrome_trace(self):
+        with self.lock:
+            events, threads = list(self.events), dict(self.threads)
+        events = [{
+            "name": name,
+            "cat": "blendergpt",
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": duration * 1e6,
+            "pid": 1,
+            "tid": tid,
+            "args": args,
+        } for name, start, duration, args, tid in events]
+        events += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}} for tid, name in threads.items()]
+        events += [{"name": name, "ph": "C", "ts": 0, "pid": 1, "args": {name: value}} for name, value in self.counter_values().items()]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+tracer = Tracer()
+
+def traced(stage):
+    # Decorator form of tracer.span for whole functions; costs one attribute check when disabled
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def update_tracing(self, context):
+    tracer.enabled = self.tracing_enabled
+    print(f"Tracing {'enabled' if tracer.enabled else 'disabled'}")
+
+# Model routing. Each request class (chat Q&A, full scene generation, iteration edits,
+# JSON repair) can use its own model; the router switches to the fallback model when
+# the rolling latency or estimated cost of the preferred one exceeds its target, and
+# generate_blender_commands falls back on timeouts.
+REQUEST_CLASSES = ('CHAT', 'SCENE', 'ITERATION', 'REPAIR')
+
+# Approximate USD per 1M (input, output) tokens, matched by model-name prefix
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+
+def model_price(model):
+    for prefix in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model.startswith(prefix):
+            return MODEL_PRICES[prefix]
+    return None
+
+class ModelRouter:
+    def __init__(self, window=20):
+        self.window = window
+        self.latencies = {}  # model -> deque of seconds
+        self.tokens = {}  # request class -> deque of (prompt tokens, completion tokens)
+        self.default_model = "gpt-4o-mini-2024-07-18"
+        self.fallback_model = ""
+        self.enabled = False
+        self.class_models = {}
+        self.latency_targets = {}
+        self.max_cost = 0.0
+        self.probe_interval = 10
+        self.skipped = {}  # model -> consecutive selections routed away from it
+        self.lock = threading.Lock()  # Prefetch threads observe while the main thread selects
+
+    def configure(self, prefs):
+        # Copy the routing preferences so that selection never touches bpy (safe off the main thread)
+        self.default_model = resolve_model(prefs)
+        self.fallback_model = prefs.fallback_model.strip()
+        self.enabled = prefs.use_model_router
+        self.class_models = {cls: getattr(prefs, f"{cls.lower()}_model").strip() for cls in REQUEST_CLASSES}
+        self.latency_targets = {cls: getattr(prefs, f"{cls.lower()}_latency_target") for cls in REQUEST_CLASSES}
+        self.max_cost = prefs.max_cost_per_request
+
+    def observe(self, model, latency, request_class=None, usage=None):
+        with self.lock:
+            self.latencies.setdefault(model, deque(maxlen=self.window)).append(latency)
+            if request_class and usage:
+                self.tokens.setdefault(request_class, deque(maxlen=self.window)).append((usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)))
+
+    def rolling_latency(self, model):
+        with self.lock:
+            samples = list(self.latencies.get(model, ()))
+        if not samples:
+            return None
+        return sorted(samples)[len(samples) // 2]
+
+    def estimate_cost(self, model, request_class):
+        with self.lock:
+            samples = list(self.tokens.get(request_class, ()))
+        price = model_price(model)
+        if not price or not samples:
+            return None
+        prompt_tokens = sum(p for p, _ in samples) / len(samples)
+        completion_tokens = sum(c for _, c in samples) / len(samples)
+        return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1e6
+
+    def select(self, request_class):
+        """Return (model, fallback model) for a request class."""
+        primary = (self.enabled and self.class_models.get(request_class)) or self.default_model
+        fallback = self.fallback_model if self.fallback_model != primary else ""
+        if not self.enabled or not fallback:
+            return primary, fallback
+        # Every few requests, probe the preferred model again so its rolling latency stays fresh
+        with self.lock:
+            probe = self.skipped.get(primary, 0) >= self.probe_interval
+            if probe:
+                self.skipped[primary] = 0
+        if probe:
+            return primary, fallback
+        chosen = self._route(primary, fallback, request_class)
+        with self.lock:
+            self.skipped[primary] = self.skipped.get(primary, 0) + 1 if chosen[0] != primary else 0
+        return chosen
+
+    def _route(self, primary, fallback, request_class):
+        latency, target = self.rolling_latency(primary), self.latency_targets.get(request_class, 0.0)
+        if latency is not None and target > 0 and latency > target:
+            fallback_latency = self.rolling_latency(fallback)
+            if fallback_latency is None or fallback_latency < latency:
+                print(f"Router: {primary} median latency {latency:.1f}s exceeds {target:.1f}s target for {request_class}, using {fallback}")
+                return fallback, primary
+        cost, fallback_cost = self.estimate_cost(primary, request_class), self.estimate_cost(fallback, request_class)
+        if self.max_cost > 0 and cost is not None and cost > self.max_cost and (fallback_cost is None or fallback_cost < cost):
+            print(f"Router: {primary} estimated ${cost:.4f} exceeds ${self.max_cost:.4f} budget for {request_class}, using {fallback}")
+            return fallback, primary
+        return primary, fallback
+
+def resolve_model(prefs):
+    if prefs.gpt_model == "custom":
+        return prefs.custom_gpt_model.strip() or "gpt-4o-mini-2024-07-18"
+    return prefs.gpt_model
+
+model_router = ModelRouter()
+
+def select_model(context, request_class):
+    prefs = context.preferences.addons[__name__].preferences
+    model_router.configure(prefs)
+    configure_backends(prefs)
+    return model_router.select(request_class)[0]
+
+# Token accounting. Requests are measured locally before they are sent: with tiktoken
+# when it's installed and its encodings are available offline, otherwise with a regex
+# approximation that tracks it closely on English and JSON. Over-long requests are trimmed
+# to fit the model's context window, and max_tokens is whatever room is left.
+MODEL_CONTEXT = {
+    "gpt-4o-mini": (128000, 16384),
+    "gpt-4o": (128000, 16384),
+    "gpt-4.1-mini": (1047576, 32768),
+    "gpt-4.1": (1047576, 32768),
+    "gpt-4-turbo": (128000, 4096),
+    "gpt-4": (8192, 8192),
+    "gpt-3.5-turbo": (16385, 4096),
+}  # Model prefix -> (context window, maximum output tokens)
+DEFAULT_CONTEXT = (8192, 4096)  # Unknown and local models
+MIN_OUTPUT_TOKENS = 1024
+MESSAGE_OVERHEAD_TOKENS = 4
+_APPROX_TOKEN_RE = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+def model_context(model):
+    for prefix in sorted(MODEL_CONTEXT, key=len, reverse=True):
+        if model.startswith(prefix):
+            return MODEL_CONTEXT[prefix]
+    return DEFAULT_CONTEXT
+
+@functools.lru_cache(maxsize=8)
+def _tiktoken_encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"tiktoken encoding unavailable, approximating token counts: {e}")  # e.g. offline on first use
+        return None
+
+def count_tokens(text, model=""):
+    encoding = _tiktoken_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # Long words split into several tokens
+    return sum(1 + len(piece) // 8 for piece in _APPROX_TOKEN_RE.findall(text))
+
+def shrink_scene_info(scene_info, max_objects):
+    """Keep only names, types and locations of the first max_objects objects."""
+    objects = scene_info.get("objects", [])
+    shrunk = {key: value for key, value in scene_info.items() if key in ("cameras", "lights")}
+    shrunk["objects"] = [{key: obj[key] for key in ("name", "type", "location") if key in obj} for obj in objects[:max_objects]]
+    if len(objects) > max_objects:
+        shrunk["omitted_objects"] = len(objects) - max_objects
+    return shrunk
+
+def preflight_request(model, system, history, scene_info, request_text):
+    """Fit a request into the model's context window.
+
+    Drops the oldest history first, then reduces the scene. Returns (history, scene_json,
+    max_tokens, breakdown), or raises ValueError if even the bare request doesn't fit."""
+    with tracer.span("preflight"):
+        window, max_output = model_context(model)
+        reserve = min(max_output, MIN_OUTPUT_TOKENS)
+        system_tokens = count_tokens(system, model) + MESSAGE_OVERHEAD_TOKENS
+        history_tokens = [count_tokens(msg["content"], model) + MESSAGE_OVERHEAD_TOKENS for msg in history]
+        scene_json = json.dumps(scene_info, separators=(",", ":"))
+        scene_tokens = count_tokens(scene_json, model)
+        request_tokens = count_tokens(request_text, model) + MESSAGE_OVERHEAD_TOKENS + 3
+        trimmed = []
+        available = window - reserve - system_tokens - request_tokens
+        if available < 0:
+            raise ValueError(f"Request needs ~{window - available - reserve:,} tokens, more than {model}'s {window:,} token window")
+        dropped = 0
+        while history and sum(history_tokens) + scene_tokens > available:
+            history, history_tokens = history[1:], history_tokens[1:]
+            dropped += 1
+        if dropped:
+            trimmed.append(f"{dropped} oldest history message(s)")
+        if scene_tokens > available - sum(history_tokens):
+            room = available - sum(history_tokens)
+            objects = len(scene_info.get("objects", []))
+            shrunk = shrink_scene_info(scene_info, objects)
+            scene_json = json.dumps(shrunk, separators=(",", ":"))
+            scene_tokens = count_tokens(scene_json, model)
+            while scene_tokens > room and objects:
+                # Proportional guess, then re-measure
+                objects = min(objects - 1, int(objects * room / scene_tokens * 0.95))
+                scene_json = json.dumps(shrink_scene_info(scene_info, max(objects, 0)), separators=(",", ":"))
+                scene_tokens = count_tokens(scene_json, model)
+            trimmed.append(f"scene reduced to {max(objects, 0)} object(s)")
+        total = system_tokens + sum(history_tokens) + scene_tokens + request_tokens
+        max_tokens = max(reserve, min(max_output, window - total))
+        breakdown = {"system": system_tokens, "history": sum(history_tokens), "history_messages": len(history), "scene": scene_tokens,
+                     "request": request_tokens, "total": total, "window": window, "max_tokens": max_tokens, "trimmed": trimmed}
+    tracer.count("prompt_tokens_estimated", total)
+    print(f"Tokens for {model}: system {system_tokens:,}, history {sum(history_tokens):,} ({len(history)} msgs), scene {scene_tokens:,}, request {request_tokens:,}; "
+          f"total {total:,}/{window:,}, max_tokens {max_tokens:,}" + (f"; trimmed {', '.join(trimmed)}" if trimmed else ""))
+    return history, scene_json, max_tokens, breakdown
+
+def fit_retry(model, messages, keep):
+    """Fit a retry (the system prompt, history, then `keep` request messages) into a model's window.
+
+    A retry carries the failed response and may go to a model with a smaller window, so it's
+    measured again. Drops the oldest history first; returns (messages, max_tokens), or raises
+    ValueError if the request messages alone don't fit."""
+    with tracer.span("preflight"):
+        window, max_output = model_context(model)
+        reserve = min(max_output, MIN_OUTPUT_TOKENS)
+        messages = list(messages)
+        tokens = [count_tokens(msg["content"], model) + MESSAGE_OVERHEAD_TOKENS for msg in messages]
+        while sum(tokens) + reserve > window and len(messages) > keep + 1:
+            del messages[1], tokens[1]
+        total = sum(tokens)
+        if total + reserve > window:
+            raise ValueError(f"Retry needs ~{total + reserve:,} tokens, more than {model}'s {window:,} token window")
+        max_tokens = max(reserve, min(max_output, window - total))
+    print(f"Tokens for retry on {model}: total {total:,}/{window:,}, max_tokens {max_tokens:,}")
+    return messages, max_tokens
+
+# API traffic cassette: records every chat completion made by generate_blender_commands
+# to a gzip'd JSONL file and replays it offline, so a whole session can be re-run at
+# full speed to profile the local stages without network latency.
+# Requests are keyed by a hash of the model and messages, with the scene snapshot left
+# out: object positions and the like differ slightly between runs of the same session.
+_CASSETTE_SCENE_RE = re.compile(r"(Current scene: ).*?(\n\n)", re.DOTALL)
+
+class APICassette:
+    def __init__(self):
+        self.mode = 'OFF'  # 'OFF', 'RECORD' or 'REPLAY'
+        self.path = ""
+        self.in_order = False  # Replay unmatched requests with the next unplayed entry
+        self.entries = []
+        self.cursor = 0
+        self.used = set()
+
+    def configure(self, mode, path, in_order=False):
+        self.mode = mode
+        self.path = bpy.path.abspath(path) if path else ""
+        self.in_order = in_order
+        self.entries = []
+        self.cursor = 0
+        self.used = set()
+        if mode == 'REPLAY':
+            self.load()
+        print(f"API cassette mode: {mode} ({self.path or 'no file'})")
+
+    @staticmethod
+    def request_key(model, messages, stable=True):
+        if stable:
+            messages = [dict(m, content=_CASSETTE_SCENE_RE.sub(r"\1\2", m.get("content") or "")) for m in messages]
+        payload = json.dumps([model, messages], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+    def load(self):
+        self.entries = []
+        if not self.path or not os.path.exists(self.path):
+            print(f"Cassette file not found: {self.path}")
+            return
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                self.entries = [json.loads(line) for line in f if line.strip()]
+            print(f"Loaded {len(self.entries)} cassette entries from {self.path}")
+        except Exception as e:
+            print(f"Error loading cassette {self.path}: {e}")
+
+    def record(self, key, model, messages, status, latency, content="", usage=None, error=""):
+        if not self.path:
+            return
+        entry = {
+            "key": key,
+            "model": model,
+            "prompt_chars": sum(len(m.get("content") or "") for m in messages),
+            "messages": len(messages),
+            "status": status,
+            "latency": round(latency, 4),
+            "usage": usage or {},
+            "content": content,
+            "error": error,
+            "time": time.time(),
+        }
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with gzip.open(self.path, 'at', encoding='utf-8') as f:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            self.entries.append(entry)
+        except Exception as e:
+            print(f"Error writing cassette entry: {e}")
+
+    def replay(self, keys):
+        """Return the first unplayed entry recorded for one of `keys`, or None.
+
+        Only with in_order set does an unmatched request get the next unplayed entry."""
+        for i, entry in enumerate(self.entries):
+            if i not in self.used and entry.get("key") in keys:
+                self.used.add(i)
+                return entry
+        while self.in_order and self.cursor < len(self.entries):
+            i = self.cursor
+            self.cursor += 1
+            if i not in self.used:
+                self.used.add(i)
+                print(f"Cassette: no match for request {keys[0]}, replaying entry {i} in order")
+                return self.entries[i]
+        return None
+
+api_cassette = APICassette()
+
+def apply_cassette_settings(gpt_props):
+    settings = (gpt_props.cassette_mode, bpy.path.abspath(gpt_props.cassette_path) if gpt_props.cassette_path else "", gpt_props.cassette_in_order)
+    if settings != (api_cassette.mode, api_cassette.path, api_cassette.in_order):
+        api_cassette.configure(gpt_props.cassette_mode, gpt_props.cassette_path, gpt_props.cassette_in_order)
+
+def update_cassette(self, context):
+    apply_cassette_settings(self)
+
+# Settings kept in the scene are applied to the module state when they change, and again
+# on register and after loading a file, where no update callback runs
+@bpy.app.handlers.persistent
+def apply_scene_settings(*args):
+    scene = getattr(bpy.context, "scene", None)
+    if scene is not None:
+        apply_cassette_settings(scene.blendergpt_props)
+        tracer.enabled = scene.blendergpt_props.tracing_enabled
+    return None  # Also used as a one-shot timer
+
+# Completion backends. Model names are routed to a backend: plain names go to the OpenAI
+# API (or an OpenAI-compatible server when a base URL is set), names prefixed with
+# "local:" go to a local llama.cpp/vLLM-style HTTP server. Each backend has its own
+# timeout and concurrency limit.
+class CompletionBackend:
+    name = "backend"
+
+    def __init__(self, url="", timeout=30.0, max_concurrency=4):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+
+    @property
+    def needs_api_key(self):
+        return False
+
+    def complete(self, api_key, model, messages, max_tokens, temperature, timeout):
+        timeout = timeout or self.timeout
+        if not self.slots.acquire(timeout=timeout):
+            raise TimeoutError(f"{self.name} backend busy: {self.max_concurrency} request(s) already in flight")
+        try:
+            return self._complete(api_key, model, messages, max_tokens, temperature, timeout)
+        finally:
+            self.slots.release()
+
+    def _complete(self, api_key, model, messages, max_tokens, temperature, timeout):
+        raise NotImplementedError
+
+class OpenAIBackend(CompletionBackend):
+    name = "openai"
+
+    @property
+    def needs_api_key(self):
+        # OpenAI-compatible servers behind a custom base URL usually don't check the key
+        return not self.url
+
+    def _complete(self, api_key, model, messages, max_tokens, temperature, timeout):
+        client = openai.Client(api_key=api_key or "not-needed", base_url=self.url or None)
+        response = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            timeout=timeout
+        )
+        usage = {}
+        if getattr(response, "usage", None):
+            details = getattr(response.usage, "prompt_tokens_details", None)
+            usage = {
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
+                "total_tokens": response.usage.total_tokens,
+                "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details else 0,
+            }
+        return response.choices[0].message.content or "", usage
+
+class LocalHTTPBackend(CompletionBackend):
+    name = "local"
+
+    def _complete(self, api_key, model, messages, max_tokens, temperature, timeout):
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        # Accept the server's base URL with or without the /v1 that llama.cpp and vLLM docs show
+        base = self.url.rstrip("/")
+        base = base[:-3] if base.endswith("/v1") else base
+        response = requests.post(
+            f"{base}/v1/chat/completions",
+            json={"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature},
+            headers=headers,
+            timeout=timeout
+        )
+        response.raise_for_status()
+        data = response.json()
+        usage = dict(data.get("usage") or {})
+        usage["cached_tokens"] = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+        usage.pop("prompt_tokens_details", None)
+        return data["choices"][0]["message"]["content"] or "", usage
+
+LOCAL_MODEL_PREFIX = "local:"
+backends = {"openai": OpenAIBackend(), "local": LocalHTTPBackend("http://localhost:8080")}
+_backend_settings = None
+
+def configure_backends(prefs):
+    global _backend_settings
+    settings = (
+        prefs.openai_base_url.strip(), prefs.openai_timeout, prefs.openai_max_concurrency,
+        prefs.local_url.strip(), prefs.local_timeout, prefs.local_max_concurrency
+    )
+    # Only rebuild on change, so in-flight requests keep their concurrency slots
+    if settings != _backend_settings:
+        _backend_settings = settings
+        backends["openai"] = OpenAIBackend(settings[0], settings[1], settings[2])
+        backends["local"] = LocalHTTPBackend(settings[3], settings[4], settings[5])
+        print(f"Configured backends: openai={settings[0] or 'api.openai.com'}, local={settings[3]}")
+
+def backend_for(model):
+    """Return (backend, model name as the backend expects it)."""
+    if model.startswith(LOCAL_MODEL_PREFIX):
+        return backends["local"], model[len(LOCAL_MODEL_PREFIX):]
+    return backends["openai"], model
+
+def record_usage(usage):
+    tracer.count("requests")
+    tracer.count("prompt_tokens", usage.get("prompt_tokens", 0))
+    tracer.count("completion_tokens", usage.get("completion_tokens", 0))
+    cached = usage.get("cached_tokens", 0)
+    tracer.count("cached_tokens", cached)
+    if tracer.enabled and usage.get("prompt_tokens"):
+        print(f"Prompt cache: {cached}/{usage['prompt_tokens']} prompt tokens cached")
+
+def request_chat_completion(api_key, model, messages, max_tokens, temperature=0.7, timeout=None):
+    """Send one chat completion request, going through the cassette when enabled.
+
+    Returns a (content, usage) tuple; usage is a plain dict of token counts."""
+    key = APICassette.request_key(model, messages)
+    if api_cassette.mode == 'REPLAY':
+        # Cassettes recorded before the scene was left out of the key still match
+        entry = api_cassette.replay((key, APICassette.request_key(model, messages, stable=False)))
+        if entry is None:
+            raise RuntimeError(f"Cassette has no recorded response for this request ({key}); the session diverged from the recording")
+        if entry["status"] != "success":
+            raise RuntimeError(entry.get("error") or "Recorded request failed")
+        usage = entry.get("usage", {})
+        record_usage(usage)
+        return entry["content"], usage
+
+    backend, backend_model = backend_for(model)
+    start = time.perf_counter()
+    try:
+        content, usage = backend.complete(api_key, backend_model, messages, max_tokens, temperature, timeout)
+    except Exception as e:
+        if api_cassette.mode == 'RECORD':
+            api_cassette.record(key, model, messages, "error", time.perf_counter() - start, error=str(e))
+        raise
+    latency = time.perf_counter() - start
+    if tracer.enabled:
+        tracer.add_event("network", start, latency, {"model": model, "backend": backend.name})
+    record_usage(usage)
+    if api_cassette.mode == 'RECORD':
+        api_cassette.record(key, model, messages, "success", latency, content=content, usage=usage)
+    return content, usage
+
 bl_info = {
     "name": "BlenderGPT",
     "author": "virtualdmns",
@@ -118,6 +747,120 @@ bl_info = {
     "category": "3D View",
 }
 
+# Chat session storage. The full conversation lives in an append-only JSONL file per
+# session; the Scene only keeps the session ID and a small window of recent messages,
+# so long sessions don't bloat the .blend or every undo step.
+class ChatSessionStore:
+    def __init__(self):
+        self.directory = ""
+        self._index = {}  # session_id -> (bytes scanned, [line offsets])
+
+    def get_directory(self):
+        if not self.directory:
+            try:
+                self.directory = bpy.utils.user_resource('DATAFILES', path="blendergpt_sessions", create=True)
+            except Exception:
+                self.directory = os.path.join(os.path.dirname(os.path.realpath(__file__)), "sessions")
+            os.makedirs(self.directory, exist_ok=True)
+        return self.directory
+
+    def path(self, session_id):
+        return os.path.join(self.get_directory(), f"{session_id}.jsonl")
+
+    def _offsets(self, session_id):
+        # Line offsets are indexed incrementally, so only newly appended bytes are scanned
+        path = self.path(session_id)
+        scanned, offsets = self._index.get(session_id, (0, []))
+        if not os.path.exists(path):
+            return []
+        size = os.path.getsize(path)
+        if size < scanned:
+            scanned, offsets = 0, []
+        if size > scanned:
+            with open(path, 'rb') as f:
+                f.seek(scanned)
+                position = scanned
+                for line in f:
+                    if line.endswith(b"\n"):
+                        offsets.append(position)
+                        position += len(line)
+                scanned = position
+            self._index[session_id] = (scanned, offsets)
+        return offsets
+
+    def count(self, session_id):
+        return len(self._offsets(session_id)) if session_id else 0
+
+    def append(self, session_id, role, msg_content, script=""):
+        record = {"role": role, "msg_content": msg_content, "script": script, "time": time.time()}
+        with open(self.path(session_id), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        return self.count(session_id) - 1
+
+    def load_range(self, session_id, start, end):
+        offsets = self._offsets(session_id)
+        start, end = max(0, start), min(end, len(offsets))
+        if start >= end:
+            return []
+        with open(self.path(session_id), 'rb') as f:
+            f.seek(offsets[start])
+            return [json.loads(f.readline()) for _ in range(end - start)]
+
+    def get(self, session_id, index):
+        records = self.load_range(session_id, index, index + 1)
+        return records[0] if records else None
+
+    def search(self, session_id, query, limit=20):
+        # Cheap substring filter on the raw line before decoding any JSON
+        needle = query.lower()
+        results = []
+        if not session_id or not needle or not os.path.exists(self.path(session_id)):
+            return results
+        with open(self.path(session_id), 'r', encoding='utf-8') as f:
+            for index, line in enumerate(f):
+                if needle in line.lower():
+                    record = json.loads(line)
+                    if needle in record["msg_content"].lower() or needle in record["script"].lower():
+                        results.append((index, record))
+        return results[-limit:]
+
+chat_store = ChatSessionStore()
+chat_search_results = []  # (session index, record) pairs shown in the chat panel
+# Messages from before the recent window, loaded from disk for display only: they are
+# never sent as context and the window trim doesn't touch them
+older_chat_messages = {"session_id": "", "messages": []}  # messages: (session index, record) pairs
+
+def loaded_older_messages(gpt_props):
+    if older_chat_messages["session_id"] != gpt_props.session_id:
+        older_chat_messages.update(session_id=gpt_props.session_id, messages=[])
+    return older_chat_messages["messages"]
+
+def ensure_chat_session(gpt_props):
+    if not gpt_props.session_id:
+        gpt_props.session_id = uuid.uuid4().hex[:12]
+        # Migrate messages saved in older .blend files into the new session file
+        for msg in gpt_props.chat_history:
+            chat_store.append(gpt_props.session_id, msg.role, msg.msg_content, msg.script)
+        gpt_props.chat_offset = 0
+        print(f"Started chat session {gpt_props.session_id} ({chat_store.path(gpt_props.session_id)})")
+    return gpt_props.session_id
+
+def append_chat_message(gpt_props, role, msg_content, script=""):
+    session_id = ensure_chat_session(gpt_props)
+    chat_store.append(session_id, role, msg_content, script)
+    msg = gpt_props.chat_history.add()
+    msg.from_json({"role": role, "msg_content": msg_content, "script": script})
+    # Keep only the recent window on the Scene. Once older messages are shown, the ones
+    # leaving the window join them so the chat stays continuous.
+    older = loaded_older_messages(gpt_props)
+    while len(gpt_props.chat_history) > gpt_props.chat_window_size:
+        if older:
+            first = gpt_props.chat_history[0]
+            older.append((gpt_props.chat_offset, {"role": first.role, "msg_content": first.msg_content, "script": first.script}))
+        gpt_props.chat_history.remove(0)
+        gpt_props.chat_offset += 1
+    return msg
+
 # Message class for chat history
 class Message(bpy.types.PropertyGroup):
     role: bpy.props.StringProperty(name="Role", default="USER")
@@ -129,9 +872,27 @@ class Message(bpy.types.PropertyGroup):
         self.msg_content = data.get("msg_content", "")
         self.script = data.get("script", "")
 
+def update_script_param(self, context):
+    if context.scene.blendergpt_props.live_params and not param_session.get("loading"):
+        schedule_param_rerun()
+
+# A numeric literal lifted out of the last script (see extract_script_params)
+class ScriptParam(bpy.types.PropertyGroup):
+    name: bpy.props.StringProperty(name="Name", default="")
+    is_int: bpy.props.BoolProperty(name="Integer", default=False)
+    int_value: bpy.props.IntProperty(name="Value", default=0, update=update_script_param)
+    float_value: bpy.props.FloatProperty(name="Value", default=0.0, precision=3, update=update_script_param)
+    sweep: bpy.props.BoolProperty(name="Sweep", default=False, description="Vary this value in a parameter sweep")
+    sweep_min: bpy.props.FloatProperty(name="From", default=0.0)
+    sweep_max: bpy.props.FloatProperty(name="To", default=1.0)
+
 # Chat properties
 class BlenderGPTChatProps(bpy.types.PropertyGroup):
-    chat_history: bpy.props.CollectionProperty(type=Message)
+    chat_history: bpy.props.CollectionProperty(type=Message)  # Recent window of the session
+    session_id: bpy.props.StringProperty(name="Session ID", default="", description="ID of the on-disk chat session")
+    chat_offset: bpy.props.IntProperty(name="Chat Offset", default=0, min=0, description="Session index of the first message in the recent window")
+    chat_window_size: bpy.props.IntProperty(name="Chat Window", default=20, min=2, max=200, description="Number of recent messages kept in the .blend and sent as context")
+    chat_search: bpy.props.StringProperty(name="Search Chat", default="", description="Search the full chat session")
     chat_input: bpy.props.StringProperty(name="Chat Input", default="")
     iterations: bpy.props.IntProperty(name="Iterations", default=0, min=0, max=10, description="Number of additional iterations for scene generation")
     iteration_progress: bpy.props.FloatProperty(name="Iteration Progress", default=0.0, min=0.0, max=100.0, subtype='PERCENTAGE')
@@ -147,6 +908,63 @@ class BlenderGPTChatProps(bpy.types.PropertyGroup):
     last_script: bpy.props.StringProperty(name="Last Script", default="")
     low_detail_mode: bpy.props.BoolProperty(name="Low Detail Mode", default=False, description="Reduce scene info detail to improve API response time")
     chat_height: bpy.props.IntProperty(name="Chat Height", default=10, min=5, max=20, description="Number of visible rows in the chat history")
+    cassette_mode: bpy.props.EnumProperty(
+        name="Cassette",
+        items=[
+            ('OFF', "Off", "Talk to the API normally"),
+            ('RECORD', "Record", "Record every API request/response to the cassette file"),
+            ('REPLAY', "Replay", "Replay responses from the cassette file without network access")
+        ],
+        default='OFF',
+        description="Record or replay API traffic for offline debugging and profiling",
+        update=update_cassette
+    )
+    recipe_mode: bpy.props.EnumProperty(
+        name="Recipes",
+        items=[
+            ('OFF', "Off", "Always generate scripts from scratch"),
+            ('REFERENCE', "Reference", "Send a matching built-in recipe to the model as a starting point"),
+            ('DIRECT', "Direct", "Run a strongly matching built-in recipe without calling the API")
+        ],
+        default='OFF',
+        description="Use the local library of validated scene recipes"
+    )
+    budget_max_objects: bpy.props.IntProperty(name="Max Objects", default=5000, min=1, description="Largest number of objects a single script may create")
+    budget_max_vertices: bpy.props.IntProperty(name="Max Vertices", default=5000000, min=1, description="Largest number of vertices a single script may create")
+    budget_dry_run: bpy.props.BoolProperty(name="Dry Run Count", default=False, description="Also run the script once against stand-ins for bpy to count the objects it creates, for loops the static estimate can't bound")
+    budget_action: bpy.props.EnumProperty(
+        name="Over Budget",
+        items=[
+            ('ASK', "Ask", "Stop and offer to downscale or run anyway"),
+            ('CLAMP', "Downscale", "Clamp loop counts automatically so the script fits the budget"),
+            ('OFF', "Ignore", "Don't estimate script cost before running")
+        ],
+        default='ASK',
+        description="What to do when a script is predicted to exceed the scene budget"
+    )
+    exec_time_limit: bpy.props.FloatProperty(name="Time Limit", default=30.0, min=0.0, max=3600.0, unit='TIME_ABSOLUTE', description="Abort a running script after this long and roll the scene back (0 disables)")
+    use_prompt_cache: bpy.props.BoolProperty(name="Prompt Cache", default=True, description="Offer the script of a similar earlier prompt that ran successfully, without an API call")
+    cached_prompt: bpy.props.StringProperty(name="Cached Prompt", default="")
+    refine_scripts: bpy.props.BoolProperty(name="Refine with Edits", default=True, description="Send the last chat script along with a message so tweaks come back as small edits to it instead of a whole new script")
+    follow_up: bpy.props.StringProperty(name="Follow-up", default="")
+    script_params: bpy.props.CollectionProperty(type=ScriptParam)
+    param_script: bpy.props.StringProperty(name="Parameterized Script", default="")
+    live_params: bpy.props.BoolProperty(name="Re-run on Change", default=True, description="Re-run the script whenever a parameter value changes")
+    sweep_steps: bpy.props.IntProperty(name="Steps", default=3, min=2, max=6, description="Values per swept parameter")
+    sweep_size: bpy.props.IntProperty(name="Thumbnail Size", default=160, min=64, max=512, subtype='PIXEL')
+    speculative_prefetch: bpy.props.BoolProperty(name="Prefetch Follow-ups", default=False, description="Generate the answer to the suggested follow-up in the background so accepting it is instant")
+    prefetch_budget: bpy.props.FloatProperty(name="Prefetch Budget", default=0.10, min=0.0, precision=2, description="Estimated USD to spend on prefetched answers per session (0 for no limit)")
+    auto_repair: bpy.props.BoolProperty(name="Auto-Repair", default=False, description="When a script fails, send the script and its error back to the model for a small fix and run it again")
+    repair_attempts: bpy.props.IntProperty(name="Repair Attempts", default=2, min=1, max=5, description="Maximum number of automatic repairs per script")
+    last_change_report: bpy.props.StringProperty(name="Last Change Report", default="")
+    share_change_report: bpy.props.BoolProperty(name="Send Change Report", default=False, description="Tell the model what the last executed script changed, as compact context for the next request")
+    rollback_failed_scripts: bpy.props.BoolProperty(name="Roll Back Failed Scripts", default=True, description="Remove what a failing script created and restore the objects it moved")
+    progressive_execution: bpy.props.BoolProperty(name="Progressive Execution", default=False, description="Run scripts in small time slices so the viewport updates while they build and they can be cancelled")
+    exec_progress: bpy.props.FloatProperty(name="Progress", default=0.0, min=0.0, max=100.0, subtype='PERCENTAGE')
+    tracing_enabled: bpy.props.BoolProperty(name="Enable Tracing", default=False, description="Time each request stage and count tokens/retries (near-zero overhead when off)", update=update_tracing)
+    cassette_path: bpy.props.StringProperty(name="Cassette File", default="//blendergpt_cassette.jsonl.gz", subtype='FILE_PATH', update=update_cassette)
+    cassette_in_order: bpy.props.BoolProperty(name="Replay In Order", default=False, update=update_cassette,
+                                              description="Answer a request that wasn't recorded with the next unplayed response instead of failing")
 
 # Helper function for word-wrapping text
 def wrap_text(text, max_chars):
@@ -172,6 +990,39 @@ def wrap_text(text, max_chars):
 
     return lines
 
+def draw_chat_message(layout, msg, chars_per_line, message_index=-1, session_index=-1):
+    """Draw one chat message; message_index for the recent window, session_index for older ones."""
+    msg_box = layout.box()
+    row = msg_box.row(align=True)
+    # Role label
+    col = row.column(align=True)
+    col.scale_x = 0.3  # Reduce width of the role label
+    display_role = "Assistant" if msg["role"] != "USER" else "USER"
+    col.label(text=f"{display_role}:", icon='USER' if msg["role"] == 'USER' else 'TEXT')
+    # Message content (clickable to show full message)
+    col = row.column(align=True)
+    col.scale_x = 1.0  # Ensure the message content takes up the remaining space
+    wrapped_lines = wrap_text(msg["msg_content"], chars_per_line)
+    for i, line in enumerate(wrapped_lines):
+        # Make all lines clickable to show the full message
+        op = col.operator("blendergpt.show_full_message", text=line, emboss=False)
+        op.message_index = message_index
+        op.session_index = session_index
+    # If the message has a script, display it and add an Execute Script button
+    if msg["script"]:
+        col = msg_box.column(align=True)
+        col.label(text="Generated Script:", icon='TEXT')
+        script_lines = msg["script"].split('\n')
+        wrapped_script_lines = []
+        for line in script_lines:
+            wrapped_script_lines.extend(wrap_text(line, chars_per_line))
+        for line in wrapped_script_lines:
+            col.label(text=line)
+        row = msg_box.row(align=True)
+        op = row.operator("blendergpt.execute_chat_script", text="Execute Script", icon='PLAY')
+        op.message_index = message_index
+        op.session_index = session_index
+
 # Operator to show the full chat message in a popup with a copy button
 class BLENDERGPT_OT_ShowFullMessage(bpy.types.Operator):
     bl_idname = "blendergpt.show_full_message"
@@ -179,6 +1030,7 @@ class BLENDERGPT_OT_ShowFullMessage(bpy.types.Operator):
     bl_description = "Show the full chat message in a popup"
 
     message_index: bpy.props.IntProperty(name="Message Index", default=-1)
+    session_index: bpy.props.IntProperty(name="Session Index", default=-1, description="Index in the on-disk session, for messages outside the recent window")
 
     def invoke(self, context, event):
         return context.window_manager.invoke_props_dialog(self, width=500)
@@ -186,19 +1038,26 @@ class BLENDERGPT_OT_ShowFullMessage(bpy.types.Operator):
     def draw(self, context):
         layout = self.layout
         gpt_props = context.scene.blendergpt_props
-        if 0 <= self.message_index < len(gpt_props.chat_history):
+        msg = None
+        if self.session_index >= 0:
+            msg = chat_store.get(gpt_props.session_id, self.session_index)
+        elif 0 <= self.message_index < len(gpt_props.chat_history):
             msg = gpt_props.chat_history[self.message_index]
-            role = "Assistant" if msg.role != "USER" else "USER"
-            layout.label(text=f"{role}:", icon='USER' if msg.role == 'USER' else 'TEXT')
+            msg = {"role": msg.role, "msg_content": msg.msg_content}
+        if msg:
+            role = "Assistant" if msg["role"] != "USER" else "USER"
+            layout.label(text=f"{role}:", icon='USER' if msg["role"] == 'USER' else 'TEXT')
             col = layout.column(align=True)
             # Wrap the text for display in the popup
             panel_width = 500  # Approximate width of the popup
             chars_per_line = max(30, int(panel_width / 7))
-            wrapped_lines = wrap_text(msg.msg_content, chars_per_line)
+            wrapped_lines = wrap_text(msg["msg_content"], chars_per_line)
             for line in wrapped_lines:
                 col.label(text=line)
             # Add a Copy button
-            layout.operator("blendergpt.copy_message", text="Copy Message", icon='COPYDOWN').message_index = self.message_index
+            op = layout.operator("blendergpt.copy_message", text="Copy Message", icon='COPYDOWN')
+            op.message_index = self.message_index
+            op.session_index = self.session_index
 
     def execute(self, context):
         return {'FINISHED'}
@@ -210,13 +1069,14 @@ class BLENDERGPT_OT_CopyMessage(bpy.types.Operator):
     bl_description = "Copy the selected chat message to the clipboard"
 
     message_index: bpy.props.IntProperty(name="Message Index", default=-1)
+    session_index: bpy.props.IntProperty(name="Session Index", default=-1)
 
     def execute(self, context):
         gpt_props = context.scene.blendergpt_props
-        if 0 <= self.message_index < len(gpt_props.chat_history):
-            msg = gpt_props.chat_history[self.message_index]
+        record = chat_store.get(gpt_props.session_id, self.session_index) if self.session_index >= 0 else None
+        if record or 0 <= self.message_index < len(gpt_props.chat_history):
             # Copy only the message content, without the role prefix
-            message_text = msg.msg_content
+            message_text = record["msg_content"] if record else gpt_props.chat_history[self.message_index].msg_content
             context.window_manager.clipboard = message_text
             gpt_props.status_message = "Message copied to clipboard."
             self.report({'INFO'}, "Message copied")
@@ -231,19 +1091,23 @@ class BLENDERGPT_OT_ExecuteChatScript(bpy.types.Operator):
     bl_description = "Execute the script from the selected chat message"
 
     message_index: bpy.props.IntProperty(name="Message Index", default=-1)
+    session_index: bpy.props.IntProperty(name="Session Index", default=-1, description="Index in the on-disk session, for messages outside the recent window")
 
     def execute(self, context):
         gpt_props = context.scene.blendergpt_props
-        if 0 <= self.message_index < len(gpt_props.chat_history):
-            msg = gpt_props.chat_history[self.message_index]
-            if msg.script:
+        record = chat_store.get(gpt_props.session_id, self.session_index) if self.session_index >= 0 else None
+        if record or 0 <= self.message_index < len(gpt_props.chat_history):
+            script = record["script"] if record else gpt_props.chat_history[self.message_index].script
+            if script:
                 gpt_props.status_message = "Executing script from chat..."
                 context.area.tag_redraw()
-                exec_result = execute_blender_code(msg.script)
+                exec_result = execute_with_repair(script, get_budget(gpt_props), gpt_props)
                 context.scene.blender_gpt_execution_result = exec_result["message"]
-                gpt_props.status_message = "Script executed successfully." if exec_result["status"] == "success" else f"Error: {exec_result['message']}"
-                gpt_props.last_script = msg.script
-                self.report({'INFO' if exec_result["status"] == "success" else 'ERROR'}, gpt_props.status_message)
+                gpt_props.status_message = describe_exec_result(exec_result)
+                gpt_props.last_script = exec_result.get("script", script)
+                if exec_result["status"] == "success" and not record and self.message_index == len(gpt_props.chat_history) - 1:
+                    start_follow_up_prefetch(context)
+                self.report({'ERROR' if exec_result["status"] == "error" else 'INFO'}, gpt_props.status_message)
                 context.area.tag_redraw()
             else:
                 self.report({'WARNING'}, "No script available in this message.")
@@ -259,6 +1123,7 @@ class BLENDER_GPT_PT_Panel(bpy.types.Panel):
     bl_region_type = 'UI'
     bl_category = 'BlenderGPT'
 
+    @traced("redraw")
     def draw(self, context):
         layout = self.layout
         scene = context.scene
@@ -308,6 +1173,9 @@ class BLENDER_GPT_PT_Panel(bpy.types.Panel):
                 current_run = gpt_props.current_iteration + 1
                 box.label(text=f"Run {current_run}/{total_runs}")
                 box.prop(gpt_props, "iteration_progress", text="", slider=True)
+            if gpt_props.cached_prompt:
+                box.label(text=f"Cached from: {gpt_props.cached_prompt}", icon='TIME')
+                box.operator("blender_gpt.generate_code", text="Regenerate", icon='FILE_REFRESH').use_cache = False
             row = box.row()
             row.operator("blender_gpt.generate_code", text="Generate", icon='PLAY')
             row.operator("blender_gpt.execute_code", text="Execute", icon='CHECKMARK')
@@ -333,9 +1201,51 @@ class BLENDER_GPT_PT_Panel(bpy.types.Panel):
             else:
                 box.label(text="No commands generated yet")
 
+        # Parameters of the last script
+        if gpt_props.last_script or gpt_props.script_params:
+            box = layout.box()
+            row = box.row()
+            row.label(text="Parameters:", icon='PREFERENCES')
+            row.operator("blendergpt.extract_params", text="Extract", icon='DRIVER')
+            for param in gpt_props.script_params:
+                row = box.row(align=True)
+                row.prop(param, "int_value" if param.is_int else "float_value", text=param.name)
+                row.prop(param, "sweep", text="", icon='IMGDISPLAY')
+                if param.sweep:
+                    row.prop(param, "sweep_min", text="")
+                    row.prop(param, "sweep_max", text="")
+            if gpt_props.script_params:
+                row = box.row(align=True)
+                row.prop(gpt_props, "live_params", text="Re-run on Change")
+                row.operator("blendergpt.run_params", text="Re-run", icon='FILE_REFRESH')
+                row = box.row(align=True)
+                row.prop(gpt_props, "sweep_steps")
+                row.prop(gpt_props, "sweep_size", text="Size")
+                if param_sweep.running:
+                    row.label(text=f"{len(param_sweep.results)}/{param_sweep.total}")
+                    row.operator("blendergpt.cancel_param_sweep", text="", icon='CANCEL')
+                else:
+                    row.operator("blendergpt.run_param_sweep", text="Sweep", icon='RENDER_STILL')
+                if param_sweep.results:
+                    columns = gpt_props.sweep_steps if len(param_sweep.axes) > 1 else min(3, len(param_sweep.results))
+                    grid = box.grid_flow(row_major=True, columns=columns, even_columns=True, align=True)
+                    for index, entry in enumerate(param_sweep.results):
+                        col = grid.column(align=True)
+                        icon = param_sweep.icon(index)
+                        if icon:
+                            col.template_icon(icon_value=icon, scale=4.0)
+                        else:
+                            col.label(text=entry["error"][:40] or "Rendering...", icon='ERROR' if entry["error"] else 'TIME')
+                        label = ", ".join(f"{entry['values'][name]:g}" for name in param_sweep.axes)
+                        col.operator("blendergpt.apply_sweep_result", text=label).index = index
+
         # Result Section
         box = layout.box()
         box.label(text="Result:", icon='INFO')
+        if active_progressive_run:
+            row = box.row(align=True)
+            row.prop(gpt_props, "exec_progress", text="Running", slider=True)
+            row.operator("blendergpt.cancel_execution", text="", icon='CANCEL')
         if scene.blender_gpt_execution_result:
             col = box.column(align=True)
             col.scale_y = 0.8
@@ -346,6 +1256,10 @@ class BLENDER_GPT_PT_Panel(bpy.types.Panel):
             box.operator("blendergpt.copy_results", text="Copy Results", icon='COPYDOWN')
         else:
             box.label(text="No results yet")
+        if pending_budget_script["script"]:
+            row = box.row(align=True)
+            row.operator("blendergpt.run_pending_script", text="Downscale & Run", icon='MOD_DECIM').downscale = True
+            row.operator("blendergpt.run_pending_script", text="Run Anyway", icon='ERROR').downscale = False
 
         # Chat Section
         row = layout.row()
@@ -356,37 +1270,22 @@ class BLENDER_GPT_PT_Panel(bpy.types.Panel):
             # Scrollable chat history
             scroll_box = box.box()
             scroll_box.scale_y = 0.8
+            older = loaded_older_messages(gpt_props)
+            first_shown = older[0][0] if older else gpt_props.chat_offset
+            if first_shown > 0:
+                scroll_box.operator("blendergpt.load_older_messages", text=f"Load Older ({first_shown} more)", icon='TRIA_UP')
+            panel_width = context.region.width if context.region else 300
+            effective_width = max(100, panel_width - 60)
+            chars_per_line = max(30, int(effective_width / 7))
+            for index, record in older:
+                draw_chat_message(scroll_box, record, chars_per_line, session_index=index)
             for idx, msg in enumerate(gpt_props.chat_history):
-                msg_box = scroll_box.box()
-                row = msg_box.row(align=True)
-                # Role label
-                col = row.column(align=True)
-                col.scale_x = 0.3  # Reduce width of the role label
-                display_role = "Assistant" if msg.role != "USER" else "USER"
-                col.label(text=f"{display_role}:", icon='USER' if msg.role == 'USER' else 'TEXT')
-                # Message content (clickable to show full message)
-                col = row.column(align=True)
-                col.scale_x = 1.0  # Ensure the message content takes up the remaining space
-                panel_width = context.region.width if context.region else 300
-                effective_width = max(100, panel_width - 60)
-                chars_per_line = max(30, int(effective_width / 7))
-                wrapped_lines = wrap_text(msg.msg_content, chars_per_line)
-                for i, line in enumerate(wrapped_lines):
-                    # Make all lines clickable to show the full message
-                    op = col.operator("blendergpt.show_full_message", text=line, emboss=False)
-                    op.message_index = idx
-                # If the message has a script, display it and add an Execute Script button
-                if msg.script:
-                    col = msg_box.column(align=True)
-                    col.label(text="Generated Script:", icon='TEXT')
-                    script_lines = msg.script.split('\n')
-                    wrapped_script_lines = []
-                    for line in script_lines:
-                        wrapped_script_lines.extend(wrap_text(line, chars_per_line))
-                    for line in wrapped_script_lines:
-                        col.label(text=line)
-                    row = msg_box.row(align=True)
-                    row.operator("blendergpt.execute_chat_script", text="Execute Script", icon='PLAY').message_index = idx
+                draw_chat_message(scroll_box, {"role": msg.role, "msg_content": msg.msg_content, "script": msg.script}, chars_per_line, message_index=idx)
+            if gpt_props.follow_up:
+                row = box.row(align=True)
+                row.label(text=gpt_props.follow_up, icon='QUESTION')
+                state = prefetcher.state(follow_up_prompt(gpt_props.follow_up))
+                row.operator("blendergpt.accept_follow_up", text="Accept (ready)" if state == "ready" else "Accept", icon='CHECKMARK')
             # Chat input and buttons
             box.prop(gpt_props, "chat_input", text="Message")
             row = box.row(align=True)
@@ -394,6 +1293,17 @@ class BLENDER_GPT_PT_Panel(bpy.types.Panel):
             row.operator("blendergpt.clear_history", text="Clear", icon='TRASH')
             row = box.row(align=True)
             row.operator("blendergpt.copy_chat", text="Copy Chat", icon='COPYDOWN')
+            # Search the full on-disk session
+            row = box.row(align=True)
+            row.prop(gpt_props, "chat_search", text="", icon='VIEWZOOM')
+            row.operator("blendergpt.search_chat", text="Search")
+            if chat_search_results:
+                results_box = box.box()
+                results_box.label(text=f"{len(chat_search_results)} matching message(s):")
+                for index, record in chat_search_results:
+                    display_role = "Assistant" if record["role"] != "USER" else "USER"
+                    preview = record["msg_content"][:60].replace("\n", " ")
+                    results_box.operator("blendergpt.show_full_message", text=f"#{index} {display_role}: {preview}", emboss=False).session_index = index
 
         # Settings Section
         row = layout.row()
@@ -403,6 +1313,129 @@ class BLENDER_GPT_PT_Panel(bpy.types.Panel):
             box.label(text="Settings:", icon='SETTINGS')
             box.prop(gpt_props, "low_detail_mode", text="Low Detail Mode")
             box.prop(gpt_props, "chat_height", text="Chat Height")
+            box.prop(gpt_props, "chat_window_size", text="Chat Window")
+            box.prop(gpt_props, "recipe_mode", text="Recipes")
+            row = box.row(align=True)
+            row.prop(gpt_props, "use_prompt_cache", text="Prompt Cache")
+            row.operator("blendergpt.clear_prompt_cache", text="", icon='TRASH')
+            box.label(text="Scene Budget:", icon='MEMORY')
+            row = box.row(align=True)
+            row.prop(gpt_props, "budget_max_objects", text="Objects")
+            row.prop(gpt_props, "budget_max_vertices", text="Vertices")
+            box.prop(gpt_props, "budget_action", text="Over Budget")
+            box.prop(gpt_props, "budget_dry_run", text="Dry Run Count")
+            box.prop(gpt_props, "exec_time_limit", text="Time Limit")
+            box.prop(gpt_props, "progressive_execution", text="Progressive Execution")
+            box.prop(gpt_props, "rollback_failed_scripts", text="Roll Back Failed Scripts")
+            box.prop(gpt_props, "share_change_report", text="Send Change Report")
+            box.prop(gpt_props, "refine_scripts", text="Refine with Edits")
+            row = box.row(align=True)
+            row.prop(gpt_props, "speculative_prefetch", text="Prefetch Follow-ups")
+            sub = row.row(align=True)
+            sub.enabled = gpt_props.speculative_prefetch
+            sub.prop(gpt_props, "prefetch_budget", text="$")
+            row = box.row(align=True)
+            row.prop(gpt_props, "auto_repair", text="Auto-Repair")
+            sub = row.row(align=True)
+            sub.enabled = gpt_props.auto_repair
+            sub.prop(gpt_props, "repair_attempts", text="Attempts")
+            row = box.row(align=True)
+            row.prop(gpt_props, "cassette_mode", text="Cassette")
+            if gpt_props.cassette_mode != 'OFF':
+                box.prop(gpt_props, "cassette_path", text="")
+                if gpt_props.cassette_mode == 'REPLAY':
+                    box.prop(gpt_props, "cassette_in_order")
+                box.label(text=f"{len(api_cassette.entries)} entries, {len(api_cassette.used)} replayed", icon='FILE')
+
+# Metrics Subpanel
+class BLENDER_GPT_PT_Metrics(bpy.types.Panel):
+    bl_label = "Metrics"
+    bl_idname = "VIEW3D_PT_blender_gpt_metrics"
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = 'BlenderGPT'
+    bl_parent_id = "VIEW3D_PT_blender_gpt"
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        layout = self.layout
+        gpt_props = context.scene.blendergpt_props
+        layout.prop(gpt_props, "tracing_enabled")
+        rows = tracer.summary()
+        counters = tracer.counter_values()
+        if not rows and not counters:
+            layout.label(text="No metrics recorded yet" if tracer.enabled else "Enable tracing to collect metrics", icon='INFO')
+        if rows:
+            box = layout.box()
+            header = box.row()
+            for title in ("Stage", "Calls", "Avg ms", "Max ms"):
+                header.label(text=title)
+            for name, calls, avg_ms, max_ms, _total_ms in rows:
+                row = box.row()
+                row.label(text=name)
+                row.label(text=str(calls))
+                row.label(text=f"{avg_ms:.1f}")
+                row.label(text=f"{max_ms:.1f}")
+        if counters.get("repairs"):
+            repairs, succeeded = counters["repairs"], counters.get("repairs_succeeded", 0)
+            layout.label(text=f"Repair success: {succeeded}/{repairs} ({succeeded / repairs:.0%}), ~{counters.get('repair_tokens_saved', 0):,} tokens saved", icon='TOOL_SETTINGS')
+        if counters.get("refinements"):
+            layout.label(text=f"Refined by edits: {counters['refinements']}, ~{counters.get('refine_tokens_saved', 0):,} output tokens saved", icon='GREASEPENCIL')
+        if counters:
+            box = layout.box()
+            for name, value in sorted(counters.items()):
+                row = box.row()
+                row.label(text=name)
+                row.label(text=str(value))
+        row = layout.row(align=True)
+        row.operator("blendergpt.export_metrics", text="Export JSON", icon='EXPORT').format = 'JSON'
+        row.operator("blendergpt.export_metrics", text="Chrome Trace", icon='EXPORT').format = 'CHROME'
+        layout.operator("blendergpt.reset_metrics", text="Reset", icon='TRASH')
+
+class BLENDERGPT_OT_ExportMetrics(bpy.types.Operator):
+    bl_idname = "blendergpt.export_metrics"
+    bl_label = "Export Metrics"
+    bl_description = "Export recorded metrics as JSON or as a Chrome trace (chrome://tracing, Perfetto)"
+
+    filepath: bpy.props.StringProperty(subtype='FILE_PATH')
+    filter_glob: bpy.props.StringProperty(default="*.json", options={'HIDDEN'})
+    format: bpy.props.EnumProperty(
+        name="Format",
+        items=[
+            ('JSON', "JSON", "Stage summary, counters and raw events"),
+            ('CHROME', "Chrome Trace", "Trace Event Format for chrome://tracing or Perfetto")
+        ],
+        default='JSON'
+    )
+
+    def invoke(self, context, event):
+        if not self.filepath:
+            self.filepath = "blendergpt_trace.json" if self.format == 'CHROME' else "blendergpt_metrics.json"
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        data = tracer.to_chrome_trace() if self.format == 'CHROME' else tracer.to_json()
+        try:
+            with open(bpy.path.abspath(self.filepath), 'w') as f:
+                json.dump(data, f, indent=1)
+            context.scene.blendergpt_props.status_message = f"Metrics exported to {self.filepath}"
+            self.report({'INFO'}, "Metrics exported")
+        except Exception as e:
+            self.report({'ERROR'}, f"Error exporting metrics: {str(e)}")
+            return {'CANCELLED'}
+        return {'FINISHED'}
+
+class BLENDERGPT_OT_ResetMetrics(bpy.types.Operator):
+    bl_idname = "blendergpt.reset_metrics"
+    bl_label = "Reset Metrics"
+    bl_description = "Clear all recorded timings and counters"
+
+    def execute(self, context):
+        tracer.reset()
+        context.scene.blendergpt_props.status_message = "Metrics reset."
+        context.area.tag_redraw()
+        return {'FINISHED'}
 
 # Modal Operator for Iterative Generation
 class BLENDERGPT_OT_IterativeGeneration(bpy.types.Operator):
@@ -436,7 +1469,8 @@ class BLENDERGPT_OT_IterativeGeneration(bpy.types.Operator):
                 new_prompt = (
                     f"Based on the initial request: {self.initial_prompt}\n"
                     f"Current scene: {scene_description}\n"
-                    "Suggest and add a new element that complements the existing scene, properly spaced in the 3D environment to avoid clutter."
+                    "Suggest and add a new element that complements the existing scene, properly spaced in the 3D environment to avoid clutter. "
+                    "Place it with space.find_free_spot() (or space.free_points() for several) instead of guessing coordinates."
                 )
                 print(f"Generated Prompt: {new_prompt}")
 
@@ -445,14 +1479,22 @@ class BLENDERGPT_OT_IterativeGeneration(bpy.types.Operator):
                 context.area.tag_redraw()
 
                 # Pass force_script=True to ensure a script is generated for iterative enhancements
-                result = generate_blender_commands(new_prompt, self.api_key, self.model, scene_info, gpt_props.chat_history, force_script=True)
+                # Re-select every iteration so the router can react to measured latencies
+                model = model_router.select('ITERATION')[0] if model_router.enabled else self.model
+                result = generate_blender_commands(new_prompt, self.api_key, model, scene_info, gpt_props.chat_history, force_script=True, request_class='ITERATION', change_report=change_report_context(gpt_props))
                 if result["script"]:
-                    exec_result = execute_blender_code(result["script"])
+                    # Nobody is there to answer a prompt mid-iteration, so downscale automatically
+                    budget = get_budget(gpt_props)
+                    if budget["action"] == 'ASK':
+                        budget["action"] = 'CLAMP'
+                    budget["progressive"] = False  # The next iteration needs the finished scene
+                    budget["rollback"] = True  # Don't build the next iteration on a half-finished one
+                    exec_result = execute_with_repair(result["script"], budget, gpt_props)
                     if exec_result["status"] == "success":
                         print(f"Action Taken: {result['description']}")
                         print(f"Script Executed:\n{result['script']}")
                         gpt_props.status_message = f"Iteration {self.current_iteration + 1}/{self.iterations}: {result['description']}"
-                        gpt_props.last_script = result["script"]
+                        gpt_props.last_script = exec_result.get("script", result["script"])
                     else:
                         print(f"Error: {exec_result['message']}")
                         gpt_props.status_message = f"Iteration {self.current_iteration + 1}/{self.iterations} failed: {exec_result['message']}"
@@ -486,7 +1528,9 @@ class BLENDERGPT_OT_IterativeGeneration(bpy.types.Operator):
         gpt_props.current_iteration = 0
         gpt_props.iteration_progress = 0.0
         wm = context.window_manager
-        self._timer = wm.event_timer_add(1.0, window=context.window)
+        # Replayed sessions skip the visual-feedback pause so they run at full speed
+        interval = 0.01 if api_cassette.mode == 'REPLAY' else 1.0
+        self._timer = wm.event_timer_add(interval, window=context.window)
         wm.modal_handler_add(self)
         return {'RUNNING_MODAL'}
 
@@ -501,9 +1545,15 @@ class BLENDERGPT_OT_IterativeGeneration(bpy.types.Operator):
         context.area.tag_redraw()
 
 # Scene Inspection
+@traced("scene_capture")
 def get_scene_info(low_detail=False):
     scene_info = {"objects": [], "materials": [], "cameras": [], "lights": []}
+    space.clear()  # Rebuilt in the same pass over the objects
     for obj in bpy.context.scene.objects:
+        if obj.type in OBSTACLE_TYPES:
+            x, y, radius, flat = object_footprint(obj)
+            if not flat:
+                space.insert(x, y, radius, obj.name)
         obj_info = {
             "name": obj.name,
             "type": obj.type,
@@ -520,134 +1570,2810 @@ def get_scene_info(low_detail=False):
             scene_info["cameras"].append({"name": obj.name, "lens": obj.data.lens})
         elif obj.type == 'LIGHT':
             scene_info["lights"].append({"name": obj.name, "type": obj.data.type, "energy": obj.data.energy})
+    space.stale = False
     if not low_detail:
-        for mat in bpy.data.materials:
-            mat_info = {"name": mat.name, "users": mat.users}
-            if mat.use_nodes and (principled := next((n for n in mat.node_tree.nodes if n.type == 'BSDF_PRINCIPLED'), None)):
-                mat_info.update({
-                    "base_color": list(principled.inputs["Base Color"].default_value),
-                    "metallic": principled.inputs["Metallic"].default_value,
-                    "roughness": principled.inputs["Roughness"].default_value
-                })
-            scene_info["materials"].append(mat_info)
+        scene_info["materials"] = material_cache.scene_materials()
     return scene_info
 
+# Static system prompt. Everything in here must be byte-identical between requests so that
+# provider-side prompt caching can reuse it; anything volatile (scene, history) goes after it.
+PROMPT_INSTRUCTIONS = (
+    "You are a Blender Python API expert. Your task is to assist the user by generating safe, efficient Python scripts using bpy, or by providing helpful responses based on their prompts.\n"
+    "When generating scripts:\n"
+    "- Use randomization for realism (e.g., positions, scales).\n"
+    "- Avoid dangerous commands like os.system, eval, exec, sys, subprocess, shutil, or file operations like open().\n"
+    "- Do not use sys for any purpose, including sys.stdout or sys.path.\n"
+    "- Focus on using bpy, random, and math modules only to create and manipulate Blender objects, materials, and scenes.\n"
+    "- When creating new objects, always use bpy.ops to create the object and its data, or specify the object_data parameter in bpy.data.objects.new(). For example:\n"
+    "  # Example: Create a cylinder\n"
+    "  bpy.ops.mesh.primitive_cylinder_add(radius=0.5, depth=5, location=(0, 0, 2.5))\n"
+    "  cylinder_obj = bpy.context.object\n"
+    "  cylinder_obj.name = 'TreeTrunk'\n"
+    "  # Or, if using bpy.data.objects.new():\n"
+    "  mesh_data = bpy.data.meshes.new('TreeTrunkMesh')\n"
+    "  cylinder_obj = bpy.data.objects.new(name='TreeTrunk', object_data=mesh_data)\n"
+    "  bpy.context.collection.objects.link(cylinder_obj)\n"
+)
+
+PROMPT_MODE_SCRIPT = (
+    "In this mode, you MUST generate a script for every prompt, even if the user asks a question or provides a vague request. Interpret the prompt as a request to create or modify the scene and generate a corresponding script. For example:\n"
+    "- If the user asks 'How do I create a forest?', generate a script to create a forest.\n"
+    "- If the user says 'What is the scene like?', generate a script to add a new element to the scene based on its current state.\n"
+    "Always include the script in the 'script' field of the JSON response.\n"
+)
+
+PROMPT_MODE_CHAT = (
+    "If the user asks a question about the scene or Blender, provide a detailed and helpful response without generating a script unless explicitly requested.\n"
+    "If the user explicitly requests a script (e.g., by saying 'write a script', 'generate a script', 'I need the script', or similar phrases), you MUST generate a script and include it in the 'script' field of the JSON response. Do not just describe the script—provide the actual Python code.\n"
+)
+
+PROMPT_REPAIR = (
+    "The user's script failed. Fix it with the smallest possible change.\n"
+    "Each user message contains the relevant part of the scene as JSON, the script and the error.\n"
+    "Return in JSON: {\"edits\": [{\"find\": \"<exact lines from the script>\", \"replace\": \"<corrected lines>\"}], \"description\": \"<what was wrong>\"}\n"
+    "Each \"find\" must match exactly one place in the script; copy whole lines. Prefer a few small edits over rewriting. "
+    "Only if the script has to be restructured entirely, return {\"script\": \"<full corrected script>\", \"description\": \"<what was wrong>\"} instead.\n"
+    "No markdown wrappers."
+)
+
+PROMPT_REFINE = (
+    "Each user message starts with the current scene as JSON, followed by the previous script and the request.\n"
+    "If the request tweaks what the previous script builds (e.g. 'make the trees taller', 'use 50 rocks'), do not rewrite it. Return in JSON: "
+    "{\"edits\": [{\"find\": \"<exact lines from the previous script>\", \"replace\": \"<new lines>\"}], \"description\": \"<desc>\", \"follow_up\": \"<question>\"}\n"
+    "Each \"find\" must match exactly one place in the previous script; copy whole lines. The edited script replaces the previous one.\n"
+    "For anything else return {\"script\": \"<script>\", \"description\": \"<desc>\", \"follow_up\": \"<question>\"}, with \"script\" empty if no script is needed.\n"
+    "No markdown wrappers."
+)
+
+PROMPT_RESPONSE_FORMAT = (
+    "Each user message starts with the current scene as JSON, followed by the request.\n"
+    "Return in JSON: {\"script\": \"<script>\", \"description\": \"<desc>\", \"follow_up\": \"<question>\"}\n"
+    "If no script is generated (e.g., for a question in chat mode), set \"script\" to an empty string.\n"
+    "No markdown wrappers."
+)
+
+# API reference sections for helpers injected into the script namespace, in registration order
+prompt_reference_sections = []
+_static_prompt_cache = {}
+
+def register_prompt_section(text):
+    prompt_reference_sections.append(text)
+    _static_prompt_cache.clear()
+
+def get_static_prompt(force_script, repair=False, refine=False):
+    mode = 'repair' if repair else 'refine' if refine else 'script' if force_script else 'chat'
+    prefix = _static_prompt_cache.get(mode)
+    if prefix is None:
+        prefix = PROMPT_INSTRUCTIONS + "".join(prompt_reference_sections) + {
+            'repair': PROMPT_REPAIR,
+            'refine': PROMPT_MODE_CHAT + PROMPT_REFINE,
+            'script': PROMPT_MODE_SCRIPT + PROMPT_RESPONSE_FORMAT,
+            'chat': PROMPT_MODE_CHAT + PROMPT_RESPONSE_FORMAT,
+        }[mode]
+        _static_prompt_cache[mode] = prefix
+        tracer.count("prefix_builds")
+        print(f"Built static prompt prefix ({mode} mode, {len(prefix)} chars, sha1 {hashlib.sha1(prefix.encode('utf-8')).hexdigest()[:10]})")
+    return prefix
+
+# Offline TF-IDF index used to match prompts against local text (recipes, cached prompts).
+# analyzer='word' indexes lower-cased words; analyzer='char' indexes character n-grams,
+# which is more forgiving of rephrasing and typos.
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = frozenset("a an and the of to in on with for me please can you i want some add create make build generate scene set up".split())
+
+def tokenize(text, analyzer='word', ngram=3, stop_words=_STOP_WORDS):
+    words = [w for w in _WORD_RE.findall(text.lower()) if w not in stop_words]
+    if analyzer == 'word':
+        # Crude plural folding so "trees" matches "tree"
+        return [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words]
+    joined = f" {' '.join(words)} "
+    return [joined[i:i + ngram] for i in range(len(joined) - ngram + 1)]
+
+class TfidfIndex:
+    def __init__(self, analyzer='word'):
+        self.analyzer = analyzer
+        self.documents = []  # (key, term frequencies)
+        self.document_frequency = {}
+        self.vectors = []
+
+    def add(self, key, text):
+        terms = {}
+        for term in tokenize(text, self.analyzer):
+            terms[term] = terms.get(term, 0) + 1
+        for term in terms:
+            self.document_frequency[term] = self.document_frequency.get(term, 0) + 1
+        self.documents.append((key, terms))
+        self.vectors = []  # Weights depend on document frequencies, recompute lazily
+
+    def _vector(self, terms):
+        count = len(self.documents)
+        vector = {term: (1 + math.log(tf)) * (math.log((1 + count) / (1 + self.document_frequency.get(term, 0))) + 1) for term, tf in terms.items()}
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        return {term: w / norm for term, w in vector.items()}
+
+    def query(self, text, limit=3):
+        """Return up to `limit` (key, cosine similarity) pairs, best first."""
+        if not self.documents:
+            return []
+        if not self.vectors:
+            self.vectors = [self._vector(terms) for _, terms in self.documents]
+        terms = {}
+        for term in tokenize(text, self.analyzer):
+            terms[term] = terms.get(term, 0) + 1
+        if not terms:
+            return []
+        query_vector = self._vector(terms)
+        scores = [(key, sum(w * vector.get(term, 0.0) for term, w in query_vector.items())) for (key, _), vector in zip(self.documents, self.vectors)]
+        return sorted(scores, key=lambda item: item[1], reverse=True)[:limit]
+
+# Scene recipe library: validated, parametric scripts for the requests users make most.
+# Templates use string.Template placeholders ($name); params map to
+# (default, min, max, regex with one numeric group matched against the prompt).
+# A recipe only runs without an API call when one of its trigger phrases is in the prompt.
+SCENE_RECIPES = {
+    "forest": {
+        "triggers": ("forest", "woods", "woodland"),
+        "description": "forest woods woodland trees pine tree grove nature ground",
+        "params": {
+            "tree_count": (40, 1, 2000, r"(\d+)\s+(?:\w+\s+)?(?:trees|pines)"),
+            "area": (20, 2, 500, r"(\d+)\s*(?:m|meters?|units?)\b"),
+        },
+        "template": """
+def make_material(name, color):
+    mat = bpy.data.materials.new(name)
+    mat.use_nodes = True
+    mat.node_tree.nodes["Principled BSDF"].inputs["Base Color"].default_value = color
+    return mat
+
+bpy.ops.mesh.primitive_plane_add(size=$area * 2.2, location=(0, 0, 0))
+ground = bpy.context.object
+ground.name = "ForestGround"
+ground.data.materials.append(make_material("ForestFloor", (0.18, 0.12, 0.06, 1)))
+
+bpy.ops.mesh.primitive_cylinder_add(radius=0.2, depth=2.0, location=(0, 0, 1.0))
+trunk = bpy.context.object
+trunk.data.materials.append(make_material("Bark", (0.25, 0.15, 0.07, 1)))
+bpy.ops.mesh.primitive_cone_add(radius1=1.2, depth=3.0, location=(0, 0, 3.5))
+canopy = bpy.context.object
+canopy.data.materials.append(make_material("Leaves", (0.08, 0.4, 0.1, 1)))
+
+forest = bpy.data.collections.new("Forest")
+bpy.context.scene.collection.children.link(forest)
+for i in range($tree_count):
+    x, y = random.uniform(-$area, $area), random.uniform(-$area, $area)
+    s = random.uniform(0.7, 1.4)
+    for part, name in ((trunk, "TreeTrunk"), (canopy, "TreeCanopy")):
+        obj = part.copy()  # Linked duplicate: shares the mesh data
+        obj.name = f"{name}_{i}"
+        obj.location = (x, y, part.location.z * s)
+        obj.scale = (s, s, s)
+        obj.rotation_euler.z = random.uniform(0, math.tau)
+        forest.objects.link(obj)
+bpy.data.objects.remove(trunk)
+bpy.data.objects.remove(canopy)
+""",
+    },
+    "solar_system": {
+        "triggers": ("solar system",),
+        "description": "solar system sun planets orbit orbits orbiting space astronomy animated keyframes",
+        "params": {
+            "planet_count": (8, 1, 8, r"(\d+)\s+planets?"),
+            "frames": (480, 24, 10000, r"(\d+)\s+frames?"),
+        },
+        "template": """
+planets = [
+    ("Mercury", 0.25, (0.6, 0.6, 0.6, 1)), ("Venus", 0.4, (0.9, 0.7, 0.4, 1)),
+    ("Earth", 0.45, (0.2, 0.4, 0.9, 1)), ("Mars", 0.35, (0.8, 0.3, 0.1, 1)),
+    ("Jupiter", 1.0, (0.8, 0.6, 0.4, 1)), ("Saturn", 0.85, (0.9, 0.8, 0.5, 1)),
+    ("Uranus", 0.6, (0.5, 0.8, 0.9, 1)), ("Neptune", 0.6, (0.2, 0.3, 0.9, 1)),
+]
+
+def make_material(name, color, emission=0.0):
+    mat = bpy.data.materials.new(name)
+    mat.use_nodes = True
+    bsdf = mat.node_tree.nodes["Principled BSDF"]
+    bsdf.inputs["Base Color"].default_value = color
+    if emission:
+        bsdf.inputs["Emission Color"].default_value = color
+        bsdf.inputs["Emission Strength"].default_value = emission
+    return mat
+
+scene = bpy.context.scene
+scene.frame_start, scene.frame_end = 1, $frames
+bpy.ops.mesh.primitive_uv_sphere_add(radius=2.0, location=(0, 0, 0))
+sun = bpy.context.object
+sun.name = "Sun"
+sun.data.materials.append(make_material("SunMaterial", (1.0, 0.75, 0.2, 1), emission=8.0))
+
+for i, (name, radius, color) in enumerate(planets[:$planet_count]):
+    distance = 4.0 + i * 2.5
+    bpy.ops.curve.primitive_bezier_circle_add(radius=distance, location=(0, 0, 0))
+    bpy.context.object.name = f"{name}Orbit"
+    pivot = bpy.data.objects.new(f"{name}Pivot", None)
+    bpy.context.collection.objects.link(pivot)
+    bpy.ops.mesh.primitive_uv_sphere_add(radius=radius, location=(distance, 0, 0))
+    planet = bpy.context.object
+    planet.name = name
+    planet.data.materials.append(make_material(f"{name}Material", color))
+    planet.parent = pivot
+    # Outer planets orbit more slowly (Kepler-ish period ~ distance^1.5)
+    period = max(2, int($frames * (distance / 4.0) ** 1.5 / 8))
+    pivot.rotation_euler.z = random.uniform(0, math.tau)
+    pivot.keyframe_insert("rotation_euler", index=2, frame=1)
+    pivot.rotation_euler.z += math.tau * $frames / period
+    pivot.keyframe_insert("rotation_euler", index=2, frame=$frames)
+    for fcurve in pivot.animation_data.action.fcurves:
+        for point in fcurve.keyframe_points:
+            point.interpolation = 'LINEAR'
+""",
+    },
+    "lighting_rig": {
+        "triggers": ("three point light", "three-point light", "lighting rig", "studio lighting"),
+        "description": "three point lighting rig key fill rim back lights studio lighting setup",
+        "params": {
+            "key_energy": (1000, 1, 100000, r"(\d+)\s*(?:w|watts?)\b"),
+            "distance": (6, 1, 100, r"(\d+)\s*(?:m|meters?|units?)\s+away"),
+        },
+        "template": """
+target = bpy.data.objects.new("LightRigTarget", None)
+bpy.context.collection.objects.link(target)
+target.location = (0, 0, 1)
+
+def add_area_light(name, energy, angle, height, size, color=(1, 1, 1)):
+    data = bpy.data.lights.new(name, type='AREA')
+    data.energy = energy
+    data.size = size
+    data.color = color
+    light = bpy.data.objects.new(name, data)
+    bpy.context.collection.objects.link(light)
+    light.location = ($distance * math.cos(angle), $distance * math.sin(angle), height)
+    constraint = light.constraints.new('TRACK_TO')
+    constraint.target = target
+    constraint.track_axis = 'TRACK_NEGATIVE_Z'
+    constraint.up_axis = 'UP_Y'
+    return light
+
+add_area_light("KeyLight", $key_energy, math.radians(-45), $distance * 0.8, 2.0, (1.0, 0.95, 0.9))
+add_area_light("FillLight", $key_energy * 0.4, math.radians(-135), $distance * 0.5, 3.0, (0.9, 0.95, 1.0))
+add_area_light("RimLight", $key_energy * 0.7, math.radians(90), $distance, 1.0)
+""",
+    },
+    "rocks": {
+        "triggers": ("rocks", "stones", "boulders"),
+        "description": "rocks stones boulders pebbles rocky scatter ground",
+        "params": {
+            "rock_count": (25, 1, 5000, r"(\d+)\s+(?:\w+\s+)?(?:rocks|stones|boulders|pebbles)"),
+            "area": (10, 1, 500, r"(\d+)\s*(?:m|meters?|units?)\b"),
+        },
+        "template": """
+mat = bpy.data.materials.new("Rock")
+mat.use_nodes = True
+bsdf = mat.node_tree.nodes["Principled BSDF"]
+bsdf.inputs["Base Color"].default_value = (0.35, 0.33, 0.3, 1)
+bsdf.inputs["Roughness"].default_value = 0.9
+
+# A few irregular variants, then linked duplicates of those
+variants = []
+for v in range(3):
+    bpy.ops.mesh.primitive_ico_sphere_add(subdivisions=2, radius=1.0, location=(0, 0, 0))
+    rock = bpy.context.object
+    for vertex in rock.data.vertices:
+        vertex.co *= random.uniform(0.75, 1.2)
+    rock.data.materials.append(mat)
+    variants.append(rock)
+
+rocks = bpy.data.collections.new("Rocks")
+bpy.context.scene.collection.children.link(rocks)
+for i in range($rock_count):
+    obj = random.choice(variants).copy()
+    obj.name = f"Rock_{i}"
+    s = random.uniform(0.2, 0.8)
+    obj.scale = (s * random.uniform(0.8, 1.3), s * random.uniform(0.8, 1.3), s * random.uniform(0.5, 0.9))
+    obj.location = (random.uniform(-$area, $area), random.uniform(-$area, $area), s * 0.3)
+    obj.rotation_euler = (random.uniform(0, math.tau), random.uniform(0, math.tau), random.uniform(0, math.tau))
+    rocks.objects.link(obj)
+for rock in variants:
+    bpy.data.objects.remove(rock)
+""",
+    },
+}
+
+recipe_index = TfidfIndex('word')
+recipe_vocabulary = {}
+for _name, _recipe in SCENE_RECIPES.items():
+    recipe_index.add(_name, f"{_name.replace('_', ' ')} {_recipe['description']}")
+    recipe_vocabulary[_name] = set(tokenize(f"{_name.replace('_', ' ')} {_recipe['description']}"))
+    # Templates must at least compile with their default parameters
+    compile(string.Template(_recipe["template"]).substitute({k: v[0] for k, v in _recipe["params"].items()}), f"<recipe {_name}>", "exec")
+
+RECIPE_DIRECT_THRESHOLD = 0.3
+RECIPE_REFERENCE_THRESHOLD = 0.2
+
+def match_recipe(prompt):
+    """Return (recipe name, score) of the best matching recipe, or (None, 0.0)."""
+    with tracer.span("recipe_match"):
+        matches = recipe_index.query(prompt, limit=1)
+    return matches[0] if matches and matches[0][1] > 0 else (None, 0.0)
+
+RECIPE_DIRECT_COVERAGE = 0.75
+
+def recipe_is_direct_match(name, score, prompt):
+    # Besides a trigger phrase, most of the prompt's words must be about this recipe,
+    # otherwise running it directly would silently drop the rest of the request.
+    lowered = prompt.lower()
+    if score < RECIPE_DIRECT_THRESHOLD or not any(trigger in lowered for trigger in SCENE_RECIPES[name]["triggers"]):
+        return False
+    words = [w for w in tokenize(prompt) if not w.isdigit()]
+    covered = sum(1 for w in words if w in recipe_vocabulary[name])
+    return bool(words) and covered / len(words) >= RECIPE_DIRECT_COVERAGE
+
+def render_recipe(name, prompt=""):
+    """Fill in a recipe template, taking parameters from numbers in the prompt where possible."""
+    recipe = SCENE_RECIPES[name]
+    values = {}
+    for param, (default, low, high, pattern) in recipe["params"].items():
+        found = re.search(pattern, prompt, re.IGNORECASE) if prompt else None
+        values[param] = min(high, max(low, int(found.group(1)))) if found else default
+    header = f"random.seed({random.randint(0, 99999)})\n"
+    return header + string.Template(recipe["template"]).substitute(values).lstrip("\n"), values
+
+# Semantic prompt cache. Scripts that ran successfully are kept on disk with their prompt;
+# a rephrased request ("add sunlight to the scene" after "add a sun light") is matched by
+# character n-gram TF-IDF similarity and offered without an API call. Besides similarity,
+# every word except fillers (verbs and prepositions included) must be found in the other
+# prompt in the same order (spaces ignored, so "sunlight" matches "sun light"), the numbers
+# and quoted names must be identical, and the objects and materials the cached script
+# refers to by name must still exist.
+PROMPT_CACHE_THRESHOLD = 0.5
+PROMPT_CACHE_MAX_ENTRIES = 500
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+_QUOTED_RE = re.compile(r"(?<!\w)[\"']([^\"'\n]+)[\"'](?!\w)")
+_FILLER_WORDS = frozenset("a an the of to for me please can you i want some scene".split())
+
+def normalize_prompt(prompt):
+    return " ".join(tokenize(prompt, 'word', stop_words=_FILLER_WORDS))
+
+def _words_in_order(words, other):
+    # Order matters: "put the sphere on the cube" must not match "put the cube on the sphere"
+    joined = "".join(other)
+    position = 0
+    for word in words:
+        found = joined.find(word, position)
+        if found < 0:
+            return False
+        position = found + len(word)
+    return True
+
+def scene_names(scene_info):
+    names = set()
+    for key in ("objects", "materials"):
+        for entry in scene_info.get(key, []):
+            names.add(entry["name"])
+            names.update(entry.get("same", []))  # Merged duplicate materials
+    return names
+
+class PromptCache:
+    def __init__(self):
+        self.path = ""
+        self.entries = []
+        self.index = None
+
+    def get_path(self):
+        if not self.path:
+            try:
+                directory = bpy.utils.user_resource('DATAFILES', path="blendergpt_cache", create=True)
+            except Exception:
+                directory = os.path.join(os.path.dirname(os.path.realpath(__file__)), "cache")
+            os.makedirs(directory, exist_ok=True)
+            self.path = os.path.join(directory, "prompts.jsonl")
+        return self.path
+
+    def load(self):
+        if self.index is not None:
+            return
+        self.entries = []
+        if os.path.exists(self.get_path()):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.entries.append(json.loads(line))
+                    except ValueError:
+                        continue  # Partially written line
+        self._reindex()
+
+    def _reindex(self):
+        # Later entries for the same normalized prompt replace earlier ones
+        latest = {}
+        for entry in self.entries:
+            latest[entry["normalized"]] = entry
+        self.entries = list(latest.values())[-PROMPT_CACHE_MAX_ENTRIES:]
+        self.index = TfidfIndex('char')
+        for i, entry in enumerate(self.entries):
+            self.index.add(i, entry["prompt"])
+
+    def add(self, prompt, script, description, scene_info):
+        """Remember a prompt whose script ran successfully."""
+        self.load()
+        names = scene_names(scene_info)
+        literals = set(re.findall(r"[\"']([^\"'\n]+)[\"']", script))
+        entry = {
+            "prompt": prompt,
+            "normalized": normalize_prompt(prompt),
+            "script": script,
+            "description": description,
+            "requires": sorted(literals & names),  # Existing datablocks the script refers to
+            "time": time.time(),
+        }
+        self.entries.append(entry)
+        rewrite = len(self.entries) > PROMPT_CACHE_MAX_ENTRIES * 1.2
+        self._reindex()
+        try:
+            if rewrite:
+                with open(self.get_path(), "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(e) + "\n" for e in self.entries)
+            else:
+                with open(self.get_path(), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Could not write prompt cache: {e}")
+
+    def lookup(self, prompt, scene_info):
+        """Return (entry, similarity) of a cached script usable for this prompt and scene, or (None, 0.0)."""
+        with tracer.span("prompt_cache"):
+            self.load()
+            words = normalize_prompt(prompt).split()
+            numbers = _NUMBER_RE.findall(prompt)
+            quoted = set(_QUOTED_RE.findall(prompt))
+            names = None
+            for key, score in self.index.query(prompt, limit=5):
+                if score < PROMPT_CACHE_THRESHOLD:
+                    break
+                entry = self.entries[key]
+                other = normalize_prompt(entry["prompt"]).split()
+                if not (_words_in_order(words, other) and _words_in_order(other, words)):
+                    continue
+                if _NUMBER_RE.findall(entry["prompt"]) != numbers or set(_QUOTED_RE.findall(entry["prompt"])) != quoted:
+                    continue
+                names = scene_names(scene_info) if names is None else names
+                if not set(entry["requires"]) <= names:
+                    continue
+                tracer.count("prompt_cache_hits")
+                return entry, score
+        tracer.count("prompt_cache_misses")
+        return None, 0.0
+
+    def clear(self):
+        self.entries, self.index = [], None
+        if os.path.exists(self.get_path()):
+            os.remove(self.path)
+
+prompt_cache = PromptCache()
+
+# Speculative prefetch. Users often just accept the follow_up question, so while they look
+# at a result its answer can be generated in a background thread (counted against the
+# rate limiter and a spending budget). Taking it is instant; it's thrown away when the
+# conversation moves on, or when objects were added or removed or an object the
+# prefetched script names has changed since.
+ChatTurn = namedtuple("ChatTurn", "role msg_content")
+
+def follow_up_prompt(follow_up):
+    return f"Yes, please go ahead: {follow_up}"
+
+PREFETCH_OUTPUT_TOKENS = 4096  # Completion size assumed until there are CHAT usage samples
+
+def scene_object_signatures(scene_info):
+    return {obj["name"]: (obj["type"], [round(v, 2) for v in obj.get("location", [])]) for obj in scene_info.get("objects", [])}
+
+class FollowUpPrefetcher:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = 0  # Bumped to orphan a prefetch still in flight
+        self.prompt = ""
+        self.result = None
+        self.signatures = {}
+        self.running = False
+        self.spent = 0.0  # Estimated USD spent on prefetches this session
+        self.timer = self._poll  # bpy.app.timers tells functions apart by identity
+
+    def discard(self):
+        with self.lock:
+            self.generation += 1
+            self.prompt, self.result, self.running = "", None, False
+
+    def state(self, prompt):
+        with self.lock:
+            if prompt != self.prompt:
+                return ""
+            return "running" if self.running else "ready" if self.result else ""
+
+    @staticmethod
+    def estimate_cost(model, prompt, scene_info, history):
+        # The router's average once CHAT requests have been made; before that, measure this
+        # request and assume a long answer, so early prefetches count against the budget too
+        estimate, price = model_router.estimate_cost(model, 'CHAT'), model_price(model)
+        if estimate is not None or not price:
+            return estimate or 0.0
+        texts = [get_static_prompt(False), json.dumps(scene_info, separators=(",", ":")), prompt] + [msg.msg_content for msg in history]
+        prompt_tokens = sum(count_tokens(text, model) + MESSAGE_OVERHEAD_TOKENS for text in texts)
+        completion_tokens = min(model_context(model)[1], PREFETCH_OUTPUT_TOKENS)
+        return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1e6
+
+    def start(self, follow_up, api_key, model, scene_info, history, budget):
+        """Generate the answer to `follow_up` in the background; returns False if skipped."""
+        prompt = follow_up_prompt(follow_up)
+        estimate = self.estimate_cost(model, prompt, scene_info, history)
+        if budget > 0 and self.spent + estimate > budget:
+            print(f"Prefetch skipped: budget of ${budget:.2f} used up (${self.spent:.3f} spent)")
+            return False
+        if not rate_limiter.can_make_request():
+            print("Prefetch skipped: rate limit reached")
+            return False
+        rate_limiter.add_request()
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+            self.prompt, self.result, self.running = prompt, None, True
+            self.signatures = scene_object_signatures(scene_info)
+        # The worker must not touch bpy data, so it gets plain copies
+        history = [ChatTurn(msg.role, msg.msg_content) for msg in history]
+
+        def work():
+            try:
+                result = generate_blender_commands(prompt, api_key, model, scene_info, history, force_script=False, request_class='CHAT')
+            except Exception as e:
+                print(f"Prefetch failed: {e}")
+                result = None
+            if result and result["description"].startswith("Error"):
+                result = None
+            with self.lock:
+                self.spent += model_router.estimate_cost(model, 'CHAT') or estimate
+                if generation == self.generation:
+                    self.result, self.running = result, False
+
+        threading.Thread(target=work, name="blendergpt-prefetch", daemon=True).start()
+        tracer.count("prefetch_started")
+        if not bpy.app.timers.is_registered(self.timer):
+            bpy.app.timers.register(self.timer, first_interval=0.5)
+        return True
+
+    def _poll(self):
+        # Redraw the panel once the answer arrives
+        with self.lock:
+            running = self.running
+        if running:
+            return 0.5
+        tag_redraw_all()
+        return None
+
+    def close(self):
+        self.discard()
+        if bpy.app.timers.is_registered(self.timer):
+            bpy.app.timers.unregister(self.timer)
+
+    def take(self, prompt, scene_info):
+        """Return the prefetched result for `prompt` if it's ready and still fits the scene, else None."""
+        with self.lock:
+            if prompt != self.prompt or self.running or self.result is None:
+                return None
+            result, before = self.result, self.signatures
+        self.discard()
+        current = scene_object_signatures(scene_info)
+        named = set(re.findall(r"[\"']([^\"'\n]+)[\"']", result["script"]))
+        changed = {name for name in before.keys() | current.keys() if before.get(name) != current.get(name)}
+        if before.keys() != current.keys() or changed & named:
+            print(f"Prefetched answer discarded, the scene changed: {', '.join(sorted(changed)[:5])}")
+            tracer.count("prefetch_discarded")
+            return None
+        tracer.count("prefetch_hits")
+        return result
+
+prefetcher = FollowUpPrefetcher()
+
+def start_follow_up_prefetch(context):
+    gpt_props = context.scene.blendergpt_props
+    if not (gpt_props.speculative_prefetch and gpt_props.follow_up):
+        return
+    scene_info = get_scene_info(low_detail=gpt_props.low_detail_mode)
+    prefetcher.start(gpt_props.follow_up, api_key, select_model(context, 'CHAT'), scene_info, gpt_props.chat_history, gpt_props.prefetch_budget)
+
 # Generate Blender Commands (Modified to Force Script Generation When Needed)
-def generate_blender_commands(prompt: str, api_key: str, model: str, scene_info: Dict, chat_history=None, force_script=False) -> Dict:
-    if not api_key:
+def generate_blender_commands(prompt: str, api_key: str, model: str, scene_info: Dict, chat_history=None, force_script=False, request_class='CHAT', recipe_mode='OFF', change_report="", reference_script="") -> Dict:
+    # Consult the local recipe library before paying for a round trip
+    recipe_reference = ""
+    if recipe_mode != 'OFF':
+        recipe_name, score = match_recipe(prompt)
+        if recipe_name and recipe_mode == 'DIRECT' and force_script and recipe_is_direct_match(recipe_name, score, prompt):
+            script, values = render_recipe(recipe_name, prompt)
+            tracer.count("recipe_direct")
+            print(f"Using recipe '{recipe_name}' (score {score:.2f}) with {values}")
+            settings = ", ".join(f"{key}={value}" for key, value in values.items())
+            return {"script": script, "description": f"Built from the '{recipe_name}' recipe ({settings}) without an API call.", "follow_up": "Would you like to add more detail to this scene?"}
+        if recipe_name and score >= RECIPE_REFERENCE_THRESHOLD:
+            script, _ = render_recipe(recipe_name, prompt)
+            tracer.count("recipe_reference")
+            print(f"Adding recipe '{recipe_name}' (score {score:.2f}) as reference")
+            recipe_reference = f"Reference script for similar content (validated; reuse and extend it rather than writing from scratch):\n{script}\n\n"
+
+    if not model:
+        model = model_router.select(request_class)[0]
+    # Replaying a cassette never contacts the provider, so it works offline without a key
+    if not api_key and backend_for(model)[0].needs_api_key and api_cassette.mode != 'REPLAY':
         return {"script": "", "description": "No API key configured", "follow_up": "Please configure your API key in the addon preferences."}
 
-    messages = []
-    chat_history_str = ""
-    if chat_history:
-        for msg in chat_history:
-            role = "user" if msg.role == "USER" else "assistant"
-            messages.append({"role": role, "content": msg.msg_content})
-            chat_history_str += f"{msg.role}: {msg.msg_content}\n"
-
-    # Modified system prompt to enforce script generation when force_script=True
-    system_prompt = (
-        "You are a Blender Python API expert. Your task is to assist the user by generating safe, efficient Python scripts using bpy, or by providing helpful responses based on their prompts.\n"
-        "When generating scripts:\n"
-        "- Use randomization for realism (e.g., positions, scales).\n"
-        "- Avoid dangerous commands like os.system, eval, exec, sys, subprocess, shutil, or file operations like open().\n"
-        "- Do not use sys for any purpose, including sys.stdout or sys.path.\n"
-        "- Focus on using bpy, random, and math modules only to create and manipulate Blender objects, materials, and scenes.\n"
-        "- When creating new objects, always use bpy.ops to create the object and its data, or specify the object_data parameter in bpy.data.objects.new(). For example:\n"
-        "  # Example: Create a cylinder\n"
-        "  bpy.ops.mesh.primitive_cylinder_add(radius=0.5, depth=5, location=(0, 0, 2.5))\n"
-        "  cylinder_obj = bpy.context.object\n"
-        "  cylinder_obj.name = 'TreeTrunk'\n"
-        "  # Or, if using bpy.data.objects.new():\n"
-        "  mesh_data = bpy.data.meshes.new('TreeTrunkMesh')\n"
-        "  cylinder_obj = bpy.data.objects.new(name='TreeTrunk', object_data=mesh_data)\n"
-        "  bpy.context.collection.objects.link(cylinder_obj)\n"
-    )
-    if force_script:
-        system_prompt += (
-            "In this mode, you MUST generate a script for every prompt, even if the user asks a question or provides a vague request. Interpret the prompt as a request to create or modify the scene and generate a corresponding script. For example:\n"
-            "- If the user asks 'How do I create a forest?', generate a script to create a forest.\n"
-            "- If the user says 'What is the scene like?', generate a script to add a new element to the scene based on its current state.\n"
-            "Always include the script in the 'script' field of the JSON response.\n"
-        )
-    else:
-        system_prompt += (
-            "If the user asks a question about the scene or Blender, provide a detailed and helpful response without generating a script unless explicitly requested.\n"
-            "If the user explicitly requests a script (e.g., by saying 'write a script', 'generate a script', 'I need the script', or similar phrases), you MUST generate a script and include it in the 'script' field of the JSON response. Do not just describe the script—provide the actual Python code.\n"
-        )
-    system_prompt += (
-        f"Current scene: {json.dumps(scene_info, indent=2)}\n"
-        f"Chat history:\n{chat_history_str}\n"
-        "Return in JSON: {\"script\": \"<script>\", \"description\": \"<desc>\", \"follow_up\": \"<question>\"}\n"
-        "If no script is generated (e.g., for a question in chat mode), set \"script\" to an empty string.\n"
-        "No markdown wrappers."
-    )
+    with tracer.span("prompt_build"):
+        # Byte-stable prefix first (cacheable by the provider), then history, then the
+        # volatile scene snapshot together with the new prompt.
+        # With a previous script to refine, the model may answer with edits to it instead
+        system = get_static_prompt(force_script, refine=bool(reference_script))
+        history = list(chat_history) if chat_history else []
+        # The chat operator stores the user's message before calling us; don't send it twice
+        if history and history[-1].role == "USER" and history[-1].msg_content == prompt:
+            history.pop()
+        history = [{"role": "user" if msg.role == "USER" else "assistant", "content": msg.msg_content} for msg in history]
+        changes = f"Changes made by the last script: {change_report}\n\n" if change_report else ""
+        previous = f"Previous script:\n{reference_script}\n\n" if reference_script else ""
+        request_text = f"{changes}{recipe_reference}{previous}Request: {prompt}"
+        try:
+            history, scene_json, max_tokens, _ = preflight_request(model, system, history, scene_info, "Current scene: \n\n" + request_text)
+        except ValueError as e:
+            return {"script": "", "description": f"Error: {str(e)}", "follow_up": "Try a shorter prompt, or clear the chat history."}
+        messages = [{"role": "system", "content": system}] + history
+        tracer.count("scene_chars", len(scene_json))
+        user_prompt, prompt = prompt, f"Current scene: {scene_json}\n\n{request_text}"
+        tracer.count("prompt_chars", sum(len(m["content"]) for m in messages) + len(prompt))
 
     max_retries = 3
+    request_model, request_kind = model, request_class
+    generation_model = model  # Model for retries that ask for a script again
+    fallback_model = model_router.fallback_model if model_router.fallback_model != model else ""
+    # A retry sends the original request plus one follow-up; earlier failed turns are dropped
+    retry_prompt = ""
     for attempt in range(max_retries + 1):
         try:
-            client = openai.Client(api_key=api_key)
-            messages.append({"role": "user", "content": prompt})
-            response = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "system", "content": system_prompt}] + messages,
-                max_tokens=7000,
-                temperature=0.7,
-                timeout=30
+            request = messages + [{"role": "user", "content": prompt}]
+            request_tokens = max_tokens
+            if retry_prompt or request_model != model:
+                # The first request was sized for `model` only
+                if retry_prompt:
+                    request.append({"role": "user", "content": retry_prompt})
+                try:
+                    request, request_tokens = fit_retry(request_model, request, keep=2 if retry_prompt else 1)
+                except ValueError as e:
+                    return {"script": "", "description": f"Error: {str(e)}", "follow_up": "Try a shorter prompt, or clear the chat history."}
+            started = time.perf_counter()
+            response_content, usage = request_chat_completion(
+                api_key,
+                request_model,
+                request,
+                max_tokens=request_tokens,
+                temperature=0.7
             )
-            response_content = response.choices[0].message.content.strip()
+            model_router.observe(request_model, time.perf_counter() - started, request_kind, usage)
+            response_content = response_content.strip()
+            tracer.count("response_chars", len(response_content))
             if response_content.startswith("```json"):
                 response_content = response_content[7:-3].strip()
             if not response_content.startswith("{") or not response_content.endswith("}"):
                 if attempt < max_retries:
-                    prompt = f"The following response was not valid JSON:\n{response_content}\nPlease correct the JSON formatting and return a valid JSON object with the fields \"script\", \"description\", and \"follow_up\"."
+                    tracer.count("retries")
+                    # JSON fix-up retries are a different request class and may use a cheaper model
+                    request_model = model_router.select('REPAIR')[0] if model_router.enabled else request_model
+                    request_kind = 'REPAIR'
+                    retry_prompt = f"The following response was not valid JSON:\n{response_content}\nPlease correct the JSON formatting and return a valid JSON object with the fields \"script\", \"description\", and \"follow_up\"."
                     continue
                 return {"script": "", "description": "Error: Incomplete response from API, possibly due to token limit", "follow_up": "Try simplifying your prompt or enabling Low Detail mode."}
-            
-            result = json.loads(response_content)
+
+            with tracer.span("parse", chars=len(response_content)):
+                result = json.loads(response_content)
+            if reference_script and result.get("edits"):
+                try:
+                    script = apply_script_edits(reference_script, result["edits"])
+                    compile(script, SCRIPT_FILENAME, "exec")
+                except (ValueError, SyntaxError) as e:
+                    if attempt < max_retries:
+                        tracer.count("retries")
+                        request_model, request_kind = generation_model, request_class
+                        retry_prompt = f"Your edits could not be applied to the previous script: {e}\nReturn the complete script instead, as a valid JSON object with the fields \"script\", \"description\", and \"follow_up\"."
+                        continue
+                    return {"script": "", "description": f"Error: Could not apply the edits to the previous script: {str(e)}", "follow_up": "Try rephrasing your request."}
+                tracer.count("refinements")
+                # Output tokens a full rewrite would have taken beyond the edits
+                tracer.count("refine_tokens_saved", max(0, count_tokens(script, request_model) - usage.get("completion_tokens", 0)))
+                print(f"Applied {len(result['edits'])} edit(s) to the previous script")
+                result["script"] = script
+                result["edited"] = True
             if not all(key in result for key in ["script", "description", "follow_up"]):
                 raise ValueError("Missing required fields in API response")
             print(f"Generated Script:\n{result['script']}")
             # If force_script is True, ensure a script was generated
             if force_script and not result["script"]:
                 if attempt < max_retries:
-                    prompt = f"The prompt '{prompt}' did not result in a script, but a script is required. Please generate a script based on the prompt and return a valid JSON object with the fields \"script\", \"description\", and \"follow_up\"."
+                    tracer.count("retries")
+                    # Writing the missing script is generation, not a JSON fix
+                    request_model, request_kind = generation_model, request_class
+                    retry_prompt = f"The prompt '{user_prompt}' did not result in a script, but a script is required. Please generate a script based on the prompt and return a valid JSON object with the fields \"script\", \"description\", and \"follow_up\"."
                     continue
                 return {"script": "", "description": "Error: Failed to generate a script as required", "follow_up": "Try rephrasing your prompt or enabling Low Detail mode."}
             return result
         except json.JSONDecodeError as e:
             if attempt < max_retries:
-                prompt = f"The following response was not valid JSON:\n{response_content}\nError: {str(e)}\nPlease correct the JSON formatting and return a valid JSON object with the fields \"script\", \"description\", and \"follow_up\"."
+                tracer.count("retries")
+                request_model = model_router.select('REPAIR')[0] if model_router.enabled else request_model
+                request_kind = 'REPAIR'
+                retry_prompt = f"The following response was not valid JSON:\n{response_content}\nError: {str(e)}\nPlease correct the JSON formatting and return a valid JSON object with the fields \"script\", \"description\", and \"follow_up\"."
                 continue
             return {"script": "", "description": f"Error: Failed to parse API response as JSON: {str(e)}", "follow_up": "Try simplifying your prompt or enabling Low Detail mode."}
         except Exception as e:
             if "timeout" in str(e).lower() and attempt < max_retries:
-                time.sleep(2 ** attempt)
+                tracer.count("retries")
+                tracer.count("timeouts")
+                model_router.observe(request_model, backend_for(request_model)[0].timeout)
+                if fallback_model and request_model != fallback_model:
+                    print(f"Request to {request_model} timed out, falling back to {fallback_model}")
+                    tracer.count("fallbacks")
+                    if request_model == generation_model:
+                        generation_model = fallback_model
+                    request_model = fallback_model
+                elif api_cassette.mode != 'REPLAY':
+                    time.sleep(2 ** attempt)
                 continue
             return {"script": "", "description": f"Error: {str(e)}", "follow_up": "Try rephrasing your prompt, enabling Low Detail mode, or checking your API key."}
 
-# Execute Blender Code
-def execute_blender_code(script):
-    if not script:
-        return {"status": "error", "message": "No script provided."}
-
-    print(f"Executing Script:\n{script}")
+# Helpers injected into the namespace of generated scripts, next to bpy/random/math.
+# Each helper also registers a short API reference in the static system prompt.
+script_helpers = {}
 
-    dangerous_keywords = ["__import__", "eval", "exec", "os.", "sys.", "subprocess", "shutil", "open("]
-    for keyword in dangerous_keywords:
-        if keyword in script:
-            return {"status": "error", "message": f"Script contains unsafe keyword: {keyword}"}
+def script_globals():
+    return {"bpy": bpy, "random": random, "math": math, **script_helpers}
+
+# Procedural instancing. Mass-object prompts ("a forest", "a field of rocks") place
+# instances of one source object on a point cloud instead of creating thousands of
+# independent objects, which keeps the viewport and get_scene_info fast.
+class Scatter:
+    @staticmethod
+    def poisson_points(count, region=(-10, 10, -10, 10), min_distance=1.0, seed=None, attempts=30):
+        """Bridson Poisson-disk sampling in the XY region (xmin, xmax, ymin, ymax); returns up to count (x, y) points."""
+        rng = random.Random(seed)
+        xmin, xmax, ymin, ymax = region
+        if min_distance <= 0:
+            return [(rng.uniform(xmin, xmax), rng.uniform(ymin, ymax)) for _ in range(count)]
+        cell = min_distance / math.sqrt(2)
+        columns, rows = max(1, int((xmax - xmin) / cell) + 1), max(1, int((ymax - ymin) / cell) + 1)
+        grid = [None] * (columns * rows)  # At most one point per cell at this cell size
+        first = (rng.uniform(xmin, xmax), rng.uniform(ymin, ymax))
+        points, active = [first], [first]
+        grid[int((first[1] - ymin) / cell) * columns + int((first[0] - xmin) / cell)] = first
+        min_sq = min_distance * min_distance
+        while active and len(points) < count:
+            index = rng.randrange(len(active))
+            ax, ay = active[index]
+            for _ in range(attempts):
+                angle = rng.uniform(0, math.tau)
+                radius = rng.uniform(min_distance, 2 * min_distance)
+                x, y = ax + radius * math.cos(angle), ay + radius * math.sin(angle)
+                if not (xmin <= x <= xmax and ymin <= y <= ymax):
+                    continue
+                gx, gy = int((x - xmin) / cell), int((y - ymin) / cell)
+                too_close = False
+                for ny in range(max(0, gy - 2), min(rows, gy + 3)):
+                    row = ny * columns
+                    for nx in range(max(0, gx - 2), min(columns, gx + 3)):
+                        neighbor = grid[row + nx]
+                        if neighbor is not None and (neighbor[0] - x) ** 2 + (neighbor[1] - y) ** 2 < min_sq:
+                            too_close = True
+                            break
+                    if too_close:
+                        break
+                if too_close:
+                    continue
+                grid[gy * columns + gx] = (x, y)
+                points.append((x, y))
+                active.append((x, y))
+                break
+            else:
+                active[index] = active[-1]
+                active.pop()
+        return points
+
+    @staticmethod
+    def _instance_tree(name, source):
+        tree = bpy.data.node_groups.new(name, 'GeometryNodeTree')
+        tree.interface.new_socket(name="Geometry", in_out='INPUT', socket_type='NodeSocketGeometry')
+        tree.interface.new_socket(name="Geometry", in_out='OUTPUT', socket_type='NodeSocketGeometry')
+        nodes, links = tree.nodes, tree.links
+        group_in = nodes.new('NodeGroupInput')
+        group_out = nodes.new('NodeGroupOutput')
+        instance = nodes.new('GeometryNodeInstanceOnPoints')
+        if isinstance(source, bpy.types.Collection):
+            info = nodes.new('GeometryNodeCollectionInfo')
+            info.inputs["Collection"].default_value = source
+            info.inputs["Reset Children"].default_value = True
+            info.transform_space = 'ORIGINAL'
+            links.new(info.outputs["Instances"], instance.inputs["Instance"])
+        else:
+            info = nodes.new('GeometryNodeObjectInfo')
+            info.inputs["Object"].default_value = source
+            info.transform_space = 'ORIGINAL'
+            links.new(info.outputs["Geometry"], instance.inputs["Instance"])
+        for attribute, socket in (("gpt_rotation", "Rotation"), ("gpt_scale", "Scale")):
+            named = nodes.new('GeometryNodeInputNamedAttribute')
+            named.data_type = 'FLOAT_VECTOR'
+            named.inputs["Name"].default_value = attribute
+            links.new(named.outputs["Attribute"], instance.inputs[socket])
+        links.new(group_in.outputs["Geometry"], instance.inputs["Points"])
+        links.new(instance.outputs["Instances"], group_out.inputs["Geometry"])
+        return tree
+
+    def instances(self, source, count=100, region=(-10, 10, -10, 10), min_distance=0.0, scale=(0.8, 1.2),
+                  random_rotation=True, z=0.0, seed=None, method='GEOMETRY_NODES', hide_source=True, name="Scatter", avoid_objects=False):
+        """Place `count` instances of an object or collection and return the object holding them."""
+        with tracer.span("scatter", count=count, method=method):
+            rng = random.Random(seed)
+            if avoid_objects:
+                # Keep clear of the scene's objects by the source's own footprint
+                clearance = max(min_distance / 2, 0.0 if isinstance(source, bpy.types.Collection) else object_footprint(source)[2] * scale[1])
+                points = space.free_points(count, clearance or 0.5, region, seed, reserve=False)
+            else:
+                points = self.poisson_points(count, region, min_distance, seed)
+            n = len(points)
+            if np is not None:
+                generator = np.random.default_rng(seed)
+                coords = np.zeros((n, 3), dtype=np.float32)
+                coords[:, :2] = points
+                coords[:, 2] = z
+                scales = np.repeat(generator.uniform(scale[0], scale[1], n).astype(np.float32)[:, None], 3, axis=1)
+                rotations = np.zeros((n, 3), dtype=np.float32)
+                if random_rotation:
+                    rotations[:, 2] = generator.uniform(0, math.tau, n)
+                coords, scales, rotations = coords.ravel(), scales.ravel(), rotations.ravel()
+            else:
+                coords = [c for x, y in points for c in (x, y, z)]
+                scales = [c for _ in range(n) for c in [rng.uniform(*scale)] * 3]
+                rotations = [c for _ in range(n) for c in (0.0, 0.0, rng.uniform(0, math.tau) if random_rotation else 0.0)]
+
+            collection = bpy.context.collection
+            if method == 'COLLECTION':
+                # One lightweight empty per instance; useful where geometry nodes aren't wanted
+                if isinstance(source, bpy.types.Collection):
+                    source_collection = source
+                else:
+                    source_collection = bpy.data.collections.new(f"{name}Source")
+                    source_collection.objects.link(source)
+                holder = bpy.data.objects.new(name, None)
+                collection.objects.link(holder)
+                for i in range(n):
+                    empty = bpy.data.objects.new(f"{name}_{i}", None)
+                    empty.instance_type = 'COLLECTION'
+                    empty.instance_collection = source_collection
+                    empty.location = coords[i * 3:i * 3 + 3]
+                    empty.rotation_euler = rotations[i * 3:i * 3 + 3]
+                    empty.scale = scales[i * 3:i * 3 + 3]
+                    empty.parent = holder
+                    collection.objects.link(empty)
+            else:
+                mesh = bpy.data.meshes.new(f"{name}Points")
+                mesh.vertices.add(n)
+                mesh.vertices.foreach_set("co", coords)
+                mesh.attributes.new("gpt_rotation", 'FLOAT_VECTOR', 'POINT').data.foreach_set("vector", rotations)
+                mesh.attributes.new("gpt_scale", 'FLOAT_VECTOR', 'POINT').data.foreach_set("vector", scales)
+                mesh.update()
+                holder = bpy.data.objects.new(name, mesh)
+                collection.objects.link(holder)
+                modifier = holder.modifiers.new(name, 'NODES')
+                modifier.node_group = self._instance_tree(name, source)
+
+            if hide_source and not isinstance(source, bpy.types.Collection):
+                source.hide_set(True)
+                source.hide_render = True
+            print(f"Scattered {n} instances of {source.name} ({method})")
+            return holder
+
+scatter = Scatter()
+script_helpers["scatter"] = scatter
+register_prompt_section(
+    "- For many copies of the same thing (more than ~30 trees, rocks, grass, stars, buildings...), do NOT create objects in a loop. "
+    "Build one source object (or a collection of variants), then call the built-in `scatter` helper (already available, do not import):\n"
+    "  scatter.instances(source, count=500, region=(xmin, xmax, ymin, ymax), min_distance=0.0, scale=(0.8, 1.2), random_rotation=True, z=0.0, seed=None, method='GEOMETRY_NODES', name='Scatter', avoid_objects=False)\n"
+    "  It places instances via Geometry Nodes on a single object (min_distance > 0 gives Poisson-disk spacing) and hides the source. "
+    "scatter.poisson_points(count, region, min_distance, seed) returns a list of (x, y) points.\n"
+)
+
+# Vectorized mesh construction. Generated scripts hand over whole NumPy vertex/face
+# arrays and the mesh is filled with foreach_set in a few bulk calls, instead of
+# building geometry vertex-by-vertex in Python or through bmesh loops.
+class MeshGen:
+    def from_arrays(self, name, vertices, faces=None, edges=None, location=(0, 0, 0), smooth=False, link=True):
+        """Create a mesh object from an (N, 3) vertex array and (F, k) face array or list of index lists."""
+        with tracer.span("meshgen", mesh=name):
+            mesh = bpy.data.meshes.new(name)
+            if np is None:
+                mesh.from_pydata([tuple(v) for v in vertices], [tuple(e) for e in edges] if edges is not None else [], [tuple(f) for f in faces] if faces is not None else [])
+            else:
+                vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 3)
+                mesh.vertices.add(len(vertices))
+                mesh.vertices.foreach_set("co", vertices.ravel())
+                if edges is not None and len(edges):
+                    edges = np.asarray(edges, dtype=np.int32).reshape(-1, 2)
+                    mesh.edges.add(len(edges))
+                    mesh.edges.foreach_set("vertices", edges.ravel())
+                if faces is not None and len(faces):
+                    if isinstance(faces, np.ndarray) and faces.ndim == 2:
+                        sizes = np.full(len(faces), faces.shape[1], dtype=np.int32)
+                        indices = faces.astype(np.int32).ravel()
+                    else:
+                        sizes = np.fromiter((len(face) for face in faces), dtype=np.int32, count=len(faces))
+                        indices = np.fromiter((i for face in faces for i in face), dtype=np.int32, count=int(sizes.sum()))
+                    starts = np.zeros(len(sizes), dtype=np.int32)
+                    np.cumsum(sizes[:-1], out=starts[1:])
+                    mesh.loops.add(len(indices))
+                    mesh.loops.foreach_set("vertex_index", indices)
+                    mesh.polygons.add(len(sizes))
+                    mesh.polygons.foreach_set("loop_start", starts)
+                mesh.update(calc_edges=True)
+            if smooth and len(mesh.polygons):
+                mesh.shade_smooth()
+            obj = bpy.data.objects.new(name, mesh)
+            obj.location = location
+            if link:
+                bpy.context.collection.objects.link(obj)
+            return obj
+
+    @staticmethod
+    def grid_arrays(x_count, y_count, size_x=10.0, size_y=10.0):
+        """Return (vertices, faces) arrays for a flat grid centered on the origin."""
+        xs = np.linspace(-size_x / 2, size_x / 2, x_count, dtype=np.float32)
+        ys = np.linspace(-size_y / 2, size_y / 2, y_count, dtype=np.float32)
+        gx, gy = np.meshgrid(xs, ys)
+        vertices = np.stack([gx.ravel(), gy.ravel(), np.zeros(gx.size, dtype=np.float32)], axis=1)
+        index = np.arange(x_count * y_count, dtype=np.int32).reshape(y_count, x_count)
+        faces = np.stack([index[:-1, :-1].ravel(), index[:-1, 1:].ravel(), index[1:, 1:].ravel(), index[1:, :-1].ravel()], axis=1)
+        return vertices, faces
+
+    def grid(self, name="Grid", x_count=50, y_count=50, size_x=10.0, size_y=10.0, location=(0, 0, 0)):
+        vertices, faces = self.grid_arrays(x_count, y_count, size_x, size_y)
+        return self.from_arrays(name, vertices, faces, location=location)
+
+    @staticmethod
+    def fractal_noise(x_count, y_count, octaves=5, persistence=0.5, seed=None):
+        """Smooth value noise in roughly [-1, 1] on an (y_count, x_count) grid."""
+        rng = np.random.default_rng(seed)
+        result = np.zeros((y_count, x_count), dtype=np.float32)
+        amplitude, total = 1.0, 0.0
+        for octave in range(octaves):
+            cells = 2 ** (octave + 1) + 1
+            lattice = rng.uniform(-1.0, 1.0, (cells, cells)).astype(np.float32)
+            # Bilinear upsampling of the coarse lattice to the full grid
+            fy = np.linspace(0, cells - 1, y_count, dtype=np.float32)
+            fx = np.linspace(0, cells - 1, x_count, dtype=np.float32)
+            y0, x0 = np.minimum(fy.astype(np.int32), cells - 2), np.minimum(fx.astype(np.int32), cells - 2)
+            ty, tx = (fy - y0)[:, None], (fx - x0)[None, :]
+            ty, tx = ty * ty * (3 - 2 * ty), tx * tx * (3 - 2 * tx)  # Smoothstep
+            top = lattice[y0][:, x0] * (1 - tx) + lattice[y0][:, x0 + 1] * tx
+            bottom = lattice[y0 + 1][:, x0] * (1 - tx) + lattice[y0 + 1][:, x0 + 1] * tx
+            result += amplitude * (top * (1 - ty) + bottom * ty)
+            total += amplitude
+            amplitude *= persistence
+        return result / total
+
+    def terrain(self, name="Terrain", size=50.0, resolution=200, height=5.0, octaves=5, heights=None, seed=None, location=(0, 0, 0), smooth=True):
+        """Heightfield terrain; pass a (resolution, resolution) `heights` array or get fractal noise."""
+        vertices, faces = self.grid_arrays(resolution, resolution, size, size)
+        if heights is None:
+            heights = self.fractal_noise(resolution, resolution, octaves=octaves, seed=seed) * height
+        vertices[:, 2] = np.asarray(heights, dtype=np.float32).ravel()
+        return self.from_arrays(name, vertices, faces, location=location, smooth=smooth)
+
+    def spiral(self, name="Spiral", turns=5.0, points_per_turn=64, radius=1.0, radius_growth=0.0, height=2.0, width=0.2, location=(0, 0, 0)):
+        """A helical ribbon: radius grows by radius_growth per turn, rising `height` in total."""
+        count = max(2, int(turns * points_per_turn))
+        t = np.linspace(0.0, turns, count, dtype=np.float32)
+        angle = t * math.tau
+        r = radius + radius_growth * t
+        z = height * t / max(turns, 1e-6)
+        inner = np.stack([(r - width / 2) * np.cos(angle), (r - width / 2) * np.sin(angle), z], axis=1)
+        outer = np.stack([(r + width / 2) * np.cos(angle), (r + width / 2) * np.sin(angle), z], axis=1)
+        vertices = np.concatenate([inner, outer])
+        i = np.arange(count - 1, dtype=np.int32)
+        faces = np.stack([i, i + 1, count + i + 1, count + i], axis=1)
+        return self.from_arrays(name, vertices, faces, location=location)
+
+meshgen = MeshGen()
+if np is not None:
+    script_helpers["np"] = np
+    script_helpers["meshgen"] = meshgen
+    register_prompt_section(
+        "- For custom geometry, do NOT add vertices one by one or loop with bmesh. Build NumPy arrays (`np` is available) and use the built-in `meshgen` helper:\n"
+        "  meshgen.from_arrays(name, vertices, faces=None, edges=None, location=(0, 0, 0), smooth=False)  # vertices (N, 3), faces (F, k) array or list of index lists\n"
+        "  meshgen.grid_arrays(x_count, y_count, size_x, size_y) -> (vertices, faces); meshgen.grid(name, x_count, y_count, size_x, size_y)\n"
+        "  meshgen.terrain(name, size=50.0, resolution=200, height=5.0, octaves=5, heights=None, seed=None)  # heightfield, fractal noise by default\n"
+        "  meshgen.fractal_noise(x_count, y_count, octaves=5, persistence=0.5, seed=None) -> (y_count, x_count) array\n"
+        "  meshgen.spiral(name, turns=5.0, points_per_turn=64, radius=1.0, radius_growth=0.0, height=2.0, width=0.2)\n"
+        "  Each returns the new object, linked to the active collection.\n"
+    )
+
+# Spatial occupancy index. Object footprints (world-space bounding boxes projected on the
+# XY plane, as circles) go into a uniform grid so that generated scripts can ask for free
+# space locally instead of guessing coordinates from the scene JSON. Flat objects such as
+# ground planes are things to stand on, not obstacles, and are left out.
+OBSTACLE_TYPES = {'MESH', 'CURVE', 'SURFACE', 'META', 'FONT', 'VOLUME'}
+FLAT_RATIO = 0.15  # Height / footprint diameter below which an object counts as ground
+
+def object_footprint(obj):
+    """Return (x, y, radius, flat) of an object's world-space bounding box on the XY plane."""
+    m = obj.matrix_world
+    xs, ys, zs = [], [], []
+    for corner in obj.bound_box:
+        x, y, z = corner
+        xs.append(m[0][0] * x + m[0][1] * y + m[0][2] * z + m[0][3])
+        ys.append(m[1][0] * x + m[1][1] * y + m[1][2] * z + m[1][3])
+        zs.append(m[2][0] * x + m[2][1] * y + m[2][2] * z + m[2][3])
+    radius = math.hypot(max(xs) - min(xs), max(ys) - min(ys)) / 2
+    return (min(xs) + max(xs)) / 2, (min(ys) + max(ys)) / 2, radius, max(zs) - min(zs) < FLAT_RATIO * 2 * radius
+
+class SpatialIndex:
+    def __init__(self, cell_size=2.0):
+        self.cell = cell_size
+        self.cells = {}
+        self.large = []  # Footprints spanning too many cells are checked directly
+        self.count = 0
+        self.bounds = None  # (xmin, xmax, ymin, ymax) of all footprints
+        self.stale = True
+
+    def clear(self):
+        self.cells, self.large, self.count, self.bounds = {}, [], 0, None
+
+    def insert(self, x, y, radius, name=""):
+        entry = (x, y, radius, name)
+        self.count += 1
+        xmin, xmax, ymin, ymax = self.bounds or (x, x, y, y)
+        self.bounds = (min(xmin, x - radius), max(xmax, x + radius), min(ymin, y - radius), max(ymax, y + radius))
+        if radius > 8 * self.cell:
+            self.large.append(entry)
+            return
+        for key in self._cells(x, y, radius):
+            self.cells.setdefault(key, []).append(entry)
+
+    def _cells(self, x, y, radius):
+        c = self.cell
+        return [(i, j) for i in range(math.floor((x - radius) / c), math.floor((x + radius) / c) + 1)
+                for j in range(math.floor((y - radius) / c), math.floor((y + radius) / c) + 1)]
+
+    def rebuild(self, objects=None):
+        """Index the footprints of the scene's objects (or the given ones)."""
+        with tracer.span("spatial_index"):
+            if objects is None:
+                try:
+                    bpy.context.view_layer.update()  # Objects moved by a running script
+                except Exception:
+                    pass
+                objects = bpy.context.scene.objects
+            self.clear()
+            for obj in objects:
+                if obj.type in OBSTACLE_TYPES:
+                    x, y, radius, flat = object_footprint(obj)
+                    if not flat:
+                        self.insert(x, y, radius, obj.name)
+            self.stale = False
+        return self
+
+    def _ensure(self):
+        if self.stale:
+            self.rebuild()
+
+    def is_free(self, x, y, radius=0.5, margin=0.0):
+        """True if a circle of `radius` at (x, y) overlaps no indexed footprint."""
+        self._ensure()
+        seen = set()
+        for key in self._cells(x, y, radius + margin):
+            for entry in self.cells.get(key, ()):
+                if entry not in seen:
+                    seen.add(entry)
+                    if (entry[0] - x) ** 2 + (entry[1] - y) ** 2 < (entry[2] + radius + margin) ** 2:
+                        return False
+        return all((ex - x) ** 2 + (ey - y) ** 2 >= (er + radius + margin) ** 2 for ex, ey, er, _ in self.large)
+
+    def default_region(self, radius):
+        if not self.bounds:
+            return (-10, 10, -10, 10)
+        xmin, xmax, ymin, ymax = self.bounds
+        pad = max(2 * radius, 0.25 * max(xmax - xmin, ymax - ymin))
+        return (xmin - pad, xmax + pad, ymin - pad, ymax + pad)
+
+    def find_free_spot(self, radius=1.0, region=None, near=None, z=0.0, margin=0.1, seed=None, attempts=500, reserve=True):
+        """Return an (x, y, z) spot where a circle of `radius` fits, closest to `near` if given, or None.
+
+        The spot is reserved so that later calls don't return an overlapping one."""
+        self._ensure()
+        rng = random.Random(seed)
+        xmin, xmax, ymin, ymax = region or self.default_region(radius)
+        if near is not None:
+            # Rings of growing radius around the wished-for position
+            cx, cy = near[0], near[1]
+            candidates = [(cx, cy)]
+            step = max(radius, self.cell / 2)
+            ring = 1
+            while len(candidates) < attempts:
+                around = max(6, int(math.tau * ring))
+                offset = rng.uniform(0, math.tau)
+                candidates += [(cx + ring * step * math.cos(offset + math.tau * k / around), cy + ring * step * math.sin(offset + math.tau * k / around)) for k in range(around)]
+                ring += 1
+            candidates = [(x, y) for x, y in candidates if xmin <= x <= xmax and ymin <= y <= ymax]
+        else:
+            candidates = ((rng.uniform(xmin + radius, xmax - radius), rng.uniform(ymin + radius, ymax - radius)) for _ in range(attempts))
+        for x, y in candidates:
+            if self.is_free(x, y, radius, margin):
+                if reserve:
+                    self.insert(x, y, radius, "reserved")
+                return (x, y, z)
+        return None
+
+    def free_points(self, count, radius=0.5, region=None, seed=None, reserve=True):
+        """Up to `count` non-overlapping (x, y) points in the region that also avoid existing objects."""
+        self._ensure()
+        region = region or self.default_region(radius)
+        # Oversample, since part of the region is already taken
+        candidates = Scatter.poisson_points(count * 2, region, 2 * radius, seed)
+        points = [(x, y) for x, y in candidates if self.is_free(x, y, radius)][:count]
+        if reserve:
+            for x, y in points:
+                self.insert(x, y, radius, "reserved")
+        return points
+
+space = SpatialIndex()
+script_helpers["space"] = space
+
+register_prompt_section(
+    "- To place things without overlapping what's already in the scene, use the built-in `space` helper (XY footprints of the scene's objects; ground planes are ignored):\n"
+    "  space.find_free_spot(radius, region=None, near=None, z=0.0) -> (x, y, z) or None  # closest free spot to `near` if given; the spot is reserved\n"
+    "  space.free_points(count, radius, region=None, seed=None) -> list of (x, y) points that don't overlap each other or existing objects\n"
+    "  space.is_free(x, y, radius) -> bool; region is (xmin, xmax, ymin, ymax). scatter.instances(..., avoid_objects=True) keeps instances clear of existing objects.\n"
+)
+
+# Material summaries for get_scene_info, cached per material. A summary is reused while
+# the material's fingerprint (node and link counts) is unchanged and the depsgraph hasn't
+# reported an edit to it, so only new or edited materials have their node trees scanned.
+# Materials nobody uses are skipped and identical ones are listed once.
+MATERIAL_INPUTS = (
+    ("base_color", ("Base Color",), None),
+    ("metallic", ("Metallic",), None),
+    ("roughness", ("Roughness",), None),
+    ("emission_color", ("Emission Color", "Emission"), None),
+    ("emission_strength", ("Emission Strength",), 0.0),
+    ("transmission", ("Transmission Weight", "Transmission"), 0.0),
+    ("alpha", ("Alpha",), 1.0),
+)  # (key, socket names across Blender versions, default left out of the summary)
+
+def _rounded(value):
+    return round(value, 3) if isinstance(value, float) else [round(v, 3) for v in value]
+
+class MaterialCache:
+    def __init__(self):
+        self.entries = {}  # session_uid -> (fingerprint, summary)
+
+    @staticmethod
+    def fingerprint(mat):
+        tree = mat.node_tree if mat.use_nodes else None
+        return (len(tree.nodes), len(tree.links)) if tree else (None, tuple(mat.diffuse_color))
+
+    @staticmethod
+    def summarize(mat):
+        if not (mat.use_nodes and mat.node_tree):
+            return {"base_color": _rounded(tuple(mat.diffuse_color)), "metallic": round(mat.metallic, 3), "roughness": round(mat.roughness, 3)}
+        summary, linked = {}, []
+        nodes = mat.node_tree.nodes
+        principled = next((n for n in nodes if n.type == 'BSDF_PRINCIPLED'), None)
+        if principled:
+            for key, names, default in MATERIAL_INPUTS:
+                socket = next((principled.inputs[name] for name in names if name in principled.inputs), None)
+                if socket is None:
+                    continue
+                if socket.is_linked:
+                    linked.append(key)
+                    continue
+                value = _rounded(socket.default_value)
+                if value != default:
+                    summary[key] = value
+            if summary.get("emission_strength", 0.0) == 0.0:
+                summary.pop("emission_color", None)  # No emission, the color doesn't matter
+        if linked:
+            summary["linked"] = linked
+        textures = sorted({n.image.name for n in nodes if n.type == 'TEX_IMAGE' and n.image})
+        if textures:
+            summary["textures"] = textures
+        procedural = sorted({n.type[4:].lower() for n in nodes if n.type.startswith('TEX_') and n.type != 'TEX_IMAGE'})
+        if procedural:
+            summary["procedural_textures"] = procedural
+        return summary
+
+    def get(self, mat):
+        uid, fingerprint = mat.session_uid, self.fingerprint(mat)
+        cached = self.entries.get(uid)
+        if cached and cached[0] == fingerprint:
+            tracer.count("material_cache_hits")
+            return cached[1]
+        tracer.count("material_cache_misses")
+        summary = self.summarize(mat)
+        self.entries[uid] = (fingerprint, summary)
+        return summary
+
+    def scene_materials(self):
+        """Summaries of the used materials; identical materials are merged into one entry."""
+        merged = {}
+        for mat in bpy.data.materials:
+            if mat.users == 0 or (mat.use_fake_user and mat.users == 1):
+                continue
+            summary = self.get(mat)
+            key = json.dumps(summary, sort_keys=True)
+            entry = merged.get(key)
+            if entry is None:
+                merged[key] = {"name": mat.name, "users": mat.users, **summary}
+            else:
+                entry["users"] += mat.users
+                entry.setdefault("same", []).append(mat.name)
+        return list(merged.values())
+
+material_cache = MaterialCache()
+
+@bpy.app.handlers.persistent
+def invalidate_scene_caches(scene, depsgraph):
+    if scene_snapshot.transforms is not None and (depsgraph.id_type_updated('OBJECT') or depsgraph.id_type_updated('MESH')):
+        scene_snapshot.refresh(update.id.original for update in depsgraph.updates)
+    # get_scene_info rebuilds the spatial index; any later object change makes the next query rebuild it
+    if depsgraph.id_type_updated('OBJECT'):
+        space.stale = True
+    # Edits to socket values don't change a material's fingerprint, so drop edited ones
+    if depsgraph.id_type_updated('MATERIAL'):
+        for update in depsgraph.updates:
+            if isinstance(update.id, bpy.types.Material):
+                material_cache.entries.pop(update.id.original.session_uid, None)
+
+@bpy.app.handlers.persistent
+def reset_scene_snapshot(*args):
+    # A new file or an undo step replaces datablocks without reporting each of them
+    scene_snapshot.reset()
+
+# Scene complexity budget. Before a script runs, a static pass over its AST predicts how
+# many objects and vertices it will create (loop bounds x creation calls, including calls
+# through helper functions), so a runaway "100k objects" script can be downscaled or
+# stopped instead of hanging Blender. A while loop is bounded by a counter compared against
+# a constant where there is one, else assumed to run UNKNOWN_LOOP_COUNT times like other
+# loops with unknown bounds; the execution time limit covers the rest.
+
+# Default vertex counts of the primitive operators, and the keyword that changes them
+PRIMITIVE_VERTICES = {
+    "primitive_cube_add": lambda kw: 8,
+    "primitive_plane_add": lambda kw: 4,
+    "primitive_circle_add": lambda kw: kw.get("vertices", 32),
+    "primitive_uv_sphere_add": lambda kw: kw.get("segments", 32) * (kw.get("ring_count", 16) - 1) + 2,
+    "primitive_ico_sphere_add": lambda kw: 10 * 4 ** kw.get("subdivisions", 2) + 2,
+    "primitive_cylinder_add": lambda kw: kw.get("vertices", 32) * 2,
+    "primitive_cone_add": lambda kw: kw.get("vertices", 32) + 1,
+    "primitive_torus_add": lambda kw: kw.get("major_segments", 48) * kw.get("minor_segments", 12),
+    "primitive_monkey_add": lambda kw: 507,
+    "primitive_grid_add": lambda kw: kw.get("x_subdivisions", 10) * kw.get("y_subdivisions", 10),
+}
+BYTES_PER_OBJECT = 4096
+BYTES_PER_VERTEX = 120  # Vertex plus its share of edges, loops and faces
+UNKNOWN_LOOP_COUNT = 10
+# .copy() on these gives a vector or matrix, not a new object
+VALUE_ATTRIBUTES = frozenset(("location", "rotation_euler", "rotation_quaternion", "scale", "dimensions", "co", "normal",
+                              "matrix_world", "matrix_basis", "matrix_local", "matrix_parent_inverse", "color"))
+
+class ScriptCostEstimator:
+    def __init__(self, tree):
+        self.constants = {}
+        self.functions = {}
+        self.loops = []  # (node, iterations or None, depth, creates objects)
+        for node in tree.body:
+            if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+                value = self.constant(node.value)
+                if isinstance(value, (int, float)):
+                    self.constants[node.targets[0].id] = value
+            elif isinstance(node, ast.FunctionDef):
+                self.functions[node.name] = node
+        self._function_costs = {}
+        self._active_functions = set()
+
+    def constant(self, node):
+        try:
+            return ast.literal_eval(node)
+        except Exception:
+            if isinstance(node, ast.Name):
+                return self.constants.get(node.id)
+            if isinstance(node, ast.BinOp):
+                left, right = self.constant(node.left), self.constant(node.right)
+                if isinstance(left, (int, float)) and isinstance(right, (int, float)):
+                    try:
+                        return {ast.Mult: left * right, ast.Add: left + right, ast.Sub: left - right, ast.FloorDiv: left // right if right else None}.get(type(node.op))
+                    except Exception:
+                        return None
+            return None
+
+    def range_bounds(self, call):
+        # (start, stop, step) for range() calls with resolvable arguments
+        if not (isinstance(call, ast.Call) and isinstance(call.func, ast.Name) and call.func.id == "range"):
+            return None
+        values = [self.constant(arg) for arg in call.args]
+        if not values or any(not isinstance(v, int) for v in values):
+            return None
+        if len(values) == 1:
+            return 0, values[0], 1
+        return values[0], values[1], values[2] if len(values) > 2 else 1
+
+    def iterations(self, loop):
+        if isinstance(loop, ast.For):
+            bounds = self.range_bounds(loop.iter)
+            if bounds:
+                return len(range(*bounds))
+            if isinstance(loop.iter, (ast.List, ast.Tuple, ast.Set)):
+                return len(loop.iter.elts)
+        elif isinstance(loop, ast.While):
+            return self.while_bound(loop)
+        return None
+
+    def while_bound(self, loop):
+        # `while attempts < 100:` (or several such tests joined by `and`) where the body
+        # steps the counter up by a constant on every iteration
+        tests = loop.test.values if isinstance(loop.test, ast.BoolOp) and isinstance(loop.test.op, ast.And) else [loop.test]
+        bounds = []
+        for test in tests:
+            if not (isinstance(test, ast.Compare) and len(test.ops) == 1 and isinstance(test.ops[0], (ast.Lt, ast.LtE)) and isinstance(test.left, ast.Name)):
+                continue
+            limit = self.constant(test.comparators[0])
+            # Only unconditional steps, directly in the loop body
+            steps = [self.constant(stmt.value) for stmt in loop.body
+                     if isinstance(stmt, ast.AugAssign) and isinstance(stmt.op, ast.Add) and isinstance(stmt.target, ast.Name) and stmt.target.id == test.left.id]
+            if isinstance(limit, (int, float)) and steps and isinstance(steps[0], (int, float)) and steps[0] > 0:
+                start = self.constants.get(test.left.id, 0)
+                span = limit - start + (1 if isinstance(test.ops[0], ast.LtE) else 0)
+                bounds.append(max(0, math.ceil(span / steps[0])))
+        return min(bounds) if bounds else None
+
+    def cost(self, statements, depth=0):
+        """Return (objects, vertices, instances) created by a list of statements."""
+        objects = vertices = instances = 0
+        for statement in statements:
+            if isinstance(statement, (ast.For, ast.While)):
+                count = self.iterations(statement)
+                body = self.cost(statement.body, depth + 1)
+                self.loops.append((statement, count, depth, body[0] > 0 or body[2] > 0))
+                multiplier = count if count is not None else UNKNOWN_LOOP_COUNT
+                objects += body[0] * multiplier
+                vertices += body[1] * multiplier
+                instances += body[2] * multiplier
+                rest = self.cost(statement.orelse, depth)
+            elif isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                continue  # Costed where it's called
+            else:
+                rest = self.call_costs(statement)
+                # if/with/try blocks: count every branch, which errs on the side of caution
+                blocks = [getattr(statement, field, None) for field in ("body", "orelse", "finalbody")]
+                blocks += [handler.body for handler in getattr(statement, "handlers", [])]
+                for block in blocks:
+                    if isinstance(block, list) and block and isinstance(block[0], ast.stmt):
+                        nested = self.cost(block, depth)
+                        rest = (rest[0] + nested[0], rest[1] + nested[1], rest[2] + nested[2])
+            objects, vertices, instances = objects + rest[0], vertices + rest[1], instances + rest[2]
+        return objects, vertices, instances
+
+    def call_costs(self, statement):
+        objects = vertices = instances = 0
+        # Only look at expressions of this statement, not nested statement blocks
+        roots = []
+        for field, value in ast.iter_fields(statement):
+            if field in ("body", "orelse", "finalbody", "handlers"):
+                continue
+            if isinstance(value, ast.AST):
+                roots.append(value)
+            elif isinstance(value, list):
+                roots.extend(item for item in value if isinstance(item, ast.AST))
+        for root in roots:
+            for node in ast.walk(root):
+                if not isinstance(node, ast.Call):
+                    continue
+                name = node.func.attr if isinstance(node.func, ast.Attribute) else node.func.id if isinstance(node.func, ast.Name) else ""
+                keywords = {kw.arg: self.constant(kw.value) for kw in node.keywords if kw.arg}
+                keywords = {k: v for k, v in keywords.items() if isinstance(v, (int, float))}
+                if name in PRIMITIVE_VERTICES:
+                    objects += 1
+                    vertices += PRIMITIVE_VERTICES[name](keywords)
+                elif name.endswith("_add") and isinstance(node.func, ast.Attribute) and "ops" in ast.unparse(node.func):
+                    objects += 1
+                elif name == "new" and isinstance(node.func, ast.Attribute) and ast.unparse(node.func.value).endswith("data.objects"):
+                    objects += 1
+                elif name == "copy" and isinstance(node.func, ast.Attribute) and not (isinstance(node.func.value, ast.Attribute) and node.func.value.attr in VALUE_ATTRIBUTES):
+                    objects += 1  # obj.copy(), random.choice(variants).copy(), ...
+                elif name == "instances" and isinstance(node.func, ast.Attribute) and ast.unparse(node.func.value) == "scatter":
+                    objects += 1
+                    instances += int(keywords.get("count", 100))
+                elif name in self.functions:
+                    cost = self.function_cost(name)
+                    objects, vertices, instances = objects + cost[0], vertices + cost[1], instances + cost[2]
+        return objects, vertices, instances
+
+    def function_cost(self, name):
+        if name in self._function_costs:
+            return self._function_costs[name]
+        if name in self._active_functions:
+            return 0, 0, 0  # Recursion; don't try to bound it
+        self._active_functions.add(name)
+        cost = self.cost(self.functions[name].body)
+        self._active_functions.discard(name)
+        self._function_costs[name] = cost
+        return cost
+
+def estimate_script_cost(script):
+    """Statically predict objects, vertices, instances and memory (MB) created by a script."""
+    with tracer.span("estimate"):
+        try:
+            tree = ast.parse(script)
+        except SyntaxError as e:
+            return {"objects": 0, "vertices": 0, "instances": 0, "memory_mb": 0.0, "unknown_loops": 0, "error": str(e)}
+        estimator = ScriptCostEstimator(tree)
+        objects, vertices, instances = estimator.cost(tree.body)
+        return {
+            "objects": objects,
+            "vertices": vertices,
+            "instances": instances,
+            "memory_mb": (objects * BYTES_PER_OBJECT + vertices * BYTES_PER_VERTEX) / 1e6,
+            "unknown_loops": sum(1 for _, count, _, creates in estimator.loops if count is None and creates),
+        }
+
+def budget_overrun(estimate, budget):
+    """Return the factor (< 1) the script must shrink by to fit the budget, or 1.0."""
+    factors = [1.0]
+    if budget.get("max_objects") and estimate["objects"] > budget["max_objects"]:
+        factors.append(budget["max_objects"] / estimate["objects"])
+    if budget.get("max_vertices") and estimate["vertices"] > budget["max_vertices"]:
+        factors.append(budget["max_vertices"] / estimate["vertices"])
+    return min(factors)
+
+class _LoopClamper(ast.NodeTransformer):
+    def __init__(self, estimator, factor):
+        self.estimator = estimator
+        self.factor = factor
+        self.remaining = factor
+        self.clamped = []
+        self.creating = {id(loop) for loop, _, _, creates in estimator.loops if creates}
+
+    def clampable(self, node):
+        return isinstance(node, ast.For) and id(node) in self.creating and self.estimator.range_bounds(node.iter) is not None
+
+    def levels(self, node):
+        # Most clampable loops along any path from here down, this one included
+        nested = max((self.levels(child) for child in ast.iter_child_nodes(node)
+                      if not isinstance(child, (ast.expr, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))), default=0)
+        return nested + self.clampable(node)
+
+    def visit_FunctionDef(self, node):
+        saved, self.remaining = self.remaining, self.factor
+        self.generic_visit(node)
+        self.remaining = saved
+        return node
+
+    def visit_For(self, node):
+        bounds = self.estimator.range_bounds(node.iter)
+        saved = self.remaining
+        if self.remaining < 1.0 and self.clampable(node):
+            count = len(range(*bounds))
+            # Spread the reduction over the nesting levels, so 100x100x100 becomes ~17x17x17
+            # rather than 2x100x100
+            new_count = max(1, int(count * self.remaining ** (1 / self.levels(node))))
+            if new_count < count:
+                start, _, step = bounds
+                node.iter = ast.Call(func=ast.Name(id="range", ctx=ast.Load()), args=[ast.Constant(start), ast.Constant(start + new_count * step), ast.Constant(step)], keywords=[])
+                self.clamped.append((node.lineno, count, new_count))
+                # Whatever this loop couldn't absorb is left for the loops nested inside it
+                self.remaining = min(1.0, self.remaining * count / new_count)
+        self.generic_visit(node)
+        self.remaining = saved
+        return node
+
+def downscale_script(script, factor):
+    """Clamp the bounds of object-creating range() loops so the script creates ~factor of its objects."""
+    tree = ast.parse(script)
+    estimator = ScriptCostEstimator(tree)
+    estimator.cost(tree.body)
+    clamper = _LoopClamper(estimator, factor)
+    # Loops inside helper functions are clamped by the full factor as well; if such a
+    # function is also called from a clamped loop the script ends up under budget, not over.
+    tree = clamper.visit(tree)
+    return ast.unparse(ast.fix_missing_locations(tree)), clamper.clamped
+
+def describe_estimate(estimate):
+    text = f"~{estimate['objects']:,} objects, ~{estimate['vertices']:,} vertices, ~{estimate['memory_mb']:.0f} MB"
+    if estimate["instances"]:
+        text += f", {estimate['instances']:,} instances"
+    if estimate["unknown_loops"]:
+        text += f" ({estimate['unknown_loops']} loop(s) with unknown bounds assumed x{UNKNOWN_LOOP_COUNT})"
+    if estimate.get("dry_run"):
+        text += f" (dry run {estimate['dry_run']})"
+    return text
+
+# Optional dry run: the script runs once against stand-ins for bpy, bmesh, mathutils and the
+# script helpers that accept any attribute access, call or arithmetic and count the calls
+# that create objects. That counts what the static pass can't bound (data-dependent while
+# loops, recursion, computed lists); loops over scene data see nothing, so the larger of
+# the two counts is used. random, math and numpy stay real; DRY_RUN_TIME_LIMIT stops it.
+DRY_RUN_TIME_LIMIT = 2.0
+DRY_RUN_MODULES = frozenset(("bpy", "bmesh", "mathutils", "bpy_extras"))
+
+class DryRunCounter:
+    def __init__(self):
+        self.objects = self.vertices = self.instances = 0
+
+    def call(self, path, kwargs):
+        receiver, _, name = path.rpartition(".")
+        numbers = {k: v for k, v in kwargs.items() if isinstance(v, (int, float))}
+        if name in PRIMITIVE_VERTICES:
+            self.objects += 1
+            self.vertices += PRIMITIVE_VERTICES[name](numbers)
+        elif name.endswith("_add") and ".ops." in path:
+            self.objects += 1
+        elif name == "new" and receiver.endswith("data.objects"):
+            self.objects += 1
+        elif name == "copy" and receiver.rpartition(".")[2] not in VALUE_ATTRIBUTES:
+            self.objects += 1
+        elif path == "scatter.instances":
+            self.objects += 1
+            self.instances += int(numbers.get("count", 100))
+
+class DryRunValue:
+    """Stands in for any bpy value during a dry run; every operation gives another stand-in."""
+    __slots__ = ("_counter", "_path")
+
+    def __init__(self, counter, path):
+        object.__setattr__(self, "_counter", counter)
+        object.__setattr__(self, "_path", path)
+
+    def _derive(self, suffix):
+        return DryRunValue(self._counter, self._path + suffix)
+
+    def __getattr__(self, name):
+        return self._derive("." + name)
+
+    def __setattr__(self, name, value):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        self._counter.call(self._path, kwargs)
+        return self._derive("()")
+
+    def __getitem__(self, key):
+        return self._derive("[]")
+
+    def __setitem__(self, key, value):
+        pass
+
+    def __delitem__(self, key):
+        pass
+
+    def __iter__(self):
+        return iter(())
+
+    def __contains__(self, item):
+        return False
+
+    def __len__(self):
+        return 0
+
+    def __bool__(self):
+        return True
+
+    def __int__(self):
+        return 0
+
+    def __index__(self):
+        return 0
+
+    def __float__(self):
+        return 0.0
+
+    def __round__(self, digits=None):
+        return 0
+
+    def __format__(self, spec):
+        return format(0.0, spec) if spec else self._path
+
+    def __str__(self):
+        return self._path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __eq__(self, other):
+        return self is other
+
+    def __hash__(self):
+        return id(self)
+
+    def __lt__(self, other):
+        return False
+
+    __le__ = __gt__ = __ge__ = __lt__
+
+    def _operator(self, *args):
+        return self
+
+    __add__ = __radd__ = __sub__ = __rsub__ = __mul__ = __rmul__ = __matmul__ = __rmatmul__ = _operator
+    __truediv__ = __rtruediv__ = __floordiv__ = __rfloordiv__ = __mod__ = __rmod__ = __pow__ = __rpow__ = _operator
+    __neg__ = __pos__ = __abs__ = __invert__ = _operator
+
+def dry_run_count(code):
+    """Run compiled script code against stand-ins; return (objects, vertices, instances, finished)."""
+    counter = DryRunCounter()
+    real_import = builtins.__import__
+
+    def dry_import(name, *args, **kwargs):
+        if name.partition(".")[0] in DRY_RUN_MODULES:
+            return DryRunValue(counter, name.partition(".")[0])
+        return real_import(name, *args, **kwargs)
+
+    namespace = dict(script_globals(), __builtins__=dict(vars(builtins), __import__=dry_import), bpy=DryRunValue(counter, "bpy"))
+    namespace.update((name, DryRunValue(counter, name)) for name in script_helpers if name != "np")
+    watchdog = ExecutionWatchdog(DRY_RUN_TIME_LIMIT)
+    random_state = random.getstate()
+    old_stdout, old_stderr = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = StringIO()
+    finished = True
+    with tracer.span("dry_run"):
+        watchdog.watch(code)
+        try:
+            exec(code, namespace)
+        except ScriptAborted:
+            finished = False
+        except Exception as e:
+            # Usually an operation the stand-ins can't mimic; what was counted so far still counts
+            old_stdout.write(f"Dry run stopped: {e}\n")
+            finished = False
+        finally:
+            watchdog.unwatch()
+            sys.stdout, sys.stderr = old_stdout, old_stderr
+            random.setstate(random_state)
+    return counter.objects, counter.vertices, counter.instances, finished
+
+def budget_estimate(script, budget):
+    """estimate_script_cost, raised to the dry-run count when the budget asks for one."""
+    estimate = estimate_script_cost(script)
+    if not budget.get("dry_run") or "error" in estimate:
+        return estimate
+    objects, vertices, instances, finished = dry_run_count(compile_script(script))
+    estimate.update(objects=max(estimate["objects"], objects), vertices=max(estimate["vertices"], vertices),
+                    instances=max(estimate["instances"], instances), dry_run="counted" if finished else "stopped early")
+    estimate["memory_mb"] = (estimate["objects"] * BYTES_PER_OBJECT + estimate["vertices"] * BYTES_PER_VERTEX) / 1e6
+    return estimate
+
+def get_budget(gpt_props):
+    return {
+        "max_objects": gpt_props.budget_max_objects,
+        "max_vertices": gpt_props.budget_max_vertices,
+        "action": gpt_props.budget_action,
+        "time_limit": gpt_props.exec_time_limit,
+        "progressive": gpt_props.progressive_execution,
+        "rollback": gpt_props.rollback_failed_scripts,
+        "dry_run": gpt_props.budget_dry_run,
+    }
+
+pending_budget_script = {"script": "", "estimate": None}  # Last script stopped by the budget
+
+# Execution watchdog. Generated scripts are compiled under their own filename so that a
+# trace hook can watch just their lines (never Blender's or the addon's) and abort on a
+# wall-clock limit or a cancel request. Uses sys.monitoring line events where available
+# (Python 3.12+) and sys.settrace otherwise. Time spent inside a single long C call
+# (e.g. one huge bpy.ops call) can't be interrupted; the check happens on the next line.
+SCRIPT_FILENAME = "<blendergpt-script>"
+
+class ScriptAborted(Exception):
+    pass
+
+class EscapeKey:
+    """Polls the ESC key from the OS through ctypes.
+
+    While a script runs on the main thread Blender processes no events, so ESC has to be
+    polled from the OS: GetAsyncKeyState on Windows, CGEventSourceKeyState on macOS and
+    XQueryKeymap on X11 (including XWayland). Set up on first use; where none of these is
+    available ESC can't be polled and only the time limit applies."""
+    XK_ESCAPE = 0xFF1B
+    KVK_ESCAPE = 0x35
+
+    def __init__(self):
+        self._poll = None
+        self._loaded = False
+
+    def _load(self):
+        self._loaded = True
+        try:
+            if sys.platform == "win32":
+                user32 = ctypes.windll.user32
+                self._poll = lambda: bool(user32.GetAsyncKeyState(0x1B) & 0x8000)
+            elif sys.platform == "darwin":
+                graphics = ctypes.CDLL("/System/Library/Frameworks/ApplicationServices.framework/ApplicationServices")
+                graphics.CGEventSourceKeyState.restype = ctypes.c_bool
+                graphics.CGEventSourceKeyState.argtypes = [ctypes.c_int32, ctypes.c_uint16]
+                # 0: kCGEventSourceStateCombinedSessionState
+                self._poll = lambda: graphics.CGEventSourceKeyState(0, self.KVK_ESCAPE)
+            else:
+                library = ctypes.util.find_library("X11")
+                if not library or not os.environ.get("DISPLAY"):
+                    return
+                x11 = ctypes.CDLL(library)
+                x11.XOpenDisplay.restype = ctypes.c_void_p
+                x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+                x11.XKeysymToKeycode.restype = ctypes.c_ubyte
+                x11.XKeysymToKeycode.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+                x11.XQueryKeymap.argtypes = [ctypes.c_void_p, ctypes.c_char * 32]
+                display = x11.XOpenDisplay(None)
+                if not display:
+                    return
+                keycode = x11.XKeysymToKeycode(display, self.XK_ESCAPE)
+                keys = (ctypes.c_char * 32)()
+
+                def poll():
+                    x11.XQueryKeymap(display, keys)
+                    return bool(keys.raw[keycode // 8] & (1 << (keycode % 8)))
+                self._poll = poll
+        except Exception as e:
+            print(f"ESC can't be polled, only the time limit stops scripts: {e}")
+            self._poll = None
+
+    @property
+    def available(self):
+        if not self._loaded:
+            self._load()
+        return self._poll is not None
+
+    def pressed(self):
+        if not self.available:
+            return False
+        try:
+            return self._poll()
+        except Exception:
+            return False
+
+escape_key = EscapeKey()
+
+def escape_pressed():
+    return escape_key.pressed()
+
+class ExecutionWatchdog:
+    CHECK_INTERVAL = 0.05  # Seconds between clock/ESC checks
+
+    def __init__(self, time_limit=0.0):
+        self.time_limit = time_limit
+        self.cancelled = False
+        self.reason = ""
+        self.last_line = 0
+        self.lines_executed = 0
+        self.start = 0.0
+        self._next_check = 0.0
+        self._tool_id = None
+        self._tracing = False
+        self._previous_trace = None
+
+    def cancel(self, reason="Cancelled"):
+        self.cancelled = True
+        self.reason = reason
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def _on_line(self, line):
+        self.last_line = line
+        self.lines_executed += 1
+        if self.lines_executed & 255:
+            return
+        now = time.perf_counter()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.CHECK_INTERVAL
+        if self.time_limit > 0 and now - self.start > self.time_limit:
+            self.cancel(f"Time limit of {self.time_limit:g}s exceeded")
+        elif escape_pressed():
+            self.cancel("Cancelled with ESC")
+        if self.cancelled:
+            raise ScriptAborted(self.reason)
+
+    # sys.settrace: only frames running the generated script get a local tracer
+    def _global_trace(self, frame, event, arg):
+        if frame.f_code.co_filename == SCRIPT_FILENAME:
+            return self._local_trace
+        return None
+
+    def _local_trace(self, frame, event, arg):
+        if event == 'line':
+            self._on_line(frame.f_lineno)
+        return self._local_trace
+
+    def _monitor_line(self, code, line):
+        self._on_line(line)
+
+    def watch(self, code):
+        # A progressive run is watched slice by slice, timed from the start of the run
+        self.start = self.start or time.perf_counter()
+        self._next_check = time.perf_counter()
+        if self.time_limit <= 0 and not escape_key.available:
+            return  # Nothing to check: tracing would only slow the script down
+        monitoring = getattr(sys, "monitoring", None)
+        if monitoring is not None:
+            for tool_id in range(monitoring.PROFILER_ID + 1, 6):
+                if monitoring.get_tool(tool_id) is None:
+                    self._tool_id = tool_id
+                    break
+        if self._tool_id is not None:
+            monitoring.use_tool_id(self._tool_id, "blendergpt-watchdog")
+            monitoring.register_callback(self._tool_id, monitoring.events.LINE, self._monitor_line)
+            # Local events on the script's code objects only, functions and class bodies included
+            pending = [code]
+            while pending:
+                current = pending.pop()
+                monitoring.set_local_events(self._tool_id, current, monitoring.events.LINE)
+                pending.extend(const for const in current.co_consts if hasattr(const, "co_code"))
+        else:
+            # Keep an attached debugger's trace function to put it back afterwards
+            self._previous_trace = sys.gettrace()
+            self._tracing = True
+            sys.settrace(self._global_trace)
+
+    def unwatch(self):
+        if self._tool_id is not None:
+            monitoring = sys.monitoring
+            monitoring.register_callback(self._tool_id, monitoring.events.LINE, None)
+            monitoring.free_tool_id(self._tool_id)
+            self._tool_id = None
+        elif self._tracing:
+            sys.settrace(self._previous_trace)
+            self._tracing = False
+            self._previous_trace = None
+
+active_watchdog = None  # Watchdog of the script currently running, if any
+
+def schedule_undo_rollback():
+    # Undo from inside a running operator can leave it holding freed data, so roll back on
+    # the next event-loop tick instead. The extra push makes the undo land exactly on the
+    # state saved before the script ran.
+    def rollback():
+        try:
+            bpy.ops.ed.undo_push(message="BlenderGPT: aborted script")
+            bpy.ops.ed.undo()
+            print("Rolled back the scene to before the aborted script")
+        except Exception as e:
+            print(f"Could not roll back aborted script: {e}")
+        return None
+    bpy.app.timers.register(rollback, first_interval=0.0)
+
+# Script transactions. Before a script runs, the session_uids of every datablock collection
+# are recorded and a depsgraph handler notes which existing datablocks the script updates.
+# The diff gives a change report in a few set operations, and rolling back removes just
+# the datablocks the script created (one batch_remove) and restores the transforms it
+# touched, instead of a global undo or reloading the file.
+TRANSACTION_COLLECTIONS = ("objects", "meshes", "curves", "materials", "textures", "images", "lights", "cameras",
+                           "collections", "node_groups", "actions", "worlds", "particles", "grease_pencils")
+REPORT_COLLECTIONS = ("objects", "meshes", "materials")
+
+class SceneSnapshot:
+    """Mesh vertex counts and object transforms as of the last depsgraph update.
+
+    Built once, then kept current from the depsgraph handler for just the datablocks it
+    reports as updated, so starting a transaction doesn't walk every mesh and object.
+    While a transaction runs the snapshot is frozen and keeps the values from before it."""
+    def __init__(self):
+        self.vertex_counts = None  # session_uid -> vertex count
+        self.transforms = None  # session_uid -> (object, matrix_basis, parent)
+        self.frozen = 0
+
+    def reset(self):
+        self.vertex_counts = self.transforms = None
+
+    def ensure(self):
+        if self.transforms is None:
+            with tracer.span("snapshot_build"):
+                self.vertex_counts = {mesh.session_uid: len(mesh.vertices) for mesh in bpy.data.meshes}
+                self.transforms = {obj.session_uid: (obj, obj.matrix_basis.copy(), obj.parent) for obj in bpy.data.objects}
+        return self
+
+    def refresh(self, datablocks):
+        if self.transforms is None or self.frozen:
+            return
+        for datablock in datablocks:
+            try:
+                if isinstance(datablock, bpy.types.Object):
+                    self.transforms[datablock.session_uid] = (datablock, datablock.matrix_basis.copy(), datablock.parent)
+                elif isinstance(datablock, bpy.types.Mesh):
+                    self.vertex_counts[datablock.session_uid] = len(datablock.vertices)
+            except ReferenceError:
+                pass  # Removed since the update
+
+scene_snapshot = SceneSnapshot()
+
+class SceneTransaction:
+    def __init__(self):
+        self.before = {}  # Collection -> {session_uid: name}
+        self.vertex_counts = {}
+        self.transforms = {}  # session_uid -> (object, matrix_basis, parent) of objects that existed before
+        self.updated = set()
+        self.updated_ids = {}  # session_uid -> original datablock, to refresh the snapshot afterwards
+        self.touched = set()  # Objects whose transform was updated
+        self.active = False
+
+    def _on_depsgraph_update(self, scene, depsgraph):
+        for update in depsgraph.updates:
+            original = update.id.original
+            uid = original.session_uid
+            self.updated.add(uid)
+            self.updated_ids[uid] = original
+            if update.is_updated_transform:
+                self.touched.add(uid)
+
+    def begin(self):
+        # Let the snapshot catch up with edits made since the last redraw before freezing it
+        self.flush()
+        self.before = {name: {datablock.session_uid: datablock.name for datablock in getattr(bpy.data, name)} for name in TRANSACTION_COLLECTIONS if hasattr(bpy.data, name)}
+        scene_snapshot.ensure()
+        scene_snapshot.frozen += 1
+        self.vertex_counts, self.transforms = scene_snapshot.vertex_counts, scene_snapshot.transforms
+        self.updated, self.updated_ids, self.touched = set(), {}, set()
+        bpy.app.handlers.depsgraph_update_post.append(self._on_depsgraph_update)
+        self.active = True
+        return self
+
+    def end(self):
+        if self.active:
+            bpy.app.handlers.depsgraph_update_post.remove(self._on_depsgraph_update)
+            self.active = False
+            scene_snapshot.frozen -= 1
+            scene_snapshot.refresh(self.updated_ids.values())
+
+    def flush(self):
+        # Evaluating the depsgraph runs the update handler for changes made since the last redraw
+        try:
+            bpy.context.view_layer.update()
+        except Exception as e:
+            print(f"Could not update view layer: {e}")
+
+    def changes(self):
+        """Return {collection: (created, removed {uid: name}, modified)} for collections that changed."""
+        self.flush()
+        changes = {}
+        for name, before in self.before.items():
+            created, modified, seen = [], [], set()
+            for datablock in getattr(bpy.data, name):
+                uid = datablock.session_uid
+                seen.add(uid)
+                if uid not in before:
+                    created.append(datablock)
+                elif uid in self.updated:
+                    modified.append(datablock)
+            removed = {uid: before[uid] for uid in before.keys() - seen}
+            if created or removed or modified:
+                changes[name] = (created, removed, modified)
+        return changes
+
+    def report(self):
+        """Summarize new/removed/modified objects, meshes and materials and the vertex delta."""
+        start = time.perf_counter()
+        changes = self.changes()
+        report = {}
+        for name in REPORT_COLLECTIONS:
+            created, removed, modified = changes.get(name, ([], {}, []))
+            report[name] = {"new": [d.name for d in created], "removed": list(removed.values()), "modified": [d.name for d in modified]}
+        created, removed, modified = changes.get("meshes", ([], {}, []))
+        report["vertex_delta"] = (
+            sum(len(mesh.vertices) for mesh in created)
+            - sum(self.vertex_counts.get(uid, 0) for uid in removed)
+            + sum(len(mesh.vertices) - self.vertex_counts.get(mesh.session_uid, 0) for mesh in modified)
+        )
+        report["created"] = {name: [datablock.session_uid for datablock in created] for name, (created, _, _) in changes.items() if created}
+        report["ms"] = (time.perf_counter() - start) * 1000.0
+        return report
+
+    def rollback(self):
+        """Undo the script's changes; returns a short summary of what was rolled back."""
+        with tracer.span("rollback"):
+            changes = self.changes()
+            datablocks = [datablock for created, _, _ in changes.values() for datablock in created]
+            if datablocks:
+                bpy.data.batch_remove(datablocks)
+            restored = 0
+            for uid in self.touched & self.transforms.keys():
+                obj, matrix, parent = self.transforms[uid]
+                try:
+                    obj.parent = parent
+                    obj.matrix_basis = matrix
+                    restored += 1
+                except ReferenceError:
+                    pass  # Deleted by the script
+            # Only now, so the snapshot picks up the restored transforms rather than the script's
+            self.end()
+        summary = f"removed {len(datablocks)} new datablock(s), restored {restored} transform(s)"
+        removed = sum(len(removed) for _, removed, _ in changes.values())
+        if removed:
+            summary += f"; {removed} deleted datablock(s) can't be restored"
+        print(f"Rolled back script: {summary}")
+        return summary
+
+def describe_change_report(report, limit=5):
+    """Compact one-line form, e.g. 'objects +2 (Tree, Rock), ~1 (Cube); meshes +2; vertices +1,204'."""
+    parts = []
+    for name in REPORT_COLLECTIONS:
+        changes = []
+        for sign, key in (("+", "new"), ("-", "removed"), ("~", "modified")):
+            names = report[name][key]
+            if names:
+                listed = ", ".join(names[:limit]) + (", ..." if len(names) > limit else "")
+                changes.append(f"{sign}{len(names)} ({listed})" if name == "objects" else f"{sign}{len(names)}")
+        if changes:
+            parts.append(f"{name} " + ", ".join(changes))
+    if report["vertex_delta"]:
+        parts.append(f"vertices {report['vertex_delta']:+,}")
+    return "; ".join(parts) if parts else "no datablock changes"
+
+def store_change_report(result, transaction, scene):
+    # Adds the report to an execution result and keeps it for the next request. Reporting
+    # must never change the outcome of the script, so any failure here is only logged.
+    try:
+        return _store_change_report(result, transaction, scene)
+    except Exception as e:
+        print(f"Could not build change report: {e}")
+        return result
+
+def _store_change_report(result, transaction, scene):
+    report = transaction.report()
+    text = describe_change_report(report)
+    print(f"Change report ({report['ms']:.1f} ms): {text}")
+    result["changes"] = report
+    result["message"] += f"\nChanges: {text}"
+    if result["status"] == "success":
+        param_session["last_run"] = report["created"]
+    if scene:
+        scene.blendergpt_props.last_change_report = text
+    return result
+
+def change_report_context(gpt_props):
+    return gpt_props.last_change_report if gpt_props.share_change_report else ""
+
+# Progressive execution. The script body is rewritten into a generator function that
+# yields after every top-level statement and at the start of every loop iteration
+# (outside of function definitions); bpy.app.timers then runs it in time slices so the
+# viewport updates while it builds, and it can be cancelled between slices.
+STEPS_FUNCTION = "__blendergpt_steps__"
+
+def _module_level_names(body):
+    # Names bound at module level must stay globals once the body moves into a function
+    names = set()
+    pending = list(body)
+    while pending:
+        node = pending.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+            pending.extend(node.decorator_list)
+            continue
+        if isinstance(node, (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+            continue
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, ast.alias):
+            names.add((node.asname or node.name).split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+        pending.extend(ast.iter_child_nodes(node))
+    return names
+
+class _YieldInserter(ast.NodeTransformer):
+    def visit_FunctionDef(self, node):
+        return node  # Loops inside functions run within a single step
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+    visit_ClassDef = visit_FunctionDef
+    visit_Lambda = visit_FunctionDef
+
+    def _loop(self, node):
+        self.generic_visit(node)
+        # At the top of the body so that `continue` can't skip it
+        node.body.insert(0, ast.Expr(ast.Yield(ast.Constant(None))))
+        return node
+
+    visit_For = _loop
+    visit_While = _loop
+
+def make_progressive(script):
+    """Compile a script into a code object defining a generator function that runs it in steps.
+
+    The generator yields a progress fraction after each top-level statement (and inside
+    top-level range() loops with known bounds), or None at other loop iterations."""
+    tree = ast.parse(script)
+    estimator = ScriptCostEstimator(tree)
+    total = max(1, len(tree.body))
+    body = []
+    for index, statement in enumerate(tree.body):
+        count = estimator.iterations(statement) if isinstance(statement, ast.For) else None
+        statement = _YieldInserter().visit(statement)
+        if count:
+            # Replace the leading `yield None` with a fraction that advances per iteration
+            counter = f"__blendergpt_iteration_{index}__"
+            progress = ast.parse(f"({index} + {counter} / {count}) / {total}", mode="eval").body
+            statement.body[0] = ast.Expr(ast.Yield(progress))
+            statement.body.insert(1, ast.parse(f"{counter} += 1").body[0])
+            body.append(ast.parse(f"{counter} = 0").body[0])
+        body.append(statement)
+        body.append(ast.Expr(ast.Yield(ast.Constant((index + 1) / total))))
+    names = sorted(_module_level_names(tree.body))
+    if names:
+        body.insert(0, ast.Global(names=names))
+    module = ast.parse(f"def {STEPS_FUNCTION}():\n    pass")
+    module.body[0].body = body
+    return compile(ast.fix_missing_locations(module), SCRIPT_FILENAME, "exec")
+
+def tag_redraw_all():
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+class ProgressiveRun:
+    def __init__(self, code, script, scene_name, transaction, time_limit=0.0, rollback=False, undo=False, slice_ms=16.0, note="", watchdog=None):
+        self.code = code
+        self.script = script
+        self.scene_name = scene_name
+        self.time_limit = time_limit
+        self.transaction = transaction
+        self.rollback = rollback
+        self.undo = undo  # An undo step was pushed before the run
+        self.slice = slice_ms / 1000.0
+        self.note = note
+        self.progress = 0.0
+        self.steps = None
+        self.output = StringIO()
+        self.cancelled = False
+        self.start = 0.0
+        self.ticks = 0
+        self.timer = self.tick  # bpy.app.timers tells functions apart by identity
+        # Watches each slice, so a loop that yields rarely (in a function, a comprehension,
+        # a long helper call) still can't outlast the time limit or ignore ESC
+        self.watchdog = watchdog or ExecutionWatchdog(time_limit)
+
+    def begin(self):
+        namespace = script_globals()
+        exec(self.code, namespace)
+        self.steps = namespace[STEPS_FUNCTION]()
+        self.start = self.watchdog.start = time.perf_counter()
+        bpy.app.timers.register(self.timer, first_interval=0.0)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def close(self):
+        # Stop without reporting, e.g. when the addon is unregistered mid-run
+        if bpy.app.timers.is_registered(self.timer):
+            bpy.app.timers.unregister(self.timer)
+        self.steps.close()
+        self.transaction.end()
+
+    def _scene(self):
+        return bpy.data.scenes.get(self.scene_name)
+
+    def abort(self, reason):
+        elapsed = time.perf_counter() - self.start
+        self.steps.close()
+        message = f"Execution {reason} at {self.progress * 100:.0f}% after {elapsed:.1f}s."
+        if self.rollback:
+            message += f" Rolled back: {self.transaction.rollback()}."
+        elif self.undo:
+            schedule_undo_rollback()
+            message += " The scene is being rolled back."
+        tracer.count("aborted_scripts")
+        return self.finish({"status": "error", "message": message, "output": self.output.getvalue(), "aborted": True, "rolled_back": self.rollback or self.undo})
+
+    def tick(self):
+        elapsed = time.perf_counter() - self.start
+        if self.cancelled or (self.time_limit > 0 and elapsed > self.time_limit):
+            return self.abort("cancelled" if self.cancelled else f"time limit of {self.time_limit:g}s exceeded")
+        self.ticks += 1
+        deadline = time.perf_counter() + self.slice
+        old_stdout, old_stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = self.output
+        try:
+            with tracer.span("execute_slice"):
+                self.watchdog.watch(self.code)
+                try:
+                    while time.perf_counter() < deadline:
+                        progress = next(self.steps)
+                        if progress is not None:
+                            self.progress = progress
+                finally:
+                    self.watchdog.unwatch()
+        except ScriptAborted as e:
+            sys.stdout, sys.stderr = old_stdout, old_stderr
+            self.cancelled = self.cancelled or self.watchdog.cancelled
+            reason = str(e)
+            return self.abort(f"{reason[:1].lower()}{reason[1:]} (line {self.watchdog.last_line})")
+        except StopIteration:
+            elapsed = time.perf_counter() - self.start
+            return self.finish({"status": "success", "message": f"Code executed successfully in {elapsed:.1f}s ({self.ticks} slices).{self.note}", "output": self.output.getvalue(), "script": self.script})
+        except Exception as e:
+            message = f"Error: {str(e)}\n{traceback.format_exc()}"
+            if self.rollback:
+                message += f"Rolled back: {self.transaction.rollback()}."
+            return self.finish({"status": "error", "message": message, "output": self.output.getvalue(), "rolled_back": self.rollback})
+        finally:
+            sys.stdout, sys.stderr = old_stdout, old_stderr
+        scene = self._scene()
+        if scene:
+            scene.blendergpt_props.exec_progress = self.progress * 100.0
+        tag_redraw_all()
+        return 0.001  # Hand control back so Blender can redraw before the next slice
+
+    def finish(self, result):
+        global active_progressive_run
+        active_progressive_run = None
+        scene = self._scene()
+        if not result.get("rolled_back"):
+            store_change_report(result, self.transaction, scene)
+        self.transaction.end()
+        if scene:
+            gpt_props = scene.blendergpt_props
+            gpt_props.exec_progress = 0.0
+            scene.blender_gpt_execution_result = result["message"]
+            gpt_props.status_message = describe_exec_result(result)
+            if result["status"] == "success":
+                gpt_props.last_script = self.script
+        print(result["message"])
+        tag_redraw_all()
+        return None
+
+active_progressive_run = None
+
+def describe_exec_result(exec_result):
+    if exec_result["status"] == "success":
+        return "Code executed successfully."
+    if exec_result["status"] == "running":
+        return "Running script progressively..."
+    return f"Error: {exec_result['message']}"
+
+# Execute Blender Code
+@functools.lru_cache(maxsize=16)
+def compile_script(script):
+    # Re-runs of the same source (parameter tweaks, sweeps) skip compilation
+    return compile(script, SCRIPT_FILENAME, "exec")
+
+def execute_blender_code(script, budget=None, params=None):
+    if not script:
+        return {"status": "error", "message": "No script provided."}
+
+    print(f"Executing Script:\n{script}")
+
+    with tracer.span("validate"):
+        dangerous_keywords = ["__import__", "eval", "exec", "os.", "sys.", "subprocess", "shutil", "open("]
+        for keyword in dangerous_keywords:
+            if keyword in script:
+                return {"status": "error", "message": f"Script contains unsafe keyword: {keyword}"}
+
+    budget_note = ""
+    if params and budget and budget["action"] != 'OFF':
+        # The estimator needs literal numbers: check the script with the values filled in, and
+        # if it's over budget carry on with that plain version so it can be downscaled
+        concrete = bind_script_params(script, params)
+        if budget_overrun(budget_estimate(concrete, budget), budget) < 1.0:
+            script, params = concrete, None
+    if budget and budget["action"] != 'OFF' and not params:
+        estimate = budget_estimate(script, budget)
+        factor = budget_overrun(estimate, budget)
+        if factor < 1.0:
+            print(f"Script exceeds budget: {describe_estimate(estimate)}")
+            if budget["action"] == 'ASK':
+                pending_budget_script.update(script=script, estimate=estimate)
+                return {"status": "error", "message": f"Script exceeds the scene budget ({describe_estimate(estimate)}). Use 'Downscale & Run' or 'Run Anyway'.", "estimate": estimate, "over_budget": True}
+            script, clamped = downscale_script(script, factor)
+            budget_note = " Downscaled to fit the budget: " + ", ".join(f"line {line}: {old} -> {new} iterations" for line, old, new in clamped) if clamped else " Over budget, but no loop could be clamped."
+            print(budget_note.strip())
+
+    global active_watchdog, active_progressive_run
+    try:
+        code = compile_script(script)
+    except SyntaxError as e:
+        return {"status": "error", "message": f"Error: {str(e)}\n{traceback.format_exc()}", "output": ""}
+    # Lets tracebacks show the offending source lines
+    linecache.cache[SCRIPT_FILENAME] = (len(script), None, script.splitlines(True), SCRIPT_FILENAME)
+
+    time_limit = budget.get("time_limit", 0.0) if budget else 0.0
+    progressive_code = None
+    if budget and budget.get("progressive") and not params:
+        if active_progressive_run:
+            return {"status": "error", "message": "Another script is still running. Cancel it or wait for it to finish.", "busy": True}
+        try:
+            progressive_code = make_progressive(script)
+        except SyntaxError as e:
+            print(f"Running in one step, script can't be split: {e}")  # e.g. star imports
+    watchdog = ExecutionWatchdog(time_limit)
+    # The transaction reports what the script changed; failed scripts are rolled back
+    # through it when enabled, else through undo
+    transaction = SceneTransaction().begin()
+    rollback = bool(budget and budget.get("rollback"))
+    undo = time_limit > 0 and not rollback
+    if undo:
+        try:
+            bpy.ops.ed.undo_push(message="BlenderGPT: before script")
+        except Exception as e:
+            print(f"Could not push undo step: {e}")
+
+    if progressive_code:
+        run = ProgressiveRun(progressive_code, script, bpy.context.scene.name, transaction, time_limit, rollback=rollback, undo=undo, note=budget_note, watchdog=watchdog)
+        try:
+            run.begin()
+        except Exception as e:
+            transaction.end()
+            return {"status": "error", "message": f"Error: {str(e)}\n{traceback.format_exc()}", "output": ""}
+        active_progressive_run = run
+        return {"status": "running", "message": "Running script progressively..." + budget_note, "output": "", "script": script}
 
     old_stdout, old_stderr = sys.stdout, sys.stderr
     sys.stdout = sys.stderr = output = StringIO()
+    result = None
     try:
-        exec(script, {"bpy": bpy, "random": random, "math": math})
-        return {"status": "success", "message": "Code executed successfully.", "output": output.getvalue()}
+        with tracer.span("execute", lines=script.count("\n") + 1):
+            active_watchdog = watchdog
+            watchdog.watch(code)
+            try:
+                namespace = script_globals()
+                if params:
+                    namespace[PARAMS_NAME] = dict(params)
+                exec(code, namespace)
+            finally:
+                watchdog.unwatch()
+                active_watchdog = None
+        result = {"status": "success", "message": "Code executed successfully." + budget_note, "output": output.getvalue(), "script": script}
+    except ScriptAborted as e:
+        tracer.count("aborted_scripts")
+        lines = len(script.splitlines())
+        message = f"Execution aborted: {e} after {watchdog.elapsed:.1f}s at line {watchdog.last_line}/{lines} ({watchdog.lines_executed:,} lines executed)."
+        if rollback:
+            message += f" Rolled back: {transaction.rollback()}."
+        elif undo:
+            schedule_undo_rollback()
+            message += " The scene is being rolled back."
+        print(message)
+        return {"status": "error", "message": message, "output": output.getvalue(), "aborted": True, "line": watchdog.last_line}
     except Exception as e:
-        return {"status": "error", "message": f"Error: {str(e)}\n{traceback.format_exc()}", "output": output.getvalue()}
+        message = f"Error: {str(e)}\n{traceback.format_exc()}"
+        if rollback:
+            message += f"Rolled back: {transaction.rollback()}."
+            return {"status": "error", "message": message, "output": output.getvalue(), "rolled_back": True}
+        return store_change_report({"status": "error", "message": message, "output": output.getvalue()}, transaction, bpy.context.scene)
     finally:
         sys.stdout, sys.stderr = old_stdout, old_stderr
         output.close()
+        if result is None:
+            transaction.end()
+    # The script succeeded; the report is built outside the try so it can't turn that into a failure
+    result = store_change_report(result, transaction, bpy.context.scene)
+    transaction.end()
+    return result
+
+# Automatic repair. When a script fails, only the script, the trimmed traceback and the
+# part of the scene it refers to go back to the model, which answers with find/replace
+# edits instead of a whole new script. The edits are applied locally and the script is
+# re-run on the rolled-back scene, up to a fixed number of attempts.
+def _find_lines(script, find):
+    # Locate `find` line by line ignoring indentation and trailing whitespace; returns
+    # (first line, line count) when it matches exactly one place in the script.
+    lines = script.splitlines()
+    wanted = [line.strip() for line in find.strip("\n").splitlines()]
+    if not wanted:
+        return None
+    matches = [i for i in range(len(lines) - len(wanted) + 1) if [line.strip() for line in lines[i:i + len(wanted)]] == wanted]
+    return (matches[0], len(wanted)) if len(matches) == 1 else None
+
+def apply_script_edits(script, edits):
+    """Apply [{"find": ..., "replace": ...}] edits in order and return the new script.
+
+    Each `find` must occur exactly once; a copy with different indentation is accepted
+    and the replacement re-indented to match. Raises ValueError for edits that don't apply."""
+    for number, edit in enumerate(edits, 1):
+        find, replace = edit.get("find", ""), edit.get("replace", "")
+        # Exact matches must not start halfway into a line's indentation
+        position = script.find(find) if find else -1
+        if position >= 0 and script.count(find) == 1 and (not find[0].isspace() or position == 0 or script[position - 1] == "\n"):
+            script = script.replace(find, replace, 1)
+            continue
+        located = _find_lines(script, find) if find else None
+        if located is None:
+            found = script.count(find) if find else 0
+            raise ValueError(f"Edit {number} does not apply: 'find' text {'is empty' if not find else 'not found' if not found else f'found {found} times'}")
+        start, count = located
+        lines = script.splitlines()
+        replace_lines = replace.strip("\n").splitlines()
+        indent = lines[start][:len(lines[start]) - len(lines[start].lstrip())]
+        base = replace_lines[0][:len(replace_lines[0]) - len(replace_lines[0].lstrip())] if replace_lines else ""
+        replacement = [indent + (line[len(base):] if line.startswith(base) else line.lstrip()) for line in replace_lines]
+        script = "\n".join(lines[:start] + replacement + lines[start + count:]) + "\n"
+    return script
+
+def trim_traceback(message, max_lines=12):
+    """Keep the frames inside the generated script and the exception line."""
+    lines = [line for line in message.splitlines() if line.strip() and not line.startswith("Changes:")]
+    start = next((i for i, line in enumerate(lines) if SCRIPT_FILENAME in line), None)
+    if start is not None:
+        lines = lines[:1] + lines[start:]
+    return "\n".join(lines[-max_lines:])
+
+def scene_slice(scene_info, text, limit=20):
+    """Only the scene entries mentioned by name in `text`, plus the object count."""
+    sliced = {}
+    for key, entries in scene_info.items():
+        mentioned = [entry for entry in entries if entry.get("name") and entry["name"] in text][:limit]
+        if mentioned:
+            sliced[key] = mentioned
+    sliced["object_count"] = len(scene_info.get("objects", []))
+    return sliced
+
+def request_script_repair(script, error, low_detail=False):
+    """Ask the REPAIR model to fix a failed script; returns (fixed script or "", description, usage)."""
+    scene_info = get_scene_info(low_detail=low_detail)
+    error = trim_traceback(error)
+    system = get_static_prompt(True, repair=True)
+    request_text = f"Script:\n{script}\n\nError:\n{error}"
+    model = select_model(bpy.context, 'REPAIR')
+    # The repair model may have a smaller window than the one that wrote the script
+    _, context_json, max_tokens, _ = preflight_request(model, system, [], scene_slice(scene_info, script + error), request_text)
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": f"Relevant scene: {context_json}\n\n{request_text}"},
+    ]
+    started = time.perf_counter()
+    content, usage = request_chat_completion(api_key, model, messages, max_tokens=max_tokens, temperature=0.2)
+    model_router.observe(model, time.perf_counter() - started, 'REPAIR', usage)
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.split("\n", 1)[-1].rsplit("```", 1)[0].strip()
+    try:
+        answer = json.loads(content)
+        if answer.get("edits"):
+            fixed = apply_script_edits(script, answer["edits"])
+        else:
+            fixed = answer.get("script", "")
+        description = answer.get("description", "")
+    except (ValueError, AttributeError) as e:
+        print(f"Could not apply repair: {e}")
+        return "", str(e), usage
+    # What a regular full-context regeneration would have cost, for the savings metric
+    full_tokens = count_tokens(get_static_prompt(True), model) + count_tokens(json.dumps(scene_info, separators=(",", ":")), model) + 2 * count_tokens(script, model)
+    tracer.count("repair_tokens_saved", max(0, full_tokens - usage.get("prompt_tokens", 0) - usage.get("completion_tokens", 0)))
+    return fixed, description, usage
+
+def execute_with_repair(script, budget, gpt_props):
+    """Run a script; when auto-repair is on and it fails, patch it and retry a few times."""
+    attempts = gpt_props.repair_attempts if gpt_props.auto_repair else 0
+    if attempts:
+        budget = dict(budget, rollback=True)  # Each retry starts from the scene before the script
+    exec_result = execute_blender_code(script, budget)
+    repairs, notes = 0, []
+    while exec_result["status"] == "error" and repairs < attempts and not any(exec_result.get(key) for key in ("over_budget", "aborted", "busy")):
+        repairs += 1
+        tracer.count("repair_attempts")
+        gpt_props.status_message = f"Repairing script (attempt {repairs}/{attempts})..."
+        try:
+            with tracer.span("repair"):
+                fixed, description, _ = request_script_repair(script, exec_result["message"], gpt_props.low_detail_mode)
+        except Exception as e:
+            print(f"Repair request failed: {e}")
+            break
+        if not fixed or fixed == script:
+            break
+        print(f"Repair {repairs}: {description}")
+        notes.append(description)
+        script = fixed
+        exec_result = execute_blender_code(script, budget)
+    if repairs:
+        tracer.count("repairs")
+        if exec_result["status"] == "success":
+            tracer.count("repairs_succeeded")
+            exec_result["message"] += f"\nRepaired automatically after {repairs} attempt(s): " + "; ".join(notes)
+            exec_result["repaired"] = True
+            exec_result["script"] = script
+        else:
+            exec_result["message"] += f"\nAutomatic repair gave up after {repairs} attempt(s)."
+    return exec_result
+
+# Script parameters. Numeric literals of a script (assignments, keyword arguments, range()
+# bounds, random.seed) are lifted into a `gpt_params` dict so they can be tweaked from the
+# panel and the script re-run locally without an API call. The previous run's datablocks
+# are removed first, and the compiled code is reused while only the values change. A sweep
+# renders a thumbnail per combination of swept values in a headless Blender process.
+# Literals and lookups are swapped by their source positions, so the script keeps its
+# comments and formatting.
+PARAMS_NAME = "gpt_params"
+MAX_SCRIPT_PARAMS = 16
+SKIP_PARAM_KEYWORDS = frozenset(("index", "frame"))
+MAX_SWEEP_RESULTS = 36
+
+def replace_source_spans(script, spans):
+    """Replace the source text of each (node, text) in spans, leaving the rest as written."""
+    data = script.encode("utf-8")  # AST column offsets count UTF-8 bytes
+    starts = [0]
+    for line in data.split(b"\n"):
+        starts.append(starts[-1] + len(line) + 1)
+    for node, text in sorted(spans, key=lambda span: (span[0].lineno, span[0].col_offset), reverse=True):
+        start = starts[node.lineno - 1] + node.col_offset
+        end = starts[node.end_lineno - 1] + node.end_col_offset
+        data = data[:start] + text.encode("utf-8") + data[end:]
+    return data.decode("utf-8")
+
+class _ParamExtractor(ast.NodeVisitor):
+    def __init__(self):
+        self.params = []
+        self.names = set()
+        self.spans = []
+
+    def _number(self, node):
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            value = self._number(node.operand)
+            return -value if value is not None else None
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return node.value
+        return None
+
+    def _param(self, node, name):
+        value = self._number(node)
+        if value is None or len(self.params) >= MAX_SCRIPT_PARAMS:
+            return node
+        unique, suffix = name, 2
+        while unique in self.names:
+            unique, suffix = f"{name}_{suffix}", suffix + 1
+        self.names.add(unique)
+        self.params.append({"name": unique, "value": value, "line": node.lineno})
+        self.spans.append((node, f'{PARAMS_NAME}["{unique}"]'))
+
+    def visit_Assign(self, node):
+        self.generic_visit(node)
+        if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            self._param(node.value, node.targets[0].id)
+
+    def visit_For(self, node):
+        call = node.iter
+        if isinstance(call, ast.Call) and isinstance(call.func, ast.Name) and call.func.id == "range":
+            names = ("count",) if len(call.args) == 1 else ("start", "stop", "step")
+            for arg, name in zip(call.args, names):
+                self._param(arg, f"loop{node.lineno}_{name}")
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Attribute) and node.func.attr == "seed" and node.args:
+            self._param(node.args[0], "seed")
+        for keyword in node.keywords:
+            if keyword.arg and keyword.arg not in SKIP_PARAM_KEYWORDS:
+                self._param(keyword.value, keyword.arg)
+
+def extract_script_params(script):
+    """Return (parameterized script, [{"name", "value", "line"}]) for the numeric literals of a script."""
+    extractor = _ParamExtractor()
+    extractor.visit(ast.parse(script))
+    return replace_source_spans(script, extractor.spans), extractor.params
+
+def bind_script_params(script, values):
+    """Substitute parameter values back into a parameterized script, giving a plain script."""
+    spans = [(node, repr(values[node.slice.value])) for node in ast.walk(ast.parse(script))
+             if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == PARAMS_NAME
+             and isinstance(node.slice, ast.Constant) and node.slice.value in values]
+    return replace_source_spans(script, spans)
+
+def param_values(gpt_props):
+    return {param.name: param.int_value if param.is_int else param.float_value for param in gpt_props.script_params}
+
+def remove_datablocks(created):
+    """Remove the datablocks listed as {collection: [session_uid]}; returns how many were removed."""
+    datablocks = []
+    for name, uids in created.items():
+        uids = set(uids)
+        datablocks += [datablock for datablock in getattr(bpy.data, name) if datablock.session_uid in uids]
+    if datablocks:
+        bpy.data.batch_remove(datablocks)
+    return len(datablocks)
+
+param_session = {"created": {}}  # Datablocks of the last parameterized run, replaced by the next one
+
+def run_with_params(scene, values=None):
+    """Replace the last run of the parameterized script with a run using the panel's values."""
+    gpt_props = scene.blendergpt_props
+    values = values if values is not None else param_values(gpt_props)
+    removed = remove_datablocks(param_session["created"])
+    param_session["created"] = {}
+    budget = dict(get_budget(gpt_props), progressive=False)  # The datablocks it creates must be known right away
+    with tracer.span("param_run", params=len(values)):
+        exec_result = execute_blender_code(gpt_props.param_script, budget, params=values)
+    param_session["created"] = exec_result.get("changes", {}).get("created", {})
+    if exec_result["status"] == "success":
+        gpt_props.last_script = bind_script_params(exec_result["script"], values)  # As run, if downscaled
+        exec_result["message"] += f"\nReplaced {removed} datablock(s) of the previous run."
+    scene.blender_gpt_execution_result = exec_result["message"]
+    gpt_props.status_message = describe_exec_result(exec_result)
+    return exec_result
+
+def _rerun_params_timer():
+    scene = bpy.context.scene
+    if scene and scene.blendergpt_props.param_script:
+        run_with_params(scene)
+        tag_redraw_all()
+    return None
+
+def schedule_param_rerun():
+    # Dragging a value fires an update per step; run once it settles
+    if bpy.app.timers.is_registered(_rerun_params_timer):
+        bpy.app.timers.unregister(_rerun_params_timer)
+    bpy.app.timers.register(_rerun_params_timer, first_interval=0.25)
+
+def sweep_grid(gpt_props):
+    """Parameter sets for a sweep: every combination of the swept parameters' steps."""
+    base = param_values(gpt_props)
+    axes = []
+    for param in gpt_props.script_params:
+        if not param.sweep:
+            continue
+        steps = gpt_props.sweep_steps
+        values = [param.sweep_min + (param.sweep_max - param.sweep_min) * i / (steps - 1) for i in range(steps)]
+        axes.append((param.name, [int(round(v)) for v in values] if param.is_int else [round(v, 4) for v in values]))
+    grid = [dict(base)]
+    for name, values in axes:
+        grid = [dict(entry, **{name: value}) for entry in grid for value in values]
+    return grid, [name for name, _ in axes]
+
+def render_thumbnail(scene, path, size):
+    render = scene.render
+    render.engine = 'BLENDER_WORKBENCH'
+    scene.display.shading.color_type = 'MATERIAL'
+    aspect = render.resolution_y / max(1, render.resolution_x)
+    render.resolution_x, render.resolution_y = size, max(1, int(size * aspect))
+    render.resolution_percentage = 100
+    render.image_settings.file_format = 'PNG'
+    render.filepath = path
+    if scene.camera is None:
+        camera = bpy.data.objects.new("SweepCamera", bpy.data.cameras.new("SweepCamera"))
+        scene.collection.objects.link(camera)
+        camera.location = (15.0, -15.0, 11.0)
+        camera.rotation_euler = (math.radians(62), 0.0, math.radians(45))
+        scene.camera = camera
+    bpy.ops.render.render(write_still=True)
+
+def run_param_sweep_job(job_path):
+    """Entry point of the headless sweep worker: run each parameter set on a fresh copy of the scene and render it."""
+    with open(job_path, encoding="utf-8") as f:
+        job = json.load(f)
+    manifest = os.path.join(job["output"], "results.json")
+    results = []
+    for index, values in enumerate(job["grid"]):
+        if index:
+            bpy.ops.wm.revert_mainfile()
+        # The copy still holds the main process's last run of this script
+        for name, names in job["remove"].items():
+            collection = getattr(bpy.data, name)
+            datablocks = [collection[n] for n in names if n in collection]
+            if datablocks:
+                bpy.data.batch_remove(datablocks)
+        exec_result = execute_blender_code(job["script"], params=values)
+        entry = {"values": values, "image": "", "error": ""}
+        if exec_result["status"] == "success":
+            entry["image"] = os.path.join(job["output"], f"sweep_{index:03d}.png")
+            try:
+                render_thumbnail(bpy.context.scene, entry["image"], job["size"])
+            except Exception as e:
+                entry["image"], entry["error"] = "", f"Render failed: {e}"
+        else:
+            entry["error"] = exec_result["message"].splitlines()[0]
+        results.append(entry)
+        with open(manifest + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(results, f)
+        os.replace(manifest + ".tmp", manifest)
+
+class ParamSweep:
+    def __init__(self):
+        self.process = None
+        self.folder = ""
+        self.axes = []
+        self.total = 0
+        self.results = []
+        self.previews = None
+        self.started = 0.0
+        self.timer = self.poll  # bpy.app.timers tells functions apart by identity
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self, script, grid, axes, size, remove):
+        """Save a copy of the scene and launch the worker; returns an error message or ""."""
+        self.cancel()
+        self.remove_folder()
+        self.folder = tempfile.mkdtemp(prefix="blendergpt_sweep_")
+        blend = os.path.join(self.folder, "scene.blend")
+        try:
+            bpy.ops.wm.save_as_mainfile(filepath=blend, copy=True)
+        except Exception as e:
+            self.remove_folder()
+            return f"Could not save a copy of the scene: {e}"
+        job_path = os.path.join(self.folder, "job.json")
+        with open(job_path, "w", encoding="utf-8") as f:
+            json.dump({"script": script, "grid": grid, "size": size, "remove": remove, "output": self.folder}, f)
+        expression = f"import addon_utils, sys; addon_utils.enable({__name__!r}, default_set=False); sys.modules[{__name__!r}].run_param_sweep_job({job_path!r})"
+        log = open(os.path.join(self.folder, "worker.log"), "w", encoding="utf-8")
+        self.process = subprocess.Popen([bpy.app.binary_path, "--background", blend, "--python-expr", expression], stdout=log, stderr=subprocess.STDOUT)
+        log.close()
+        self.axes, self.total, self.results = axes, len(grid), []
+        if self.previews is not None:
+            self.previews.clear()
+        self.started = time.perf_counter()
+        tracer.count("param_sweeps")
+        if not bpy.app.timers.is_registered(self.timer):
+            bpy.app.timers.register(self.timer, first_interval=0.5)
+        return ""
+
+    def _read_results(self):
+        try:
+            with open(os.path.join(self.folder, "results.json"), encoding="utf-8") as f:
+                self.results = json.load(f)
+        except (OSError, ValueError):
+            pass  # Not written yet, or mid-replace
+
+    def poll(self):
+        self._read_results()
+        self._load_previews()
+        tag_redraw_all()
+        if self.running:
+            return 0.5
+        if self.process is not None:
+            print(f"Parameter sweep finished: {len(self.results)}/{self.total} in {time.perf_counter() - self.started:.1f}s")
+            if len(self.results) < self.total:
+                try:
+                    with open(os.path.join(self.folder, "worker.log"), encoding="utf-8", errors="replace") as f:
+                        print("Sweep worker log:\n" + f.read()[-4000:])
+                except OSError:
+                    pass
+            self.process = None
+        # The previews hold the thumbnails now; the scene copy and renders can go
+        self.remove_folder()
+        return None
+
+    def _load_previews(self):
+        import bpy.utils.previews
+        if self.previews is None:
+            self.previews = bpy.utils.previews.new()
+        for index, entry in enumerate(self.results):
+            if entry["image"] and str(index) not in self.previews and os.path.exists(entry["image"]):
+                preview = self.previews.load(str(index), entry["image"], 'IMAGE')
+                preview.image_size[:]  # Read the file now rather than on first draw, it gets deleted
+
+    def icon(self, index):
+        if self.previews is None or str(index) not in self.previews:
+            return 0
+        return self.previews[str(index)].icon_id
+
+    def remove_folder(self):
+        if self.folder:
+            shutil.rmtree(self.folder, ignore_errors=True)
+            self.folder = ""
+
+    def cancel(self):
+        if self.running:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)  # Release its files before they're removed
+            except subprocess.TimeoutExpired:
+                pass
+        self.process = None
+        if bpy.app.timers.is_registered(self.timer):
+            bpy.app.timers.unregister(self.timer)
+        self.remove_folder()
+
+    def close(self):
+        self.cancel()
+        if self.previews is not None:
+            import bpy.utils.previews
+            bpy.utils.previews.remove(self.previews)
+            self.previews = None
+
+param_sweep = ParamSweep()
 
 # Operators
 class BLENDER_GPT_OT_GenerateCode(bpy.types.Operator):
@@ -655,6 +4381,8 @@ class BLENDER_GPT_OT_GenerateCode(bpy.types.Operator):
     bl_label = "Generate Code"
     bl_description = "Generate a Blender script based on the prompt"
 
+    use_cache: bpy.props.BoolProperty(name="Use Cache", default=True, options={'SKIP_SAVE'}, description="Offer a cached script for a similar earlier prompt instead of generating one")
+
     def execute(self, context):
         prompt = context.scene.blender_gpt_prompt.strip()
         if not prompt:
@@ -669,28 +4397,52 @@ class BLENDER_GPT_OT_GenerateCode(bpy.types.Operator):
         context.area.tag_redraw()
 
         scene_info = get_scene_info(low_detail=gpt_props.low_detail_mode)
+        gpt_props.cached_prompt = ""
+        if gpt_props.use_prompt_cache and self.use_cache:
+            entry, score = prompt_cache.lookup(prompt, scene_info)
+            if entry:
+                # Offer it without running it; the user executes it or regenerates
+                context.scene.blender_gpt_generated_code = entry["script"]
+                gpt_props.cached_prompt = entry["prompt"]
+                gpt_props.status_message = f"Found a cached script for a similar request ({score:.0%} similar). Execute it or regenerate."
+                self.report({'INFO'}, "Cached script found")
+                context.area.tag_redraw()
+                return {'FINISHED'}
+
         # Pass force_script=True to ensure a script is always generated in the Generate Scene section
         result = generate_blender_commands(
             prompt,
             api_key,
-            context.preferences.addons[__name__].preferences.gpt_model,
+            select_model(context, 'SCENE'),
             scene_info,
             gpt_props.chat_history,
-            force_script=True
+            force_script=True,
+            request_class='SCENE',
+            recipe_mode=gpt_props.recipe_mode,
+            change_report=change_report_context(gpt_props)
         )
 
         if result["script"]:
             context.scene.blender_gpt_generated_code = result["script"]
-            exec_result = execute_blender_code(result["script"])
-            if exec_result["status"] == "success":
+            budget = get_budget(gpt_props)
+            budget["progressive"] = budget["progressive"] and gpt_props.iterations == 0
+            exec_result = execute_with_repair(result["script"], budget, gpt_props)
+            if exec_result.get("repaired"):
+                context.scene.blender_gpt_generated_code = exec_result["script"]
+            if exec_result["status"] == "running":
+                gpt_props.status_message = describe_exec_result(exec_result)
+                self.report({'INFO'}, "Initial commands generated, running progressively")
+            elif exec_result["status"] == "success":
                 gpt_props.status_message = "Initial script executed successfully."
-                gpt_props.last_script = result["script"]
+                gpt_props.last_script = exec_result.get("script", result["script"])
+                if gpt_props.use_prompt_cache:
+                    prompt_cache.add(prompt, gpt_props.last_script, result["description"], scene_info)
                 if gpt_props.iterations > 0:
                     gpt_props.status_message = "Starting iterative generation..."
                     bpy.ops.blendergpt.iterative_generation(
                         initial_prompt=prompt,
                         api_key=api_key,
-                        model=context.preferences.addons[__name__].preferences.gpt_model,
+                        model=select_model(context, 'ITERATION'),
                         iterations=gpt_props.iterations
                     )
                 self.report({'INFO'}, "Initial commands generated and executed")
@@ -720,11 +4472,14 @@ class BLENDER_GPT_OT_ExecuteCode(bpy.types.Operator):
         gpt_props.status_message = "Executing script..."
         context.area.tag_redraw()
 
-        exec_result = execute_blender_code(code)
+        exec_result = execute_with_repair(code, get_budget(gpt_props), gpt_props)
+        gpt_props.cached_prompt = ""
+        if exec_result.get("repaired"):
+            context.scene.blender_gpt_generated_code = exec_result["script"]
         context.scene.blender_gpt_execution_result = exec_result["message"]
-        gpt_props.status_message = "Code executed successfully." if exec_result["status"] == "success" else f"Error: {exec_result['message']}"
-        gpt_props.last_script = code
-        self.report({'INFO' if exec_result["status"] == "success" else 'ERROR'}, gpt_props.status_message)
+        gpt_props.status_message = describe_exec_result(exec_result)
+        gpt_props.last_script = exec_result.get("script", code)
+        self.report({'ERROR' if exec_result["status"] == "error" else 'INFO'}, gpt_props.status_message)
         context.area.tag_redraw()
         return {'FINISHED'}
 
@@ -742,9 +4497,14 @@ class BLENDERGPT_OT_SendMessage(bpy.types.Operator):
             print("No message entered")
             return {'CANCELLED'}
 
+        # A new turn makes any prefetched follow-up answer obsolete
+        prefetcher.discard()
+        gpt_props.follow_up = ""
+        reference_script = ""
+        if gpt_props.refine_scripts:
+            reference_script = next((msg.script for msg in reversed(gpt_props.chat_history) if msg.role != "USER" and msg.script), "")
         # Add user message to chat history
-        msg = gpt_props.chat_history.add()
-        msg.from_json({"role": "USER", "msg_content": prompt})
+        append_chat_message(gpt_props, "USER", prompt)
         gpt_props.status_message = "Generating response..."
         print(f"User message added: {prompt}")
         context.area.tag_redraw()
@@ -754,16 +4514,23 @@ class BLENDERGPT_OT_SendMessage(bpy.types.Operator):
         result = generate_blender_commands(
             prompt,
             api_key,
-            context.preferences.addons[__name__].preferences.gpt_model,
+            select_model(context, 'CHAT'),
             scene_info,
             gpt_props.chat_history,
-            force_script=False
+            force_script=False,
+            request_class='CHAT',
+            recipe_mode=gpt_props.recipe_mode,
+            change_report=change_report_context(gpt_props),
+            reference_script=reference_script
         )
-        msg = gpt_props.chat_history.add()
-        msg.from_json({"role": "assistant", "msg_content": result["description"], "script": result["script"]})
+        append_chat_message(gpt_props, "assistant", result["description"], result["script"])
         print(f"Assistant response: {result['description']}")
         if result["script"]:
             print(f"Generated Script:\n{result['script']}")
+        gpt_props.follow_up = result.get("follow_up", "") if not result["description"].startswith("Error") else ""
+        if not result["script"]:
+            # Nothing to execute first; otherwise the prefetch starts once the script has run
+            start_follow_up_prefetch(context)
 
         # Clear input and update status
         gpt_props.chat_input = ""
@@ -772,6 +4539,30 @@ class BLENDERGPT_OT_SendMessage(bpy.types.Operator):
         print("Message sent and UI updated")
         return {'FINISHED'}
 
+class BLENDERGPT_OT_AcceptFollowUp(bpy.types.Operator):
+    bl_idname = "blendergpt.accept_follow_up"
+    bl_label = "Accept Follow-up"
+    bl_description = "Answer yes to the suggested follow-up"
+
+    def execute(self, context):
+        gpt_props = context.scene.blendergpt_props
+        if not gpt_props.follow_up:
+            return {'CANCELLED'}
+        prompt = follow_up_prompt(gpt_props.follow_up)
+        result = prefetcher.take(prompt, get_scene_info(low_detail=gpt_props.low_detail_mode))
+        if result is None:
+            # Not prefetched (or no longer valid): ask now
+            gpt_props.chat_input = prompt
+            return bpy.ops.blendergpt.send_message()
+        append_chat_message(gpt_props, "USER", prompt)
+        append_chat_message(gpt_props, "assistant", result["description"], result["script"])
+        gpt_props.follow_up = result.get("follow_up", "")
+        if not result["script"]:
+            start_follow_up_prefetch(context)
+        gpt_props.status_message = "Response generated (prefetched)."
+        context.area.tag_redraw()
+        return {'FINISHED'}
+
 class BLENDERGPT_OT_ClearHistory(bpy.types.Operator):
     bl_idname = "blendergpt.clear_history"
     bl_label = "Clear History"
@@ -780,6 +4571,13 @@ class BLENDERGPT_OT_ClearHistory(bpy.types.Operator):
     def execute(self, context):
         gpt_props = context.scene.blendergpt_props
         gpt_props.chat_history.clear()
+        gpt_props.follow_up = ""
+        prefetcher.discard()
+        # The old session file is kept on disk; new messages go to a fresh session
+        gpt_props.session_id = ""
+        gpt_props.chat_offset = 0
+        chat_search_results.clear()
+        older_chat_messages["messages"].clear()
         gpt_props.status_message = "Chat history cleared."
         context.area.tag_redraw()
         return {'FINISHED'}
@@ -792,17 +4590,54 @@ class BLENDERGPT_OT_CopyChat(bpy.types.Operator):
     def execute(self, context):
         gpt_props = context.scene.blendergpt_props
         chat_text = ""
-        for msg in gpt_props.chat_history:
-            role = "Assistant" if msg.role != "USER" else "USER"
-            chat_text += f"{role}: {msg.msg_content}\n"
-            if msg.script:
-                chat_text += f"Generated Script:\n{msg.script}\n"
+        if gpt_props.session_id:
+            messages = chat_store.load_range(gpt_props.session_id, 0, chat_store.count(gpt_props.session_id))
+        else:
+            messages = [{"role": msg.role, "msg_content": msg.msg_content, "script": msg.script} for msg in gpt_props.chat_history]
+        for msg in messages:
+            role = "Assistant" if msg["role"] != "USER" else "USER"
+            chat_text += f"{role}: {msg['msg_content']}\n"
+            if msg["script"]:
+                chat_text += f"Generated Script:\n{msg['script']}\n"
         context.window_manager.clipboard = chat_text.strip()
         gpt_props.status_message = "Chat history copied to clipboard."
         self.report({'INFO'}, "Chat history copied")
         context.area.tag_redraw()
         return {'FINISHED'}
 
+class BLENDERGPT_OT_LoadOlderMessages(bpy.types.Operator):
+    bl_idname = "blendergpt.load_older_messages"
+    bl_label = "Load Older Messages"
+    bl_description = "Show older messages of this session from disk (they aren't sent as context)"
+
+    def execute(self, context):
+        gpt_props = context.scene.blendergpt_props
+        older = loaded_older_messages(gpt_props)
+        end = older[0][0] if older else gpt_props.chat_offset
+        if not gpt_props.session_id or end <= 0:
+            return {'CANCELLED'}
+        start = max(0, end - gpt_props.chat_window_size)
+        records = chat_store.load_range(gpt_props.session_id, start, end)
+        older[:0] = enumerate(records, start)
+        gpt_props.status_message = f"Loaded {len(records)} older message(s)."
+        context.area.tag_redraw()
+        return {'FINISHED'}
+
+class BLENDERGPT_OT_SearchChat(bpy.types.Operator):
+    bl_idname = "blendergpt.search_chat"
+    bl_label = "Search Chat"
+    bl_description = "Search the full chat session on disk"
+
+    def execute(self, context):
+        gpt_props = context.scene.blendergpt_props
+        chat_search_results.clear()
+        query = gpt_props.chat_search.strip()
+        if query:
+            chat_search_results.extend(chat_store.search(gpt_props.session_id, query))
+        gpt_props.status_message = f"Found {len(chat_search_results)} message(s)." if query else "Search cleared."
+        context.area.tag_redraw()
+        return {'FINISHED'}
+
 class BLENDER_GPT_OT_ConfigureAPIKey(bpy.types.Operator):
     bl_idname = "blendergpt.configure_api_key"
     bl_label = "Configure API Key"
@@ -888,6 +4723,175 @@ class BLENDERGPT_OT_PreviewScript(bpy.types.Operator):
 # Note: The BLENDERGPT_OT_EditScript operator is commented out in the original script.
 # If you want to re-enable it, you can uncomment it and use it as is, or let me know if you'd like to improve it.
 
+class BLENDERGPT_OT_RunPendingScript(bpy.types.Operator):
+    bl_idname = "blendergpt.run_pending_script"
+    bl_label = "Run Over-Budget Script"
+    bl_description = "Run the script that was stopped by the scene budget"
+
+    downscale: bpy.props.BoolProperty(name="Downscale", default=True, description="Clamp loop counts to fit the budget first")
+
+    def execute(self, context):
+        gpt_props = context.scene.blendergpt_props
+        script = pending_budget_script["script"]
+        if not script:
+            self.report({'WARNING'}, "No script is waiting.")
+            return {'CANCELLED'}
+        pending_budget_script.update(script="", estimate=None)
+        budget = get_budget(gpt_props)
+        budget["action"] = 'CLAMP' if self.downscale else 'OFF'
+        gpt_props.status_message = "Executing script..."
+        exec_result = execute_with_repair(script, budget, gpt_props)
+        context.scene.blender_gpt_execution_result = exec_result["message"]
+        gpt_props.status_message = describe_exec_result(exec_result)
+        gpt_props.last_script = exec_result.get("script", script)
+        self.report({'ERROR' if exec_result["status"] == "error" else 'INFO'}, gpt_props.status_message)
+        context.area.tag_redraw()
+        return {'FINISHED'}
+
+class BLENDERGPT_OT_ExtractParams(bpy.types.Operator):
+    bl_idname = "blendergpt.extract_params"
+    bl_label = "Extract Parameters"
+    bl_description = "Turn the numbers in the last executed script into adjustable parameters"
+
+    def execute(self, context):
+        gpt_props = context.scene.blendergpt_props
+        script = gpt_props.last_script
+        if not script:
+            self.report({'WARNING'}, "Execute a script first.")
+            return {'CANCELLED'}
+        try:
+            param_script, params = extract_script_params(script)
+        except SyntaxError as e:
+            self.report({'ERROR'}, f"Could not parse the script: {str(e)}")
+            return {'CANCELLED'}
+        if not params:
+            self.report({'WARNING'}, "No adjustable numbers found in the script.")
+            return {'CANCELLED'}
+        param_session["loading"] = True
+        try:
+            gpt_props.script_params.clear()
+            for entry in params:
+                param = gpt_props.script_params.add()
+                param.name = entry["name"]
+                param.is_int = isinstance(entry["value"], int)
+                if param.is_int:
+                    param.int_value = entry["value"]
+                else:
+                    param.float_value = entry["value"]
+                low, high = sorted((entry["value"] * 0.5, entry["value"] * 1.5)) if entry["value"] else (0.0, 1.0)
+                param.sweep_min, param.sweep_max = low, high
+        finally:
+            param_session["loading"] = False
+        gpt_props.param_script = param_script
+        # The next parameterized run replaces what the last script created
+        param_session["created"] = param_session.get("last_run", {})
+        gpt_props.status_message = f"Extracted {len(params)} parameter(s)."
+        context.area.tag_redraw()
+        return {'FINISHED'}
+
+class BLENDERGPT_OT_RunParams(bpy.types.Operator):
+    bl_idname = "blendergpt.run_params"
+    bl_label = "Re-run with Parameters"
+    bl_description = "Replace the last run of the script with one using the current parameter values"
+
+    def execute(self, context):
+        if not context.scene.blendergpt_props.param_script:
+            return {'CANCELLED'}
+        exec_result = run_with_params(context.scene)
+        self.report({'ERROR' if exec_result["status"] == "error" else 'INFO'}, context.scene.blendergpt_props.status_message)
+        context.area.tag_redraw()
+        return {'FINISHED'}
+
+class BLENDERGPT_OT_RunParamSweep(bpy.types.Operator):
+    bl_idname = "blendergpt.run_param_sweep"
+    bl_label = "Parameter Sweep"
+    bl_description = "Render a thumbnail for each combination of the swept parameter values in a background Blender"
+
+    def execute(self, context):
+        gpt_props = context.scene.blendergpt_props
+        grid, axes = sweep_grid(gpt_props)
+        if not gpt_props.param_script or not axes:
+            self.report({'WARNING'}, "Enable Sweep on one or more parameters first.")
+            return {'CANCELLED'}
+        if len(grid) > MAX_SWEEP_RESULTS:
+            self.report({'ERROR'}, f"{len(grid)} combinations is more than {MAX_SWEEP_RESULTS}: sweep fewer parameters or use fewer steps.")
+            return {'CANCELLED'}
+        # Session UIDs don't survive saving, so the worker finds the last run by name
+        remove = {}
+        for name, uids in param_session["created"].items():
+            uids = set(uids)
+            names = [datablock.name for datablock in getattr(bpy.data, name) if datablock.session_uid in uids]
+            if names:
+                remove[name] = names
+        error = param_sweep.start(gpt_props.param_script, grid, axes, gpt_props.sweep_size, remove)
+        if error:
+            self.report({'ERROR'}, error)
+            return {'CANCELLED'}
+        gpt_props.status_message = f"Rendering {len(grid)} sweep thumbnail(s) in the background..."
+        context.area.tag_redraw()
+        return {'FINISHED'}
+
+class BLENDERGPT_OT_CancelParamSweep(bpy.types.Operator):
+    bl_idname = "blendergpt.cancel_param_sweep"
+    bl_label = "Cancel Sweep"
+    bl_description = "Stop the running parameter sweep"
+
+    def execute(self, context):
+        param_sweep.cancel()
+        context.scene.blendergpt_props.status_message = "Parameter sweep cancelled."
+        return {'FINISHED'}
+
+class BLENDERGPT_OT_ApplySweepResult(bpy.types.Operator):
+    bl_idname = "blendergpt.apply_sweep_result"
+    bl_label = "Use Sweep Result"
+    bl_description = "Re-run the script in this scene with the values of this thumbnail"
+
+    index: bpy.props.IntProperty(name="Index", default=0)
+
+    def execute(self, context):
+        if not 0 <= self.index < len(param_sweep.results):
+            return {'CANCELLED'}
+        gpt_props = context.scene.blendergpt_props
+        values = param_sweep.results[self.index]["values"]
+        param_session["loading"] = True
+        try:
+            for param in gpt_props.script_params:
+                if param.name in values:
+                    setattr(param, "int_value" if param.is_int else "float_value", values[param.name])
+        finally:
+            param_session["loading"] = False
+        run_with_params(context.scene)
+        context.area.tag_redraw()
+        return {'FINISHED'}
+
+class BLENDERGPT_OT_ClearPromptCache(bpy.types.Operator):
+    bl_idname = "blendergpt.clear_prompt_cache"
+    bl_label = "Clear Prompt Cache"
+    bl_description = "Forget all cached prompt/script pairs"
+
+    def execute(self, context):
+        try:
+            prompt_cache.clear()
+        except OSError as e:
+            self.report({'ERROR'}, f"Error clearing prompt cache: {str(e)}")
+            return {'CANCELLED'}
+        context.scene.blendergpt_props.cached_prompt = ""
+        context.scene.blendergpt_props.status_message = "Prompt cache cleared."
+        return {'FINISHED'}
+
+class BLENDERGPT_OT_CancelExecution(bpy.types.Operator):
+    bl_idname = "blendergpt.cancel_execution"
+    bl_label = "Cancel Execution"
+    bl_description = "Stop the progressively running script before its next time slice"
+
+    def execute(self, context):
+        if not active_progressive_run:
+            self.report({'WARNING'}, "No script is running.")
+            return {'CANCELLED'}
+        active_progressive_run.cancel()
+        context.scene.blendergpt_props.status_message = "Cancelling script..."
+        return {'FINISHED'}
+
 # Quick Action Operators
 class BLENDERGPT_OT_QuickAddCube(bpy.types.Operator):
     bl_idname = "blendergpt.quick_add_cube"
@@ -961,6 +4965,43 @@ class BlenderGPTAddonPreferences(bpy.types.AddonPreferences):
         description="Enter a custom model name"
     )
 
+    # Backends
+    openai_base_url: bpy.props.StringProperty(
+        name="OpenAI Base URL",
+        description="Base URL of an OpenAI-compatible API (e.g. a proxy or vLLM server). Blank uses the OpenAI cloud endpoint",
+        default=""
+    )
+    openai_timeout: bpy.props.FloatProperty(name="Timeout", default=30.0, min=1.0, max=600.0, unit='TIME_ABSOLUTE', description="Request timeout for the OpenAI backend")
+    openai_max_concurrency: bpy.props.IntProperty(name="Max Concurrent", default=4, min=1, max=64, description="Maximum requests in flight to the OpenAI backend")
+    local_url: bpy.props.StringProperty(
+        name="Local Server URL",
+        description="URL of a local llama.cpp/vLLM server with an OpenAI-style /v1/chat/completions endpoint. Use it by entering a model as 'local:<name>'",
+        default="http://localhost:8080"
+    )
+    local_timeout: bpy.props.FloatProperty(name="Timeout", default=120.0, min=1.0, max=1800.0, unit='TIME_ABSOLUTE', description="Request timeout for the local backend")
+    local_max_concurrency: bpy.props.IntProperty(name="Max Concurrent", default=1, min=1, max=64, description="Maximum requests in flight to the local backend")
+
+    # Model router
+    fallback_model: bpy.props.StringProperty(
+        name="Fallback Model",
+        description="Model used when a request times out or the preferred model misses its latency/cost target (blank disables fallback)",
+        default="gpt-4o-mini-2024-07-18"
+    )
+    use_model_router: bpy.props.BoolProperty(
+        name="Route Models per Request",
+        description="Pick a model per request class based on latency and cost targets",
+        default=False
+    )
+    chat_model: bpy.props.StringProperty(name="Chat Model", description="Model for chat questions (blank uses the GPT Model)")
+    scene_model: bpy.props.StringProperty(name="Scene Model", description="Model for full scene generation (blank uses the GPT Model)")
+    iteration_model: bpy.props.StringProperty(name="Iteration Model", description="Model for small iterative edits (blank uses the GPT Model)")
+    repair_model: bpy.props.StringProperty(name="Repair Model", description="Model for JSON and script repair requests (blank uses the GPT Model)")
+    chat_latency_target: bpy.props.FloatProperty(name="Chat Latency Target", default=8.0, min=0.0, unit='TIME_ABSOLUTE', description="Switch to the fallback model when the median latency exceeds this (0 disables)")
+    scene_latency_target: bpy.props.FloatProperty(name="Scene Latency Target", default=30.0, min=0.0, unit='TIME_ABSOLUTE')
+    iteration_latency_target: bpy.props.FloatProperty(name="Iteration Latency Target", default=15.0, min=0.0, unit='TIME_ABSOLUTE')
+    repair_latency_target: bpy.props.FloatProperty(name="Repair Latency Target", default=10.0, min=0.0, unit='TIME_ABSOLUTE')
+    max_cost_per_request: bpy.props.FloatProperty(name="Max Cost per Request ($)", default=0.0, min=0.0, precision=4, description="Switch to the fallback model when the estimated cost exceeds this (0 disables)")
+
     def draw(self, context):
         layout = self.layout
         layout.label(text="BlenderGPT Preferences", icon='SETTINGS')
@@ -968,18 +5009,47 @@ class BlenderGPTAddonPreferences(bpy.types.AddonPreferences):
         layout.prop(self, "gpt_model")
         if self.gpt_model == "custom":
             layout.prop(self, "custom_gpt_model")
+        layout.prop(self, "fallback_model")
+
+        box = layout.box()
+        box.label(text="Backends", icon='WORLD')
+        box.prop(self, "openai_base_url")
+        row = box.row(align=True)
+        row.prop(self, "openai_timeout")
+        row.prop(self, "openai_max_concurrency")
+        box.prop(self, "local_url")
+        row = box.row(align=True)
+        row.prop(self, "local_timeout")
+        row.prop(self, "local_max_concurrency")
+        box.label(text="Models named 'local:<name>' are sent to the local server.", icon='INFO')
+
+        box = layout.box()
+        box.prop(self, "use_model_router")
+        if self.use_model_router:
+            for request_class in REQUEST_CLASSES:
+                name = request_class.lower()
+                row = box.row(align=True)
+                row.prop(self, f"{name}_model")
+                row.prop(self, f"{name}_latency_target", text="Target")
+                latency = model_router.rolling_latency(getattr(self, f"{name}_model").strip() or resolve_model(self))
+                row.label(text=f"{latency:.1f}s" if latency is not None else "-")
+            box.prop(self, "max_cost_per_request")
 
 # Registration
 classes = [
     Message,
+    ScriptParam,
     BlenderGPTChatProps,
     BlenderGPTAddonPreferences,
     BLENDER_GPT_PT_Panel,
+    BLENDER_GPT_PT_Metrics,
     BLENDER_GPT_OT_GenerateCode,
     BLENDER_GPT_OT_ExecuteCode,
     BLENDERGPT_OT_SendMessage,
     BLENDERGPT_OT_ClearHistory,
     BLENDERGPT_OT_CopyChat,
+    BLENDERGPT_OT_LoadOlderMessages,
+    BLENDERGPT_OT_SearchChat,
     BLENDER_GPT_OT_ConfigureAPIKey,
     BLENDERGPT_OT_CopyCommands,
     BLENDERGPT_OT_ClearCommands,
@@ -993,7 +5063,18 @@ classes = [
     BLENDERGPT_OT_QuickClearScene,
     BLENDERGPT_OT_ShowFullMessage,
     BLENDERGPT_OT_CopyMessage,
-    BLENDERGPT_OT_ExecuteChatScript
+    BLENDERGPT_OT_ExecuteChatScript,
+    BLENDERGPT_OT_ExportMetrics,
+    BLENDERGPT_OT_RunPendingScript,
+    BLENDERGPT_OT_CancelExecution,
+    BLENDERGPT_OT_ClearPromptCache,
+    BLENDERGPT_OT_AcceptFollowUp,
+    BLENDERGPT_OT_ExtractParams,
+    BLENDERGPT_OT_RunParams,
+    BLENDERGPT_OT_RunParamSweep,
+    BLENDERGPT_OT_CancelParamSweep,
+    BLENDERGPT_OT_ApplySweepResult,
+    BLENDERGPT_OT_ResetMetrics
 ]
 
 def register():
@@ -1003,8 +5084,32 @@ def register():
     bpy.types.Scene.blender_gpt_generated_code = bpy.props.StringProperty(name="Generated Commands", default="")
     bpy.types.Scene.blender_gpt_execution_result = bpy.props.StringProperty(name="Execution Result", default="")
     bpy.types.Scene.blendergpt_props = bpy.props.PointerProperty(type=BlenderGPTChatProps)
+    bpy.app.handlers.depsgraph_update_post.append(invalidate_scene_caches)
+    for handlers in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        handlers.append(reset_scene_snapshot)
+    bpy.app.handlers.load_post.append(apply_scene_settings)
+    # The scene isn't reachable while add-ons register at startup
+    bpy.app.timers.register(apply_scene_settings, first_interval=0.0)
 
 def unregister():
+    if invalidate_scene_caches in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(invalidate_scene_caches)
+    for handlers in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        if reset_scene_snapshot in handlers:
+            handlers.remove(reset_scene_snapshot)
+    if apply_scene_settings in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(apply_scene_settings)
+    if bpy.app.timers.is_registered(apply_scene_settings):
+        bpy.app.timers.unregister(apply_scene_settings)
+    # Timers and handlers of this module would otherwise keep running after a hot reload
+    global active_progressive_run
+    if active_progressive_run:
+        active_progressive_run.close()
+        active_progressive_run = None
+    if bpy.app.timers.is_registered(_rerun_params_timer):
+        bpy.app.timers.unregister(_rerun_params_timer)
+    prefetcher.close()
+    param_sweep.close()
     for cls in reversed(classes):
         bpy.utils.unregister_class(cls)
     del bpy.types.Scene.blender_gpt_prompt
@@ -1,10 +1,18 @@
 import bpy
 import addon_utils
 import os
+import sys
+import importlib
+import struct
+import ctypes
+import ctypes.util
 import subprocess
 import shutil
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from bpy.types import Panel, Operator, PropertyGroup, AddonPreferences
-from bpy.props import StringProperty, IntProperty, PointerProperty
+from bpy.props import StringProperty, IntProperty, PointerProperty, BoolProperty
 
 bl_info = {
     "name": "addon_quick_access",
@@ -35,6 +43,411 @@ class ADDONQUICK_Properties(PropertyGroup):
         subtype='FILE_PATH'
     )
 
+# Reinstall engine: source trees are compared with the installed copy by content hash, only
+# changed files are copied (in parallel), and addon_utils rescans the add-on directories
+# once per batch instead of twice per add-on.
+SYNC_IGNORE = {"__pycache__", ".git", ".DS_Store"}
+SYNC_WORKERS = min(8, os.cpu_count() or 4)
+_digest_cache = {}  # path -> (mtime_ns, size, sha1) so unchanged files aren't re-read
+
+def file_digest(path):
+    stat = os.stat(path)
+    cached = _digest_cache.get(path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    _digest_cache[path] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+    return digest.hexdigest()
+
+def is_ignored(rel):
+    # Caches, VCS folders and editor swap/backup files
+    parts = rel.split(os.sep)
+    name = parts[-1]
+    return any(part in SYNC_IGNORE for part in parts) or name.endswith((".pyc", ".swp", ".swx", "~")) or name.startswith(".#")
+
+def tree_files(root):
+    """Relative path -> absolute path of the files under root, skipping caches and VCS folders."""
+    files = {}
+    for folder, dirs, names in os.walk(root):
+        dirs[:] = [d for d in dirs if d not in SYNC_IGNORE]
+        for name in names:
+            if is_ignored(name):
+                continue
+            path = os.path.join(folder, name)
+            files[os.path.relpath(path, root)] = path
+    return files
+
+def files_differ(source, target):
+    if not os.path.exists(target):
+        return True
+    if os.path.getsize(source) != os.path.getsize(target):
+        return True
+    return file_digest(source) != file_digest(target)
+
+def plan_addon_sync(addon_name, source_path, addons_dir):
+    """Work out what it takes to bring the installed copy of an add-on up to date.
+
+    Returns a dict with the (source, target) files to copy, the installed paths to remove
+    (stale files, or the other layout if the add-on switched between file and folder) and
+    the number of unchanged files."""
+    start = time.perf_counter()
+    addon_file = os.path.join(addons_dir, f"{addon_name}.py")
+    addon_dir = os.path.join(addons_dir, addon_name)
+    if os.path.isfile(source_path):
+        pairs = {f"{addon_name}.py": (source_path, addon_file)}
+        remove = [addon_dir] if os.path.isdir(addon_dir) else []
+    else:
+        pairs = {rel: (path, os.path.join(addon_dir, rel)) for rel, path in tree_files(source_path).items()}
+        remove = [addon_file] if os.path.isfile(addon_file) else []
+        if os.path.isdir(addon_dir):
+            remove += [path for rel, path in tree_files(addon_dir).items() if rel not in pairs]
+    copies = [(source, target) for source, target in pairs.values() if files_differ(source, target)]
+    return {
+        "name": addon_name,
+        "copies": copies,
+        "remove": remove,
+        "unchanged": len(pairs) - len(copies),
+        "hash_ms": (time.perf_counter() - start) * 1000.0,
+        "copy_ms": 0.0,
+        "enable_ms": 0.0,
+    }
+
+def copy_file(source, target):
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.copy2(source, target)
+    return (time.perf_counter() - start) * 1000.0
+
+def apply_addon_syncs(plans, executor):
+    """Remove stale paths and copy changed files of all plans, in parallel; returns {name: error}."""
+    errors = {}
+    futures = []
+    for plan in plans:
+        try:
+            for path in plan["remove"]:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+                print(f"Removed stale path: {path}")
+        except Exception as e:
+            errors[plan["name"]] = f"Error removing stale files: {str(e)}"
+            continue
+        futures += [(plan, executor.submit(copy_file, source, target)) for source, target in plan["copies"]]
+    for plan, future in futures:
+        try:
+            plan["copy_ms"] += future.result()
+        except Exception as e:
+            errors.setdefault(plan["name"], f"Error copying files: {str(e)}")
+    return errors
+
+def plan_addon_syncs(addons, addons_dir, executor):
+    """Plan the sync of each (name, source path) in parallel."""
+    return list(executor.map(lambda addon: plan_addon_sync(addon[0], addon[1], addons_dir), addons))
+
+def describe_sync(plan):
+    return (f"{plan['name']}: {len(plan['copies'])} copied, {plan['unchanged']} unchanged, {len(plan['remove'])} removed "
+            f"(hash {plan['hash_ms']:.0f} ms, copy {plan['copy_ms']:.0f} ms, enable {plan['enable_ms']:.0f} ms)")
+
+# Hot reload: instead of restarting Blender, the add-on's module is unregistered, reloaded
+# with importlib and registered again in the running session. Data stored through its
+# properties (scene props, chat history) lives on as ID properties while the classes are
+# gone and is picked up again on register; its preferences stay because the add-on is
+# never disabled. If the new code fails to import or register, there's no previous version
+# to fall back to (a failed reload has already overwritten part of the old module), so the
+# add-on is left unregistered and reported as broken until a reload succeeds.
+broken_addons = set()  # Add-ons left unregistered by a failed hot reload
+
+def hot_reload_addon(addon_name):
+    """Reload a loaded add-on in place (enable it if it isn't loaded); returns the time taken in ms."""
+    start = time.perf_counter()
+    module = sys.modules.get(addon_name)
+    if module is None or addon_name not in bpy.context.preferences.addons:
+        addon_utils.enable(addon_name, default_set=True)
+        return (time.perf_counter() - start) * 1000.0
+    if addon_name not in broken_addons:
+        module.unregister()
+    broken_addons.add(addon_name)
+    try:
+        # Submodules first, deepest first, so the package re-imports their new code
+        submodules = sorted((name for name in sys.modules if name.startswith(addon_name + ".")), key=lambda name: name.count("."), reverse=True)
+        for name in submodules:
+            importlib.reload(sys.modules[name])
+        module = importlib.reload(module)
+        module.register()
+    except Exception as e:
+        try:
+            module.unregister()  # Whatever register() managed before failing
+        except Exception:
+            pass
+        raise RuntimeError(f"{addon_name} is broken and stays unregistered until it reloads cleanly: {str(e)}") from e
+    broken_addons.discard(addon_name)
+    return (time.perf_counter() - start) * 1000.0
+
+def sync_and_reload(addons):
+    """Copy changed files of each (name, source path) and hot-reload the add-ons; returns log lines."""
+    addons_dir = bpy.utils.user_resource('SCRIPTS', path="addons")
+    with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as executor:
+        plans = plan_addon_syncs(addons, addons_dir, executor)
+        errors = apply_addon_syncs([plan for plan in plans if plan["copies"] or plan["remove"]], executor)
+    lines = []
+    for plan in plans:
+        if plan["name"] in errors:
+            lines.append(f"{plan['name']}: {errors[plan['name']]}")
+            continue
+        try:
+            plan["enable_ms"] = hot_reload_addon(plan["name"])
+            lines.append(f"Hot-reloaded {plan['name']} in {plan['enable_ms']:.0f} ms ({len(plan['copies'])} file(s) updated)")
+        except Exception as e:
+            lines.append(f"Error reloading {plan['name']}: {str(e)}")
+        print(describe_sync(plan))
+    return lines
+
+# Auto-sync: a watcher reports which files changed under each selected source path
+# (inotify on Linux, polling elsewhere). A burst of events, such as an editor saving
+# several files, is collected until things are quiet for a moment. Then only those files
+# are synced and the add-on is hot-reloaded, without walking the tree or rescanning the
+# add-on directories.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length
+SYNC_DEBOUNCE = 0.3  # Seconds without new events before a sync
+
+class InotifyWatcher:
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}  # Watch descriptor -> [(add-on name, source path, watched folder)]
+
+    def add(self, name, source_path):
+        if os.path.isfile(source_path):
+            # Editors often save by replacing the file, so watch its folder instead
+            self._watch(name, source_path, os.path.dirname(source_path))
+        else:
+            self._watch_tree(name, source_path, source_path)
+
+    def _watch_tree(self, name, source_path, root):
+        # inotify isn't recursive: one watch per folder
+        for folder, dirs, _ in os.walk(root):
+            dirs[:] = [d for d in dirs if d not in SYNC_IGNORE]
+            self._watch(name, source_path, folder)
+
+    def _watch(self, name, source_path, folder):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {folder}")
+        # Watching a folder twice returns the same descriptor, e.g. for two single-file add-ons side by side
+        entries = self.watches.setdefault(wd, [])
+        if (name, source_path, folder) not in entries:
+            entries.append((name, source_path, folder))
+
+    def poll(self):
+        """Return the (add-on name, relative path) pairs changed since the last poll; a path of None means "anything"."""
+        changes = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+                raw = data[offset + _INOTIFY_EVENT.size:offset + _INOTIFY_EVENT.size + length].rstrip(b"\0")
+                offset += _INOTIFY_EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changes |= {(name, None) for entries in self.watches.values() for name, _, _ in entries}
+                    continue
+                if wd not in self.watches:
+                    continue
+                if mask & IN_IGNORED:
+                    del self.watches[wd]  # Folder was removed
+                    continue
+                for name, source_path, folder in list(self.watches[wd]):
+                    path = os.path.join(folder, os.fsdecode(raw))
+                    if os.path.isfile(source_path):
+                        if path == source_path:
+                            changes.add((name, os.path.basename(source_path)))
+                        continue
+                    if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and os.path.isdir(path):
+                        # Watch the new folder, and pick up files that landed before the watch did
+                        self._watch_tree(name, source_path, path)
+                        changes |= {(name, os.path.relpath(file, source_path)) for file in tree_files(path).values()}
+                    changes.add((name, os.path.relpath(path, source_path)))
+        return changes
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    interval = 1.0
+
+    def __init__(self):
+        self.sources = {}
+        self.snapshots = {}
+        self.next_scan = 0.0
+
+    def _scan(self, source_path):
+        files = {os.path.basename(source_path): source_path} if os.path.isfile(source_path) else tree_files(source_path)
+        snapshot = {}
+        for rel, path in files.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue  # Removed while scanning
+            snapshot[rel] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def add(self, name, source_path):
+        self.sources[name] = source_path
+        self.snapshots[name] = self._scan(source_path)
+
+    def poll(self):
+        now = time.monotonic()
+        if now < self.next_scan:
+            return set()
+        self.next_scan = now + self.interval
+        changes = set()
+        for name, source_path in self.sources.items():
+            old, new = self.snapshots[name], self._scan(source_path)
+            changes |= {(name, rel) for rel in old.keys() | new.keys() if old.get(rel) != new.get(rel)}
+            self.snapshots[name] = new
+        return changes
+
+    def close(self):
+        pass
+
+def plan_changed_files(addon_name, source_path, relpaths, addons_dir):
+    """Like plan_addon_sync, but only for the given paths relative to the source."""
+    start = time.perf_counter()
+    copies, remove, unchanged = [], [], 0
+    for rel in sorted(relpaths):
+        if is_ignored(rel):
+            continue
+        if os.path.isfile(source_path):
+            source, target = source_path, os.path.join(addons_dir, f"{addon_name}.py")
+        else:
+            source, target = os.path.join(source_path, rel), os.path.join(addons_dir, addon_name, rel)
+        if os.path.isfile(source):
+            if files_differ(source, target):
+                copies.append((source, target))
+            else:
+                unchanged += 1
+        elif not os.path.exists(source) and os.path.lexists(target):
+            remove.append(target)
+    return {
+        "name": addon_name,
+        "copies": copies,
+        "remove": remove,
+        "unchanged": unchanged,
+        "hash_ms": (time.perf_counter() - start) * 1000.0,
+        "copy_ms": 0.0,
+        "enable_ms": 0.0,
+    }
+
+class AutoSync:
+    def __init__(self):
+        self.watcher = None
+        self.sources = ()
+        self.pending = {}  # Add-on name -> changed relative paths
+        self.last_event = 0.0
+
+    def configure(self, sources):
+        """(Re)build the watcher when the watched (name, source path) pairs change."""
+        sources = tuple(sources)
+        if self.watcher is not None and sources == self.sources:
+            return
+        self.close()
+        self.sources = sources
+        watcher = None
+        if sys.platform.startswith("linux"):
+            try:
+                watcher = InotifyWatcher()
+                for name, source_path in sources:
+                    watcher.add(name, source_path)
+            except (OSError, AttributeError) as e:
+                print(f"inotify unavailable ({str(e)}), polling source paths instead")
+                if watcher is not None:
+                    watcher.close()
+                watcher = None
+        if watcher is None:
+            watcher = PollingWatcher()
+            for name, source_path in sources:
+                watcher.add(name, source_path)
+        self.watcher = watcher
+        print(f"Watching {len(sources)} source path(s) with {type(watcher).__name__}")
+
+    def tick(self):
+        now = time.monotonic()
+        for name, rel in self.watcher.poll():
+            self.pending.setdefault(name, set()).add(rel)
+            self.last_event = now
+        if self.pending and now - self.last_event >= SYNC_DEBOUNCE:
+            self.flush()
+
+    def flush(self):
+        pending, self.pending = self.pending, {}
+        sources = dict(self.sources)
+        addons_dir = bpy.utils.user_resource('SCRIPTS', path="addons")
+        for name, relpaths in pending.items():
+            if name not in sources:
+                continue
+            if None in relpaths:
+                plan = plan_addon_sync(name, sources[name], addons_dir)  # Events were lost
+            else:
+                plan = plan_changed_files(name, sources[name], relpaths, addons_dir)
+            if not (plan["copies"] or plan["remove"]):
+                continue
+            with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as executor:
+                errors = apply_addon_syncs([plan], executor)
+            if errors:
+                print(f"{name}: {errors[name]}")
+                continue
+            try:
+                plan["enable_ms"] = hot_reload_addon(name)
+                print(f"Auto-synced and hot-reloaded {name} in {plan['enable_ms']:.0f} ms")
+            except Exception as e:
+                print(f"Error reloading {name}: {str(e)}")
+            print(describe_sync(plan))
+
+    def close(self):
+        if self.watcher is not None:
+            self.watcher.close()
+        self.watcher = None
+        self.sources = ()
+        self.pending = {}
+
+auto_sync = AutoSync()
+
+def watch_sources():
+    # Timer: feed watcher events into the auto-sync
+    preferences = bpy.context.preferences.addons["addon_quick_access"].preferences
+    if not preferences.watch_sources:
+        auto_sync.close()
+        return None
+    auto_sync.configure([(item.name, item.source_path) for item in preferences.selected_addons
+                         if item.name != "addon_quick_access" and item.source_path and os.path.exists(item.source_path)])
+    auto_sync.tick()
+    return 0.2
+
+def update_watch_sources(self, context):
+    if self.watch_sources and not bpy.app.timers.is_registered(watch_sources):
+        bpy.app.timers.register(watch_sources, first_interval=0.0, persistent=True)
+
 # Operator to refresh the addons list
 class ADDONQUICK_OT_RefreshAddons(Operator):
     bl_idname = "addonquick.refresh_addons"
@@ -150,95 +563,92 @@ class ADDONQUICK_OT_ManageSelectedAddons(Operator):
             return {'CANCELLED'}
 
         addons_dir = bpy.utils.user_resource('SCRIPTS', path="addons")
+        batch_start = time.perf_counter()
 
+        # Step 1: Validate source paths
+        valid_addons = []
         for addon_name, source_path in selected_addons:
-            print(f"Starting reinstall process for add-on: {addon_name}")
-
-            # Step 1: Validate source path
             if not source_path or not os.path.exists(source_path):
                 self.report({'ERROR'}, f"Source path for {addon_name} not set or invalid: {source_path}")
                 print(f"Source path for {addon_name} not set or invalid: {source_path}")
                 continue
-
-            # Step 2: Disable the addon
-            try:
-                if addon_name in [mod.__name__ for mod in addon_utils.modules(refresh=False)]:
-                    addon_utils.disable(addon_name, default_set=True)
-                    print(f"Disabled add-on: {addon_name}")
-                else:
-                    print(f"Add-on {addon_name} not found in loaded modules, proceeding to file removal.")
-            except Exception as e:
-                self.report({'ERROR'}, f"Error disabling {addon_name}: {str(e)}")
-                print(f"Error disabling {addon_name}: {str(e)}")
-                continue
-
-            # Step 3: Locate and remove the addon file
-            addon_file = os.path.join(addons_dir, f"{addon_name}.py")
-            addon_dir = os.path.join(addons_dir, addon_name)
-
-            if os.path.isfile(addon_file):
-                print(f"Found single-file add-on at: {addon_file}")
-                try:
-                    os.remove(addon_file)
-                    print(f"Removed add-on file: {addon_file}")
-                except Exception as e:
-                    self.report({'ERROR'}, f"Error removing {addon_name} file: {str(e)}")
-                    print(f"Error removing {addon_name} file: {str(e)}")
-                    continue
-            elif os.path.isdir(addon_dir):
-                print(f"Found directory-based add-on at: {addon_dir}")
-                try:
-                    shutil.rmtree(addon_dir)
-                    print(f"Removed add-on directory: {addon_dir}")
-                except Exception as e:
-                    self.report({'ERROR'}, f"Error removing {addon_name} directory: {str(e)}")
-                    print(f"Error removing {addon_name} directory: {str(e)}")
-                    continue
-            else:
-                self.report({'ERROR'}, f"Add-on {addon_name} not found in addons directory")
-                print(f"Add-on {addon_name} not found in addons directory: {addons_dir}")
-                continue
-
-            # Step 4: Refresh addon list to ensure it's unregistered
-            addon_utils.modules(refresh=True)
-            print("Refreshed addon list after removal.")
-
-            # Step 5: Reinstall the addon from its source path
-            print(f"Reinstalling add-on {addon_name} from source: {source_path}")
-            if os.path.isfile(source_path):
-                target_path = os.path.join(addons_dir, f"{addon_name}.py")
-                try:
-                    shutil.copy2(source_path, target_path)
-                    print(f"Reinstalled add-on file from {source_path} to {target_path}")
-                except Exception as e:
-                    self.report({'ERROR'}, f"Error reinstalling {addon_name} file: {str(e)}")
-                    print(f"Error reinstalling {addon_name} file: {str(e)}")
-                    continue
-            else:
-                target_path = os.path.join(addons_dir, addon_name)
+            valid_addons.append((addon_name, source_path))
+
+        with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as executor:
+            # Step 2: Hash source and installed files to find what changed
+            plans = plan_addon_syncs(valid_addons, addons_dir, executor)
+            changed = [plan for plan in plans if plan["copies"] or plan["remove"]]
+            up_to_date = len(plans) - len(changed)
+            # Up-to-date add-ons that are disabled still get enabled, as a full reinstall would
+            inactive = [plan for plan in plans if plan not in changed and plan["name"] not in context.preferences.addons]
+            for plan in plans:
+                if plan in inactive:
+                    print(f"Add-on {plan['name']} is up to date ({plan['unchanged']} files) but not enabled.")
+                elif plan not in changed:
+                    print(f"Add-on {plan['name']} is up to date ({plan['unchanged']} files), skipping.")
+
+            # Step 3: Disable the add-ons that changed
+            loaded = {mod.__name__ for mod in addon_utils.modules(refresh=False)}
+            for plan in list(changed):
                 try:
-                    if os.path.exists(target_path):
-                        shutil.rmtree(target_path)
-                    shutil.copytree(source_path, target_path)
-                    print(f"Reinstalled add-on directory from {source_path} to {target_path}")
+                    if plan["name"] in loaded:
+                        addon_utils.disable(plan["name"], default_set=True)
+                        print(f"Disabled add-on: {plan['name']}")
                 except Exception as e:
-                    self.report({'ERROR'}, f"Error reinstalling {addon_name} directory: {str(e)}")
-                    print(f"Error reinstalling {addon_name} directory: {str(e)}")
-                    continue
-
-            # Step 6: Refresh addon list again
+                    self.report({'ERROR'}, f"Error disabling {plan['name']}: {str(e)}")
+                    print(f"Error disabling {plan['name']}: {str(e)}")
+                    changed.remove(plan)
+
+            # Step 4: Copy the changed files of every add-on in parallel
+            errors = apply_addon_syncs(changed, executor)
+        for name, error in errors.items():
+            self.report({'ERROR'}, f"{name}: {error}")
+            print(f"{name}: {error}")
+
+        # Step 5: One rescan of the add-on directories for the whole batch
+        if changed:
             addon_utils.modules(refresh=True)
             print("Refreshed addon list after reinstall.")
 
-            # Step 7: Activate the addon
+        # Step 6: Activate the add-ons again
+        for plan in changed + inactive:
+            if plan["name"] in errors:
+                continue
+            enable_start = time.perf_counter()
             try:
-                addon_utils.enable(addon_name, default_set=True)
-                self.report({'INFO'}, f"Successfully reinstalled and activated add-on: {addon_name}")
-                print(f"Successfully reinstalled and activated add-on: {addon_name}")
+                addon_utils.enable(plan["name"], default_set=True)
+                print(f"Successfully {'reinstalled and ' if plan in changed else ''}activated add-on: {plan['name']}")
             except Exception as e:
-                self.report({'ERROR'}, f"Error activating {addon_name}: {str(e)}")
-                print(f"Error activating {addon_name}: {str(e)}")
+                self.report({'ERROR'}, f"Error activating {plan['name']}: {str(e)}")
+                print(f"Error activating {plan['name']}: {str(e)}")
+            plan["enable_ms"] = (time.perf_counter() - enable_start) * 1000.0
+
+        for plan in plans:
+            print(describe_sync(plan))
+        total_ms = (time.perf_counter() - batch_start) * 1000.0
+        self.report({'INFO'}, f"Reinstalled {len(changed) - len(errors)} add-on(s), {up_to_date} up to date of which {len(inactive)} enabled ({total_ms:.0f} ms)")
+        print(f"Reinstall finished in {total_ms:.0f} ms")
+        return {'FINISHED'}
 
+# Operator to hot-reload selected addons without restarting Blender
+class ADDONQUICK_OT_HotReloadAddons(Operator):
+    bl_idname = "addonquick.hot_reload_addons"
+    bl_label = "Hot Reload"
+    bl_description = "Copy changed files of the selected add-ons and reload them in place, keeping their data"
+
+    def execute(self, context):
+        preferences = context.preferences.addons["addon_quick_access"].preferences
+        selected_addons = [(item.name, item.source_path) for item in preferences.selected_addons
+                           if item.name != "addon_quick_access" and item.source_path and os.path.exists(item.source_path)]
+        if not selected_addons:
+            self.report({'WARNING'}, "No selected add-ons with a valid source path")
+            print("No selected add-ons with a valid source path.")
+            return {'CANCELLED'}
+        lines = sync_and_reload(selected_addons)
+        for line in lines:
+            print(line)
+        failed = [line for line in lines if not line.startswith("Hot-reloaded")]
+        self.report({'ERROR'} if failed else {'INFO'}, "; ".join(failed or lines))
         return {'FINISHED'}
 
 # Operator to move addon from available to selected
@@ -319,7 +729,10 @@ class ADDONQUICK_PT_AddonPanel(Panel):
                 row.label(text=addon_name, icon='PLUGIN')
 
         # Single reinstall button
-        box.operator("addonquick.manage_selected_addons", text="Reinstall")
+        row = box.row(align=True)
+        row.operator("addonquick.manage_selected_addons", text="Reinstall")
+        row.operator("addonquick.hot_reload_addons", text="Hot Reload", icon='FILE_REFRESH')
+        box.prop(preferences, "watch_sources", text="Auto-Sync on Save")
 
 # Addon preferences with dual-list UI and source path editing
 class ADDONQUICK_AP_AddonPreferences(AddonPreferences):
@@ -339,6 +752,12 @@ class ADDONQUICK_AP_AddonPreferences(AddonPreferences):
     selected_addons: bpy.props.CollectionProperty(type=ADDONQUICK_AddonItem)
     available_addon_index: IntProperty()
     selected_addon_index: IntProperty()
+    watch_sources: BoolProperty(
+        name="Auto-Sync on Save",
+        description="Watch the source paths of the selected add-ons, copy files as they change and hot-reload the add-on",
+        default=False,
+        update=update_watch_sources
+    )
 
     def draw(self, context):
         layout = self.layout
@@ -378,6 +797,7 @@ classes = (
     ADDONQUICK_OT_InstallAddon,
     ADDONQUICK_OT_RunBashScript,
     ADDONQUICK_OT_ManageSelectedAddons,
+    ADDONQUICK_OT_HotReloadAddons,
     ADDONQUICK_OT_AddAddon,
     ADDONQUICK_OT_RemoveAddon,
     ADDONQUICK_PT_AddonPanel,
@@ -391,6 +811,8 @@ def register():
 
     # Populate available addons on registration
     preferences = bpy.context.preferences.addons["addon_quick_access"].preferences
+    if preferences.watch_sources:
+        update_watch_sources(preferences, bpy.context)
     preferences.available_addons.clear()
     preferences.selected_addons.clear()
     for mod in addon_utils.modules(refresh=True):
@@ -402,6 +824,9 @@ def register():
             print(f"Added add-on to available list: {addon_name}")
 
 def unregister():
+    if bpy.app.timers.is_registered(watch_sources):
+        bpy.app.timers.unregister(watch_sources)
+    auto_sync.close()
     del bpy.types.WindowManager.addonquick_props
     for cls in reversed(classes):
         bpy.utils.unregister_class(cls)